@@ -0,0 +1,129 @@
+"""
+Overload: what clients see when far more requests arrive than the upstream
+can serve, with and without admission control.
+
+    python -m benchmarks.bench_admission --clients 400 --upstream-latency-ms 500
+
+Every mode is a fresh interpreter (limits are read at import) that fires
+--clients concurrent /spotify/top-tracks requests for distinct users at the
+app, against benchmarks.fake_spotify. "off" disables admission control and
+deadlines; "on" uses the configured limits. Reports status counts, how long
+successful and refused requests took, and the peak number of requests in
+flight inside the app. Refusals should come back fast with Retry-After
+instead of every client waiting behind the slowest upstream call.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+
+def _ms(timings: list[float], q: float) -> float | None:
+    if not timings:
+        return None
+    timings = sorted(timings)
+    return round(timings[min(len(timings) - 1, int(q * len(timings)))] * 1000, 1)
+
+
+def _child(admission: bool, clients: int, latency_ms: float) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-admission-")
+    for name in ("HISTORY_DB_PATH", "SHARE_DB_PATH", "SIMILARITY_DB_PATH", "ARTIST_DB_PATH"):
+        os.environ[name] = os.path.join(tmp, f"{name.lower()}.sqlite3")
+    os.environ["PREFETCH_ENABLED"] = "0"
+    os.environ["WARMUP_ENABLED"] = "0"
+    if not admission:
+        os.environ["ADMISSION_ENABLED"] = "0"
+        os.environ["REQUEST_DEADLINE"] = "0"
+
+    from benchmarks.fake_spotify import FakeSpotify
+
+    fake = FakeSpotify(latency_ms=latency_ms)
+    base_url = fake.start()
+
+    import httpx
+    import main
+    from services import spotify_client
+
+    spotify_client.SPOTIFY_API_BASE = base_url
+
+    in_flight = peak = 0
+
+    async def counting(scope, receive, send):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await main.app(scope, receive, send)
+        finally:
+            in_flight -= 1
+
+    async def one(client: httpx.AsyncClient, i: int) -> tuple[int, float, str | None]:
+        start = time.perf_counter()
+        response = await client.get("/spotify/top-tracks", headers={"Authorization": f"Bearer flood-{i}"})
+        return response.status_code, time.perf_counter() - start, response.headers.get("retry-after")
+
+    async def measure() -> dict:
+        transport = httpx.ASGITransport(app=counting)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=300) as client:
+                start = time.perf_counter()
+                results = await asyncio.gather(*(one(client, i) for i in range(clients)))
+                wall = time.perf_counter() - start
+        ok = [t for status, t, _ in results if status == 200]
+        refused = [t for status, t, _ in results if status == 503]
+        return {
+            "wall_s": round(wall, 2),
+            "statuses": dict(Counter(status for status, _, _ in results)),
+            "ok_p50_ms": _ms(ok, 0.5),
+            "ok_p99_ms": _ms(ok, 0.99),
+            "refused_p50_ms": _ms(refused, 0.5),
+            "refused_p99_ms": _ms(refused, 0.99),
+            "retry_after": sorted({r for status, _, r in results if status == 503 and r}),
+            "peak_in_flight": peak,
+        }
+
+    try:
+        return asyncio.run(measure())
+    finally:
+        fake.stop()
+
+
+def run(clients: int, latency_ms: float, trials: int) -> dict:
+    results = {}
+    for mode in ("off", "on"):
+        runs = []
+        for _ in range(trials):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_admission", "--child", mode,
+                 "--clients", str(clients), "--upstream-latency-ms", str(latency_ms)],
+                check=True, capture_output=True, text=True,
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results[mode] = runs[-1]
+        results[mode]["wall_s"] = statistics.median(r["wall_s"] for r in runs)
+    return {"clients": clients, "upstream_latency_ms": latency_ms, "trials": trials, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=400)
+    parser.add_argument("--trials", type=int, default=1)
+    parser.add_argument("--upstream-latency-ms", type=float, default=500.0)
+    parser.add_argument("--child", choices=("off", "on"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_child(args.child == "on", args.clients, args.upstream_latency_ms)))
+        return
+    print(json.dumps(run(args.clients, args.upstream_latency_ms, args.trials), indent=2))
+
+
+if __name__ == "__main__":
+    main()
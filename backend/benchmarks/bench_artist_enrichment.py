@@ -0,0 +1,107 @@
+"""
+Genre coverage and upstream cost of artist enrichment.
+
+    python -m benchmarks.bench_artist_enrichment --users 64 --concurrency 16
+
+Loads /spotify/data-pipeline for --users distinct users against
+benchmarks.fake_spotify, whose tracks also credit guest artists that are in
+nobody's top artists. Three runs:
+
+- restricted: /v1/artists answers 403, so tracks only get genres from the
+  user's own top artists (the behaviour before the artist store)
+- cold: batch lookups allowed, store empty
+- warm: other users, store already filled by the cold run
+
+and reports genres per track, the share of tracks with any genre, and how
+many /v1/artists calls were made per request.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+import httpx
+
+from benchmarks.fake_spotify import FakeSpotify
+
+
+async def _load(app, users: int, concurrency: int, label: str) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    tracks: list[dict] = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        async def one(i: int) -> None:
+            async with semaphore:
+                response = await client.get(
+                    "/spotify/data-pipeline", headers={"Authorization": f"Bearer {label}-{i}"}
+                )
+                response.raise_for_status()
+                tracks.extend(response.json()["tracks"])
+
+        await asyncio.gather(*(one(i) for i in range(users)))
+
+    return {
+        "genres_per_track": round(sum(len(t["genres"]) for t in tracks) / max(len(tracks), 1), 2),
+        "tracks_with_genres": round(sum(1 for t in tracks if t["genres"]) / max(len(tracks), 1), 3),
+    }
+
+
+def run(users: int, concurrency: int, featured: int, latency_ms: float) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-artists-")
+    for name in ("HISTORY_DB_PATH", "SHARE_DB_PATH", "SIMILARITY_DB_PATH"):
+        os.environ[name] = os.path.join(tmp, f"{name.lower()}.sqlite3")
+    os.environ["PREFETCH_ENABLED"] = "0"
+
+    import main
+    from services import artist_store, spotify_client
+    from services import concurrency as background
+
+    results = {}
+    for label, status, fresh_store in (("restricted", 403, True), ("cold", 200, True), ("warm", 200, False)):
+        fake = FakeSpotify(latency_ms=latency_ms, n_featured=featured, artists_status=status)
+        spotify_client.SPOTIFY_API_BASE = fake.start()
+        if fresh_store:
+            artist_store.ARTIST_DB_PATH = os.path.join(tmp, f"artists-{label}.sqlite3")
+            artist_store._store = None
+            artist_store._restricted_until = 0.0
+        before = artist_store.stats()
+
+        async def measure() -> dict:
+            try:
+                return await _load(main.app, users, concurrency, label)
+            finally:
+                await background.drain()  # store writes, so "known" is final
+                await spotify_client.close_client()
+
+        try:
+            coverage = asyncio.run(measure())
+        finally:
+            fake.stop()
+        after = artist_store.stats()
+        calls = after["batches"] - before["batches"]
+        results[label] = {
+            **coverage,
+            "artist_calls": calls,
+            "artist_calls_per_request": round(calls / users, 3),
+            "artists_known": after["known"],
+        }
+
+    return {"users": users, "concurrency": concurrency, "featured_artists": featured, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--featured", type=int, default=300, help="guest artists shared across users")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.concurrency, args.featured, args.upstream_latency_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Throughput of ml_batch.build_profiles_batch vs. looping build_profile.
+
+    python -m benchmarks.bench_batch_profiles --users 10000 100000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from benchmarks.synthetic import make_users
+from services import ml_batch, ml_engine
+
+
+def _check(users: list[dict], batch: list[dict]) -> None:
+    for user, profile in zip(users, batch):
+        expected = ml_engine.build_profile(user["tracks"], user["top_artists"])
+        expected["taste_map"] = []
+        if expected != profile:
+            raise AssertionError(f"batch profile differs from build_profile:\n{expected}\n{profile}")
+
+
+def run(n_users: int, check: int, loop_sample: int) -> dict:
+    users = make_users(n_users)
+
+    start = time.perf_counter()
+    batch = ml_batch.build_profiles_batch(users, include_taste_map=False)
+    batch_s = time.perf_counter() - start
+
+    _check(users[:check], batch[:check])
+
+    # The per-user loop (taste_map excluded on both sides) is timed on a
+    # sample and extrapolated.
+    sample = users[:loop_sample]
+    start = time.perf_counter()
+    taste_map, ml_engine.taste_map = ml_engine.taste_map, lambda top_artists: []
+    try:
+        for user in sample:
+            ml_engine.build_profile(user["tracks"], user["top_artists"])
+    finally:
+        ml_engine.taste_map = taste_map
+    loop_s = (time.perf_counter() - start) / len(sample) * n_users
+
+    return {
+        "users": n_users,
+        "batch_seconds": round(batch_s, 3),
+        "batch_users_per_second": round(n_users / batch_s),
+        "loop_seconds_estimated": round(loop_s, 3),
+        "speedup": round(loop_s / batch_s, 2),
+        "checked_against_build_profile": min(check, n_users),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--check", type=int, default=500, help="users compared field-by-field with build_profile")
+    parser.add_argument("--loop-sample", type=int, default=2_000)
+    args = parser.parse_args()
+
+    for n in args.users:
+        print(json.dumps(run(n, args.check, args.loop_sample)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold start: latency of a new worker's first requests, with and without the
+startup warm-up.
+
+    python -m benchmarks.bench_cold_start --trials 3
+
+Every trial is a fresh interpreter that imports the app, runs its lifespan
+against benchmarks.fake_spotify and immediately times its first few
+/ml/profile requests (distinct users, so none is a cache hit). With
+warm-up, requests start once /health reports ready, as a load balancer
+would. Reports import time, warm-up time and the first/steady request
+latency for each mode.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _child(warm: bool, latency_ms: float, requests: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-cold-")
+    for name in ("HISTORY_DB_PATH", "SHARE_DB_PATH", "SIMILARITY_DB_PATH", "ARTIST_DB_PATH"):
+        os.environ[name] = os.path.join(tmp, f"{name.lower()}.sqlite3")
+    os.environ["PREFETCH_ENABLED"] = "0"
+    os.environ["WARMUP_ENABLED"] = "1" if warm else "0"
+
+    from benchmarks.fake_spotify import FakeSpotify
+
+    fake = FakeSpotify(latency_ms=latency_ms)
+    base_url = fake.start()
+
+    start = time.perf_counter()
+    import httpx
+    import main
+    from services import spotify_client, warmup
+    import_s = time.perf_counter() - start
+    spotify_client.SPOTIFY_API_BASE = base_url
+
+    async def measure() -> dict:
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+                start = time.perf_counter()
+                while (await client.get("/health")).status_code != 200:
+                    await asyncio.sleep(0.01)
+                ready_s = time.perf_counter() - start
+
+                timings = []
+                for i in range(requests):
+                    start = time.perf_counter()
+                    response = await client.get("/ml/profile", headers={"Authorization": f"Bearer cold-{i}"})
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - start)
+        return {
+            "import_ms": round(import_s * 1000, 1),
+            "ready_ms": round(ready_s * 1000, 1),
+            "first_ms": round(timings[0] * 1000, 1),
+            "steady_ms": round(statistics.median(timings[1:]) * 1000, 1),
+            "warmup": warmup.report() if warm else None,
+        }
+
+    try:
+        return asyncio.run(measure())
+    finally:
+        fake.stop()
+
+
+def run(trials: int, latency_ms: float, requests: int) -> dict:
+    results = {}
+    for mode in ("cold", "warm"):
+        runs = []
+        for _ in range(trials):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", mode,
+                 "--upstream-latency-ms", str(latency_ms), "--requests", str(requests)],
+                check=True, capture_output=True, text=True,
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results[mode] = {
+            key: statistics.median(r[key] for r in runs)
+            for key in ("import_ms", "ready_ms", "first_ms", "steady_ms")
+        }
+        if mode == "warm":
+            results[mode]["last_report"] = runs[-1]["warmup"]
+    return {"trials": trials, "upstream_latency_ms": latency_ms, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    parser.add_argument("--child", choices=("cold", "warm"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_child(args.child == "warm", args.upstream_latency_ms, args.requests)))
+        return
+    print(json.dumps(run(args.trials, args.upstream_latency_ms, args.requests), indent=2))
+
+
+if __name__ == "__main__":
+    main()
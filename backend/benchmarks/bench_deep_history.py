@@ -0,0 +1,99 @@
+"""
+Deep profiles: latency and peak memory against library size.
+
+    python -m benchmarks.bench_deep_history --saved 0 500 2000 5000
+
+For each --saved library size, starts benchmarks.fake_spotify with that many
+saved tracks per user and times /ml/profile (one page of top items) and
+/ml/profile?deep=true for fresh users, then repeats the deep request under
+tracemalloc to report the app's peak allocated memory. Pages are folded as
+they arrive, so the peak should stay flat as the library grows while
+latency grows by one upstream round trip per DEEP_PAGE_CONCURRENCY pages.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.fake_spotify import FakeSpotify
+
+
+async def _time(client: httpx.AsyncClient, path: str, label: str, repeat: int) -> list[float]:
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path, headers={"Authorization": f"Bearer {label}-{i}"})
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(saved_sizes: list[int], repeat: int, latency_ms: float) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-deep-")
+    for name in ("HISTORY_DB_PATH", "SHARE_DB_PATH", "SIMILARITY_DB_PATH", "ARTIST_DB_PATH"):
+        os.environ[name] = os.path.join(tmp, f"{name.lower()}.sqlite3")
+    os.environ["PREFETCH_ENABLED"] = "0"
+
+    import main
+    from services import deep_history, spotify_client
+
+    results = []
+    for n_saved in saved_sizes:
+        fake = FakeSpotify(latency_ms=latency_ms, n_tracks=99, n_artists=99, n_saved=n_saved)
+        spotify_client.SPOTIFY_API_BASE = fake.start()
+
+        async def measure() -> dict:
+            transport = httpx.ASGITransport(app=main.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+                    single = await _time(client, "/ml/profile", f"single-{n_saved}", repeat)
+                    deep = await _time(client, "/ml/profile?deep=true", f"deep-{n_saved}", repeat)
+                    tracemalloc.start()
+                    await _time(client, "/ml/profile?deep=true", f"traced-{n_saved}", 1)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    sources = (await client.get(
+                        "/ml/profile?deep=true", headers={"Authorization": f"Bearer deep-{n_saved}-0"}
+                    )).json()["sources"]
+            finally:
+                await spotify_client.close_client()
+            return {
+                "saved_tracks": n_saved,
+                "pages": -(-n_saved // deep_history.PAGE_SIZE) + 5,
+                "distinct_tracks": sources["tracks"],
+                "single_page_ms": round(statistics.median(single) * 1000, 1),
+                "deep_ms": round(statistics.median(deep) * 1000, 1),
+                "deep_peak_kib": round(peak / 1024),
+            }
+
+        try:
+            results.append(asyncio.run(measure()))
+        finally:
+            fake.stop()
+
+    return {
+        "upstream_latency_ms": latency_ms,
+        "page_concurrency": deep_history.DEEP_PAGE_CONCURRENCY,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--saved", type=int, nargs="+", default=[0, 500, 2000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.saved, args.repeat, args.upstream_latency_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
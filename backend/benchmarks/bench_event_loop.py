@@ -0,0 +1,118 @@
+"""
+Event-loop responsiveness while ML profiles are being computed.
+
+    python -m benchmarks.bench_event_loop --workers 4 --duration 10
+
+Drives /ml/profile with --concurrency uncached users (heavy "extreme"
+payloads against benchmarks.fake_spotify) and, at the same time, probes
+/health and a cached /spotify/profile every few milliseconds. Runs once
+with ML on the event loop (ML_POOL_WORKERS=0) and once with the process
+pool, and reports probe latency percentiles and profile throughput for each.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_spotify import FakeSpotify
+
+
+def _percentiles(latencies: list[float]) -> dict[str, float]:
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "max_ms": round(float(lat.max()), 2),
+    }
+
+
+async def _measure(app, duration: float, concurrency: int, probe_interval: float, label: str) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    probes: dict[str, list[float]] = {"/health": [], "/spotify/profile": []}
+    profiles = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        probe_headers = {"Authorization": f"Bearer probe-{label}"}
+        await client.get("/spotify/profile", headers=probe_headers)  # cache /me for the probe user
+
+        async def load(worker: int) -> None:
+            nonlocal profiles, errors
+            i = 0
+            while time.perf_counter() < deadline:
+                headers = {"Authorization": f"Bearer {label}-{worker}-{i}"}
+                response = await client.get("/ml/profile", headers=headers)
+                if response.status_code == 200:
+                    profiles += 1
+                else:
+                    errors += 1
+                i += 1
+
+        async def probe() -> None:
+            while time.perf_counter() < deadline:
+                for path, latencies in probes.items():
+                    start = time.perf_counter()
+                    await client.get(path, headers=probe_headers)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(probe_interval)
+
+        await asyncio.gather(probe(), *(load(w) for w in range(concurrency)))
+
+    return {
+        "profiles_per_second": round(profiles / duration, 1),
+        "profile_errors": errors,
+        **{f"{path}": _percentiles(latencies) for path, latencies in probes.items()},
+    }
+
+
+def run(workers: int, duration: float, concurrency: int, latency_ms: float) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-event-loop-")
+    for name in ("HISTORY_DB_PATH", "SHARE_DB_PATH", "SIMILARITY_DB_PATH"):
+        os.environ[name] = os.path.join(tmp, f"{name.lower()}.sqlite3")
+    os.environ["PREFETCH_ENABLED"] = "0"
+
+    import main
+    from services import ml_pool, spotify_client
+
+    fake = FakeSpotify(latency_ms=latency_ms, genres_per_artist=25, genre_pool_size=5000)
+    spotify_client.SPOTIFY_API_BASE = fake.start()
+    results = {}
+    try:
+        for label, n in (("inline", 0), ("pool", workers)):
+            async def measure() -> dict:
+                ml_pool.start(n)
+                try:
+                    if n:
+                        # Let every worker finish spawning and warming up.
+                        await asyncio.gather(*(ml_pool.run(ml_pool._noop) for _ in range(n)))
+                    return await _measure(main.app, duration, concurrency, 0.005, label)
+                finally:
+                    ml_pool.shutdown()
+                    await spotify_client.close_client()
+
+            results[label] = {"workers": n, **asyncio.run(measure())}
+    finally:
+        fake.stop()
+    return {"concurrency": concurrency, "duration_seconds": duration, "upstream_latency_ms": latency_ms, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /ml/profile clients")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.workers, args.duration, args.concurrency, args.upstream_latency_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
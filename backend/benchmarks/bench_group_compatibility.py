@@ -0,0 +1,86 @@
+"""
+Group compatibility: one sparse matrix product vs. a compatibility_score()
+call per pair.
+
+    python -m benchmarks.bench_group_compatibility --members 10 100 1000 5000
+
+The pairwise loop is quadratic, so it is only timed up to --loop-max members
+and extrapolated by pair count beyond that (reported as *_estimated). Its
+scores are checked against the matrix wherever it runs.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import genre_pool
+from services import ml_batch, ml_engine
+
+
+def _members(rng: random.Random, n: int, pool: list[str], per_member: int) -> list[dict[str, int]]:
+    # Half the members draw from a small "mainstream" slice so the group overlaps.
+    head = pool[:max(per_member * 4, 50)]
+    return [
+        {g: rng.randint(1, 9) for g in rng.sample(head if i % 2 else pool, per_member)}
+        for i in range(n)
+    ]
+
+
+def _pairwise(members: list[dict[str, int]]) -> np.ndarray:
+    n = len(members)
+    scores = np.zeros((n, n), dtype=np.float32)
+    for i, j in itertools.combinations(range(n), 2):
+        scores[i, j] = scores[j, i] = ml_engine.compatibility_score(members[i], members[j])["score"]
+    return scores
+
+
+def run(sizes: list[int], per_member: int, loop_max: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    pool = genre_pool(2000)
+    results = []
+    loop_seconds_per_pair = None
+
+    for n in sizes:
+        members = _members(rng, n, pool, per_member)
+
+        start = time.perf_counter()
+        group = ml_batch.group_compatibility(members)
+        matrix_s = time.perf_counter() - start
+        n_pairs = n * (n - 1) // 2
+        result = {"members": n, "pairs": n_pairs, "matrix_seconds": round(matrix_s, 4)}
+
+        if n <= loop_max:
+            start = time.perf_counter()
+            exact = _pairwise(members)
+            loop_s = time.perf_counter() - start
+            loop_seconds_per_pair = loop_s / max(n_pairs, 1)
+            off_diagonal = ~np.eye(n, dtype=bool)
+            if not np.allclose(group["matrix"][off_diagonal], exact[off_diagonal], atol=0.11):
+                raise AssertionError(f"matrix scores differ from compatibility_score() for {n} members")
+            result["loop_seconds"] = round(loop_s, 4)
+            result["speedup"] = round(loop_s / matrix_s, 1)
+        elif loop_seconds_per_pair is not None:
+            loop_s = loop_seconds_per_pair * n_pairs
+            result["loop_seconds_estimated"] = round(loop_s, 1)
+            result["speedup_estimated"] = round(loop_s / matrix_s, 1)
+        results.append(result)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--members", type=int, nargs="+", default=[10, 100, 500, 1000, 3000, 5000])
+    parser.add_argument("--genres-per-member", type=int, default=40)
+    parser.add_argument("--loop-max", type=int, default=500, help="largest group to time the pairwise loop on")
+    args = parser.parse_args()
+    print(json.dumps(run(args.members, args.genres_per_member, args.loop_max), indent=2))
+
+
+if __name__ == "__main__":
+    main()
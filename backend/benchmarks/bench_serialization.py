@@ -0,0 +1,114 @@
+"""
+Serialization cost and wire size of the hot responses on a 50-track payload.
+
+    python -m benchmarks.bench_serialization
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json) with
+FastJSONResponse (orjson), pydantic validate + dump_json against the
+response models, and slim() on a verbose Spotify /me/top/tracks payload.
+Wire sizes are reported raw, gzipped and (if installed) brotli-compressed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import middleware
+from benchmarks.synthetic import make_user
+from routers.responses import FastJSONResponse, slim
+from routers.schemas import DataPipeline, MLProfile, TopTracks
+from services import ml_engine, pipeline
+
+_MARKETS = ["AD", "AE", "AR", "AT", "AU", "BE", "BG", "BR", "CA", "CH", "CL", "CO", "CZ", "DE", "DK", "ES",
+            "FI", "FR", "GB", "GR", "HK", "HU", "ID", "IE", "IL", "IN", "IT", "JP", "KE", "MX", "NG", "NL",
+            "NO", "NZ", "PL", "PT", "SE", "SG", "TR", "TW", "US", "ZA"]
+
+
+def _verbose_track(track: dict) -> dict:
+    """Pad a synthetic track with the fields Spotify really returns."""
+    uri = f"spotify:track:{track['id']}"
+    return {
+        **track,
+        "album": {
+            **track["album"],
+            "album_type": "album",
+            "available_markets": _MARKETS,
+            "external_urls": {"spotify": f"https://open.spotify.com/album/{track['id']}"},
+            "href": f"https://api.spotify.com/v1/albums/{track['id']}",
+            "release_date_precision": "day",
+            "total_tracks": 12,
+            "uri": uri,
+        },
+        "available_markets": _MARKETS,
+        "disc_number": 1,
+        "duration_ms": 201_000,
+        "external_ids": {"isrc": "USRC17607839"},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track['id']}"},
+        "href": f"https://api.spotify.com/v1/tracks/{track['id']}",
+        "is_local": False,
+        "track_number": 3,
+        "type": "track",
+        "uri": uri,
+    }
+
+
+def _time_us(fn) -> float:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return round(min(timer.repeat(repeat=5, number=number)) / number * 1e6, 1)
+
+
+def _sizes(body: bytes) -> dict:
+    sizes = {"raw_bytes": len(body), "gzip_bytes": len(middleware.compress(body, "gzip"))}
+    if middleware.brotli is not None:
+        sizes["brotli_bytes"] = len(middleware.compress(body, "br"))
+    return sizes
+
+
+def _compare(payload, model) -> dict:
+    adapter = TypeAdapter(model)
+    response = FastJSONResponse(None)
+    return {
+        "jsonable_encoder_json_us": _time_us(lambda: json.dumps(jsonable_encoder(payload)).encode()),
+        "fast_json_response_us": _time_us(lambda: response.render(payload)),
+        "pydantic_validate_dump_us": _time_us(lambda: adapter.dump_json(adapter.validate_python(payload))),
+        **_sizes(response.render(payload)),
+    }
+
+
+def run(n_tracks: int) -> dict:
+    user = make_user(1, n_tracks=n_tracks, n_artists=50)
+    raw_tracks = [_verbose_track(t) for t in user["raw_tracks"]]
+    top_tracks = {"items": raw_tracks, "total": n_tracks, "limit": n_tracks, "offset": 0,
+                  "href": "https://api.spotify.com/v1/me/top/tracks", "next": None, "previous": None}
+    profile = {"id": "user", "display_name": "User", "images": []}
+
+    data = pipeline.build_pipeline(top_tracks, {"items": user["raw_artists"]}, profile)
+    ml_profile = ml_engine.build_profile(data["tracks"], data["top_artists"])
+    slimmed = slim(top_tracks, TopTracks)
+
+    return {
+        "tracks": n_tracks,
+        "data_pipeline": _compare(data, DataPipeline),
+        "ml_profile": _compare(ml_profile, MLProfile),
+        "top_tracks": {
+            "slim_us": _time_us(lambda: slim(top_tracks, TopTracks)),
+            "upstream": _sizes(FastJSONResponse(None).render(top_tracks)),
+            "slimmed": _sizes(FastJSONResponse(None).render(slimmed)),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tracks), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Soulmate search latency at scale, checked against the brute-force path.
+
+    python -m benchmarks.bench_similarity --users 1000000 --queries 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+from scipy import sparse
+
+from benchmarks.synthetic import genre_pool
+from services import genre_vector as gv
+from services.similarity_index import SimilarityIndex
+
+
+def _random_matrix(rng: np.random.Generator, n_users: int, n_genres: int, per_user: int) -> sparse.csr_matrix:
+    # Zipf-like genre popularity so a few genres are shared by most users
+    popularity = 1 / np.arange(1, n_genres + 1) ** 0.8
+    popularity /= popularity.sum()
+    cols = rng.choice(n_genres, size=(n_users, per_user), p=popularity)
+    rows = np.repeat(np.arange(n_users), per_user)
+    counts = rng.integers(1, 6, size=n_users * per_user).astype(np.float32)
+    matrix = sparse.csr_matrix((counts, (rows, cols.ravel())), shape=(n_users, n_genres))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def run(n_users: int, n_queries: int, per_user: int, check: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    pool = genre_pool(2000)
+    for genre in pool:
+        gv.intern(genre)
+
+    build_start = time.perf_counter()
+    matrix = _random_matrix(rng, n_users, len(pool), per_user)
+    index = SimilarityIndex(path=None)
+    index.load_matrix([f"user{i}" for i in range(n_users)], [None] * n_users, matrix)
+    build_s = time.perf_counter() - build_start
+
+    queries = []
+    for q in rng.integers(0, n_users, size=n_queries):
+        row = matrix[q]
+        queries.append({pool[g]: int(c) for g, c in zip(row.indices, row.data)})
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Brute force is slow; check a few queries on a prefix-sized index.
+    small = SimilarityIndex(path=None)
+    n_small = min(n_users, 5_000)
+    small.load_matrix([f"user{i}" for i in range(n_small)], [None] * n_small, matrix[:n_small])
+    for query in queries[:check]:
+        fast = [s for _, _, s in small.search(query, k=10)]
+        exact = [s for _, _, s in small.search_exact(query, k=10)]
+        if not np.allclose(fast, exact, atol=1e-5):
+            raise AssertionError(f"indexed search differs from brute force: {fast} vs {exact}")
+
+    lat = np.asarray(latencies)
+    return {
+        "users": n_users,
+        "genres_per_user": per_user,
+        "build_seconds": round(build_s, 2),
+        "query_ms_p50": round(float(np.percentile(lat, 50)), 2),
+        "query_ms_p99": round(float(np.percentile(lat, 99)), 2),
+        "checked_against_brute_force": min(check, n_queries),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--genres-per-user", type=int, default=40)
+    parser.add_argument("--check", type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.users:
+        print(json.dumps(run(n, args.queries, args.genres_per_user, args.check)))
+
+
+if __name__ == "__main__":
+    main()
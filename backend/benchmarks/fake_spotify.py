@@ -0,0 +1,257 @@
+"""
+Local fake of the Spotify Web API endpoints the backend calls, with
+configurable latency and payload size. Each bearer token is a distinct user
+id (so the backend cache stays cold), served from a fixed set of
+pre-generated payloads. start() runs it in a child process so the fake's own
+JSON work never competes with the app under test for the GIL.
+
+    python -m benchmarks.fake_spotify --port 8765 --latency-ms 80
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import random
+import socket
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks.synthetic import featured_artists, genre_pool, make_track, make_user
+
+
+class FakeSpotify:
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        n_tracks: int = 50,
+        n_artists: int = 50,
+        genres_per_artist: int = 3,
+        genre_pool_size: int = 400,
+        n_payloads: int = 64,
+        n_featured: int = 0,
+        artists_status: int = 200,
+        n_saved: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.n_tracks = n_tracks
+        self.n_artists = n_artists
+        self.genres_per_artist = genres_per_artist
+        self.genre_pool_size = genre_pool_size
+        self.n_payloads = n_payloads
+        self.pool = genre_pool(genre_pool_size)
+        # Guest artists shared by all users' tracks, resolvable via /v1/artists.
+        self.n_featured = n_featured
+        self.featured = featured_artists(n_featured, self.pool, genres_per_artist)
+        # 403 mimics apps for which the batch artists endpoint is restricted.
+        self.artists_status = artists_status
+        # Saved tracks per user, generated page by page on request.
+        self.n_saved = n_saved
+        self._users: dict[int, dict] = {}
+        self._process: multiprocessing.Process | None = None
+        self.base_url = ""
+
+        self.app = Starlette(routes=[
+            Route("/v1/me", self.me),
+            Route("/v1/me/top/tracks", self.top_tracks),
+            Route("/v1/me/top/artists", self.top_artists),
+            Route("/v1/me/tracks", self.saved_tracks),
+            Route("/v1/me/player/recently-played", self.recently_played),
+            Route("/v1/artists", self.artists),
+            Route("/api/token", self.token, methods=["POST"]),
+        ])
+
+    # -- data --------------------------------------------------------------------
+
+    def _user(self, request: Request) -> tuple[int, dict] | None:
+        auth = request.headers.get("authorization", "")
+        if not auth.startswith("Bearer "):
+            return None
+        seed = int(hashlib.sha256(auth[7:].encode()).hexdigest()[:8], 16) % 1_000_000
+        user = self._users.get(seed % self.n_payloads)
+        if user is None:
+            user = self._users[seed % self.n_payloads] = make_user(
+                seed % self.n_payloads,
+                n_tracks=self.n_tracks,
+                n_artists=self.n_artists,
+                genres_per_artist=self.genres_per_artist,
+                pool=self.pool,
+                featured=self.featured,
+            )
+        return seed, user
+
+    def _saved_track(self, seed: int, user: dict, i: int) -> dict:
+        # Every fifth saved track is also a top track, the rest are generated
+        # on demand so large libraries cost nothing up front.
+        if i % 5 == 0 and i // 5 < len(user["raw_tracks"]):
+            return user["raw_tracks"][i // 5]
+        index = seed % self.n_payloads
+        return make_track(random.Random(index * 1_000_003 + i), (index + 1) * 10_000_000 + i, user["raw_artists"])
+
+    async def _respond(self, request: Request, body_fn) -> JSONResponse:
+        await asyncio.sleep(self.latency_ms / 1000)
+        found = self._user(request)
+        if found is None:
+            return JSONResponse({"error": {"status": 401, "message": "No token provided"}}, status_code=401)
+        return JSONResponse(body_fn(*found))
+
+    @staticmethod
+    def _page(items: list[dict], request: Request) -> dict:
+        limit = int(request.query_params.get("limit", 20))
+        offset = int(request.query_params.get("offset", 0))
+        return {
+            "items": items[offset:offset + limit],
+            "total": len(items),
+            "limit": limit,
+            "offset": offset,
+            "next": None,
+            "previous": None,
+        }
+
+    # -- endpoints ---------------------------------------------------------------
+
+    async def me(self, request: Request) -> JSONResponse:
+        return await self._respond(request, lambda seed, _: {
+            "id": f"user{seed}",
+            "display_name": f"User {seed}",
+            "country": "GB",
+            "product": "premium",
+            "followers": {"href": None, "total": seed % 500},
+            "images": [{"url": f"https://i.scdn.co/image/user{seed}", "height": 300, "width": 300}],
+            "external_urls": {"spotify": f"https://open.spotify.com/user/user{seed}"},
+            "type": "user",
+            "uri": f"spotify:user:user{seed}",
+        })
+
+    async def top_tracks(self, request: Request) -> JSONResponse:
+        return await self._respond(request, lambda _, user: self._page(user["raw_tracks"], request))
+
+    async def top_artists(self, request: Request) -> JSONResponse:
+        return await self._respond(request, lambda _, user: self._page(user["raw_artists"], request))
+
+    async def saved_tracks(self, request: Request) -> JSONResponse:
+        def body(seed: int, user: dict) -> dict:
+            limit = int(request.query_params.get("limit", 20))
+            offset = int(request.query_params.get("offset", 0))
+            return {
+                "items": [
+                    {"added_at": "2024-01-01T00:00:00Z", "track": self._saved_track(seed, user, i)}
+                    for i in range(offset, min(offset + limit, self.n_saved))
+                ],
+                "total": self.n_saved,
+                "limit": limit,
+                "offset": offset,
+                "next": None,
+                "previous": None,
+            }
+
+        return await self._respond(request, body)
+
+    async def recently_played(self, request: Request) -> JSONResponse:
+        def body(seed: int, user: dict) -> dict:
+            limit = min(int(request.query_params.get("limit", 20)), 50)
+            rng = random.Random(seed)
+            tracks = [
+                self._saved_track(seed, user, rng.randrange(self.n_saved)) if self.n_saved
+                else rng.choice(user["raw_tracks"])
+                for _ in range(limit)
+            ]
+            return {
+                "items": [{"track": t, "played_at": "2024-01-01T00:00:00Z"} for t in tracks],
+                "limit": limit,
+                "next": None,
+                "cursors": None,
+            }
+
+        return await self._respond(request, body)
+
+    async def artists(self, request: Request) -> JSONResponse:
+        ids = request.query_params.get("ids", "").split(",")[:50]
+        if self.artists_status != 200:
+            await asyncio.sleep(self.latency_ms / 1000)
+            return JSONResponse(
+                {"error": {"status": self.artists_status, "message": "Forbidden"}},
+                status_code=self.artists_status,
+            )
+
+        def body(_, user: dict) -> dict:
+            by_id = {a["id"]: a for a in (*user["raw_artists"], *self.featured)}
+            return {"artists": [by_id.get(i) for i in ids]}
+
+        return await self._respond(request, body)
+
+    async def token(self, request: Request) -> JSONResponse:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return JSONResponse({
+            "access_token": f"fake-{time.monotonic_ns()}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": "fake-refresh",
+        })
+
+    # -- lifecycle ---------------------------------------------------------------
+
+    def _serve(self, port: int) -> None:
+        uvicorn.run(self.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+
+    def start(self, port: int = 0) -> str:
+        """Serve on 127.0.0.1 in a child process; returns the /v1 base URL."""
+        if not port:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+
+        self._process = multiprocessing.get_context("spawn").Process(
+            target=_serve,
+            args=(self.latency_ms, self.n_tracks, self.n_artists, self.genres_per_artist,
+                  self.genre_pool_size, self.n_payloads, self.n_featured, self.artists_status,
+                  self.n_saved, port),
+            daemon=True,
+        )
+        self._process.start()
+
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or not self._process.is_alive():
+                    raise RuntimeError("fake Spotify server did not start")
+                time.sleep(0.05)
+
+        self.base_url = f"http://127.0.0.1:{port}"
+        return f"{self.base_url}/v1"
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(timeout=5)
+            self._process = None
+
+
+def _serve(*args) -> None:
+    *config, port = args
+    FakeSpotify(*config)._serve(port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the fake Spotify API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--artists", type=int, default=50)
+    parser.add_argument("--genres-per-artist", type=int, default=3)
+    args = parser.parse_args()
+
+    FakeSpotify(args.latency_ms, args.tracks, args.artists, args.genres_per_artist)._serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
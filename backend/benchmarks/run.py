@@ -0,0 +1,201 @@
+"""
+Reproducible benchmark suite for ml_engine and the Spotify-backed routes.
+
+    python -m benchmarks.run                                  # print results
+    python -m benchmarks.run --output results.json            # save them
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+
+Micro benchmarks time each ml_engine stage on synthetic users ("typical":
+50 tracks / 50 artists / ~3 genres per artist, "extreme": ~25 genres per
+artist over a 5000-genre pool). End-to-end benchmarks drive the FastAPI app
+in-process against benchmarks.fake_spotify, with one token (= one uncached
+user) per request. With --baseline, the run exits 1 if any metric is worse
+than the baseline by more than --tolerance.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import timeit
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_spotify import FakeSpotify
+from benchmarks.synthetic import genre_pool, make_user
+from services import ml_engine
+
+PAYLOADS = {
+    "typical": {"n_tracks": 50, "n_artists": 50, "genres_per_artist": 3, "pool": 400},
+    "extreme": {"n_tracks": 50, "n_artists": 50, "genres_per_artist": 25, "pool": 5000},
+}
+
+# Metric name suffix → whether a larger value is better.
+_HIGHER_IS_BETTER = {"_rps": True, "_us": False, "_ms": False}
+
+
+def _time_us(fn, min_seconds: float = 0.2) -> float:
+    """Best-of-5 mean microseconds per call."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_seconds / 0.2))
+    return round(min(timer.repeat(repeat=5, number=number)) / number * 1e6, 2)
+
+
+def micro_benchmarks() -> dict[str, dict[str, float]]:
+    results = {}
+    for name, payload in PAYLOADS.items():
+        pool = genre_pool(payload["pool"])
+        kwargs = dict(
+            n_tracks=payload["n_tracks"],
+            n_artists=payload["n_artists"],
+            genres_per_artist=payload["genres_per_artist"],
+            pool=pool,
+        )
+        user, other = make_user(1, **kwargs), make_user(2, **kwargs)
+        tracks, artists = user["tracks"], user["top_artists"]
+        vector = ml_engine.build_genre_vector(artists, tracks)
+        other_vector = ml_engine.build_genre_vector(other["top_artists"], other["tracks"])
+
+        results[f"ml_engine/{name}"] = {
+            "build_genre_vector_us": _time_us(lambda: ml_engine.build_genre_vector(artists, tracks)),
+            # Fresh dict each call so per-vector caches do not flatter the numbers.
+            "get_archetype_us": _time_us(lambda: ml_engine.get_archetype(dict(vector.items()))),
+            "diversity_score_us": _time_us(lambda: ml_engine.diversity_score(dict(vector.items()))),
+            "compatibility_score_us": _time_us(
+                lambda: ml_engine.compatibility_score(dict(vector.items()), dict(other_vector.items()))
+            ),
+            "taste_map_us": _time_us(lambda: ml_engine.taste_map(artists)),
+            "build_profile_us": _time_us(lambda: ml_engine.build_profile(tracks, artists)),
+        }
+    return results
+
+
+async def _drive(app, path: str, n_requests: int, concurrency: int, token_prefix: str) -> dict[str, float]:
+    transport = httpx.ASGITransport(app=app)
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers={"Authorization": f"Bearer {token_prefix}-{i}"})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    lat = np.asarray(latencies)
+    return {
+        "throughput_rps": round(n_requests / elapsed, 1),
+        "latency_p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "latency_p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "errors": errors,
+    }
+
+
+def e2e_benchmarks(latency_ms: float, n_requests: int, concurrency: int) -> dict[str, dict[str, float]]:
+    import main
+    from services import spotify_client
+
+    results = {}
+    for name, payload in PAYLOADS.items():
+        fake = FakeSpotify(
+            latency_ms=latency_ms,
+            n_tracks=payload["n_tracks"],
+            n_artists=payload["n_artists"],
+            genres_per_artist=payload["genres_per_artist"],
+            genre_pool_size=payload["pool"],
+        )
+        spotify_client.SPOTIFY_API_BASE = fake.start()
+        try:
+            for path in ("/spotify/data-pipeline", "/ml/profile"):
+                async def run() -> dict[str, float]:
+                    try:
+                        # Warm-up request so imports and the connection pool are ready
+                        await _drive(main.app, path, 1, 1, f"warmup-{name}")
+                        return await _drive(main.app, path, n_requests, concurrency, f"{name}-{path}")
+                    finally:
+                        await spotify_client.close_client()
+
+                results[f"e2e/{name}{path}"] = asyncio.run(run())
+        finally:
+            fake.stop()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for bench, metrics in baseline.get("results", {}).items():
+        for metric, base in metrics.items():
+            current = results["results"].get(bench, {}).get(metric)
+            suffix = next((s for s in _HIGHER_IS_BETTER if metric.endswith(s)), None)
+            if current is None or suffix is None or not base:
+                continue
+            higher_is_better = _HIGHER_IS_BETTER[suffix]
+            change = (current - base) / base
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{bench} {metric}: {base} -> {current} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ml_engine and the API routes.")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", help="write results JSON as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "upstream_latency_ms": args.upstream_latency_ms,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": {},
+    }
+    if not args.skip_micro:
+        results["results"].update(micro_benchmarks())
+    if not args.skip_e2e:
+        results["results"].update(e2e_benchmarks(args.upstream_latency_ms, args.requests, args.concurrency))
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
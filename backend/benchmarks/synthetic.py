@@ -0,0 +1,97 @@
+"""Synthetic Spotify-shaped users for benchmarks."""
+from __future__ import annotations
+
+import random
+
+from services import ml_engine
+
+_ARCHETYPE_GENRES = sorted({g for a in ml_engine.ARCHETYPES for g in a["genres"]})
+_PREFIXES = ["dark", "uk", "alt", "indie", "deep", "melodic", "nu", "afro", "bedroom", "experimental"]
+_LONG_TAIL = ["hyperpop", "jazz", "classical", "ambient", "house", "techno", "country", "folk", "metal", "gospel"]
+
+
+def genre_pool(size: int = 400, seed: int = 0) -> list[str]:
+    """Archetype keywords plus prefixed/long-tail variants, like Spotify's genre tags."""
+    rng = random.Random(seed)
+    pool = list(_ARCHETYPE_GENRES) + list(_LONG_TAIL)
+    while len(pool) < size:
+        pool.append(f"{rng.choice(_PREFIXES)} {rng.choice(_ARCHETYPE_GENRES + _LONG_TAIL)} {len(pool)}")
+    return pool
+
+
+def make_artist(rng: random.Random, i: int, pool: list[str], genres_per_artist: int = 3) -> dict:
+    return {
+        "id": f"artist{i}",
+        "name": f"Artist {i}",
+        "genres": rng.sample(pool, rng.randint(0, genres_per_artist)),
+        "popularity": rng.randint(0, 100),
+        "images": [{"url": f"https://i.scdn.co/image/{i}", "height": 640, "width": 640}],
+    }
+
+
+def make_track(rng: random.Random, i: int, artists: list[dict]) -> dict:
+    year = rng.randint(1965, 2025)
+    return {
+        "id": f"track{i}",
+        "name": f"Track {i}",
+        "artists": [{"id": a["id"], "name": a["name"]} for a in rng.sample(artists, rng.randint(1, 3))],
+        "album": {
+            "name": f"Album {i}",
+            "release_date": f"{year}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            "images": [{"url": f"https://i.scdn.co/image/album{i}", "height": 640, "width": 640}],
+        },
+        "popularity": rng.randint(0, 100),
+        "explicit": rng.random() < 0.3,
+        "preview_url": None,
+    }
+
+
+def featured_artists(n: int, pool: list[str], genres_per_artist: int = 3, seed: int = 1_000_000) -> list[dict]:
+    """Artists credited on many users' tracks but in nobody's top artists."""
+    rng = random.Random(seed)
+    return [
+        {**make_artist(rng, i, pool, genres_per_artist), "id": f"featured{i}", "name": f"Featured {i}"}
+        for i in range(n)
+    ]
+
+
+def make_user(
+    seed: int,
+    n_tracks: int = 50,
+    n_artists: int = 50,
+    genres_per_artist: int = 3,
+    pool: list[str] | None = None,
+    featured: list[dict] | None = None,
+) -> dict:
+    """
+    One user's raw top tracks/artists (Spotify shape) plus the enriched tracks
+    the data pipeline produces, i.e. what build_profile is fed. With
+    `featured`, about half the tracks also credit one of those artists.
+    """
+    rng = random.Random(seed)
+    pool = pool or genre_pool()
+    artists = [make_artist(rng, seed * 1000 + i, pool, genres_per_artist) for i in range(n_artists)]
+    tracks = [make_track(rng, seed * 1000 + i, artists) for i in range(n_tracks)]
+    if featured:
+        for track in tracks:
+            if rng.random() < 0.5:
+                guest = rng.choice(featured)
+                track["artists"].append({"id": guest["id"], "name": guest["name"]})
+
+    genres = {a["id"]: a["genres"] for a in (*artists, *(featured or ()))}
+    enriched = [
+        {
+            "id": t["id"],
+            "name": t["name"],
+            "release_date": t["album"]["release_date"],
+            "popularity": t["popularity"],
+            "genres": list(dict.fromkeys(g for a in t["artists"] for g in genres.get(a["id"], []))),
+        }
+        for t in tracks
+    ]
+    return {"raw_tracks": tracks, "raw_artists": artists, "tracks": enriched, "top_artists": artists}
+
+
+def make_users(n: int, **kwargs) -> list[dict]:
+    pool = kwargs.pop("pool", None) or genre_pool()
+    return [make_user(seed, pool=pool, **kwargs) for seed in range(n)]
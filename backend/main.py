@@ -1,12 +1,38 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+# Before anything heavy is imported, so the per-module timings are real.
+from services import warmup
+warmup.preload()
+
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import spotify, ml
+from middleware import COMPRESSION_ENABLED, CompressionMiddleware, MetricsMiddleware
+from routers import admission, dashboard, share, spotify, ml
+from routers.responses import FastJSONResponse
+from services import artist_store, deadline, deep_history, genre_embedding, metrics, ml_pool, prefetch, profile_cache, spotify_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await spotify_client.start_client()
+    genre_embedding.get()  # memory-map the taste map embedding, if configured
+    ml_pool.start()
+    prefetch.start()
+    warmup.start(app)
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        await prefetch.stop()
+        ml_pool.shutdown()
+        await spotify_client.close_client()
 
-app = FastAPI(title="Music Taste DNA API")
+
+app = FastAPI(title="Music Taste DNA API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 _origins_env = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000")
 ALLOWED_ORIGINS = [o.strip() for o in _origins_env.split(",") if o.strip()]
@@ -18,11 +44,54 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if metrics.METRICS_ENABLED:
+    # Added last so it is outermost and its timings include compression.
+    app.add_middleware(MetricsMiddleware)
+
+metrics.register_collector("spotify_pool", spotify_client.pool_stats)
+metrics.register_collector("spotify_cache", spotify_client.cache_stats)
+metrics.register_collector("spotify_scheduler", spotify_client.scheduler_stats)
+metrics.register_collector("profile_cache", profile_cache.stats)
+metrics.register_collector("artist_store", artist_store.stats)
+metrics.register_collector("deep_history", deep_history.stats)
+metrics.register_collector("ml_pool", ml_pool.stats)
+metrics.register_collector("prefetch", prefetch.stats)
+metrics.register_collector("warmup", warmup.stats)
+metrics.register_collector("admission", admission.stats)
 
 app.include_router(spotify.router, prefix="/spotify", tags=["spotify"])
 app.include_router(ml.router, prefix="/ml", tags=["ml"])
+app.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
+app.include_router(share.router, prefix="/share", tags=["share"])
+
+
+@app.exception_handler(ml_pool.PoolBusy)
+@app.exception_handler(admission.Overloaded)
+@app.exception_handler(deadline.DeadlineExceeded)
+async def service_unavailable(request: Request, exc: ml_pool.PoolBusy | admission.Overloaded | deadline.DeadlineExceeded):
+    # Load shedding: refuse fast and tell the client when to come back.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    # Not ready until the startup warm-up is done, so new workers get no
+    # traffic while they are still cold.
+    if not warmup.ready():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming", "warmup": warmup.report()},
+            headers={"Retry-After": "1"},
+        )
+    return {"status": "ok", "warmup": warmup.report()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
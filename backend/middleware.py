@@ -0,0 +1,174 @@
+"""
+ASGI middleware for the app.
+
+CompressionMiddleware negotiates Content-Encoding from Accept-Encoding:
+brotli when the optional `brotli` package is installed and the client
+accepts it, otherwise gzip. Only complete (non-streamed) responses of at
+least COMPRESSION_MIN_BYTES are compressed, so NDJSON/SSE streams are
+passed through untouched and still flush event by event. Bodies above
+COMPRESSION_THREAD_BYTES are compressed in a worker thread instead of on
+the event loop, and bodies above COMPRESSION_MAX_BYTES are sent as they
+are, so one huge response cannot stall every other request.
+
+MetricsMiddleware times every request into services.metrics, labelled by
+route template (never the raw path), and adds a Server-Timing header with
+the request's spans when SERVER_TIMING is on.
+"""
+import asyncio
+import gzip
+import os
+import time
+
+from services import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION", "1") not in ("0", "false", "False")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_THREAD_BYTES = int(os.getenv("COMPRESSION_THREAD_BYTES", str(64 * 1024)))
+COMPRESSION_MAX_BYTES = int(os.getenv("COMPRESSION_MAX_BYTES", str(8 * 1024 * 1024)))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Best supported encoding the client accepts (q > 0), or None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda enc: accepted.get(enc, accepted.get("*", 0.0)))
+    return best if accepted.get(best, accepted.get("*", 0.0)) > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_BYTES,
+        thread_size: int = COMPRESSION_THREAD_BYTES,
+        maximum_size: int = COMPRESSION_MAX_BYTES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_size = thread_size
+        self.maximum_size = maximum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), "")
+        encoding = negotiate_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = start_message["headers"]
+            already_encoded = any(k == b"content-encoding" for k, _ in headers)
+            if (
+                message.get("more_body")
+                or already_encoded
+                or not self.minimum_size <= len(body) <= self.maximum_size
+            ):
+                # Streamed, pre-encoded, tiny or huge: send as is.
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) > self.thread_size:
+                body = await asyncio.to_thread(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            start_message["headers"] = [
+                (k, v) for k, v in headers if k != b"content-length"
+            ] + [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def route_template(scope) -> str:
+    """
+    The matched route as a template ("/share/{share_id}"), for metric labels.
+    Rebuilt from the path and its parameters, since scope["route"] does not
+    carry the prefix of the router it was included with.
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if spans is not None and metrics.SERVER_TIMING_ENABLED:
+                    timing = metrics.server_timing(spans, time.perf_counter() - start)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        with metrics.request_spans() as spans:
+            try:
+                await self.app(scope, receive, send_timed)
+            finally:
+                metrics.observe(
+                    "http_request_duration_seconds",
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    route=route_template(scope),
+                    status=str(status),
+                )
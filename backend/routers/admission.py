@@ -0,0 +1,174 @@
+"""
+Admission control for the expensive Spotify-backed routes.
+
+The data routes of routers/spotify.py, routers/ml.py and routers/dashboard.py
+declare admit() as a dependency, which
+
+- opens the request's deadline (services.deadline, REQUEST_DEADLINE), and
+- takes a slot from its endpoint's Limiter: at most `concurrency` requests
+  to that endpoint run at once and at most `queue` more wait, first come
+  first served. A request that finds the queue full, or is still waiting
+  after ADMISSION_MAX_WAIT or its deadline, is refused with 503 +
+  Retry-After straight away instead of piling up coroutines and sockets
+  behind a slow upstream.
+
+The auth routes (/spotify/auth/*) and the cheap stats and status routes
+are deliberately left out: shedding a login or token refresh would sign
+the user out, and the stats are what operators look at under load.
+
+Endpoints are route templates ("/ml/profile"). Every endpoint gets
+ADMISSION_CONCURRENCY / ADMISSION_QUEUE unless ADMISSION_LIMITS sets its
+own, e.g. ADMISSION_LIMITS="/ml/profile=16:32,/dashboard=16:32". Refusals
+are counted in admission_shed_total{endpoint,reason}, queueing time in
+admission_wait_seconds and slot usage in the admission_* gauges; with
+deadline_exceeded_total and stale_served_total that is what worker counts
+can be sized from.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import AsyncIterator
+
+from fastapi import Request
+
+from middleware import route_template
+from services import deadline, metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") not in ("0", "false", "False")
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "32"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+def _parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """"/a=16:32,/b=4:8" → {"/a": (16, 32), "/b": (4, 8)}"""
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        endpoint, _, value = part.strip().partition("=")
+        concurrency, _, queue = value.partition(":")
+        limits[endpoint] = (int(concurrency), int(queue or ADMISSION_QUEUE))
+    return limits
+
+
+ADMISSION_LIMITS = _parse_limits(os.getenv("ADMISSION_LIMITS", ""))
+
+
+class Overloaded(Exception):
+    """The endpoint is at its limit; answered with 503 + Retry-After."""
+
+    def __init__(self, detail: str, retry_after: int = ADMISSION_RETRY_AFTER):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """Concurrency cap with a bounded FIFO wait queue for one endpoint."""
+
+    def __init__(self, endpoint: str, concurrency: int, queue: int):
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.queue = queue
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed = 0
+
+    def _shed(self, reason: str) -> Overloaded:
+        self.shed += 1
+        metrics.inc("admission_shed_total", endpoint=self.endpoint, reason=reason)
+        return Overloaded(f"{self.endpoint} is overloaded, retry shortly")
+
+    async def acquire(self) -> None:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue:
+            raise self._shed("queue_full")
+
+        left = deadline.remaining()
+        wait = ADMISSION_MAX_WAIT if left is None else max(min(ADMISSION_MAX_WAIT, left), 0)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, wait)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            raise self._shed("timeout") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled — pass it on.
+                self.release()
+            else:
+                self._forget(future)
+            raise
+        finally:
+            metrics.observe("admission_wait_seconds", time.perf_counter() - start, endpoint=self.endpoint)
+        self.admitted += 1
+
+    def release(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)  # hand the slot straight over
+                return
+        self.active -= 1
+
+    def _forget(self, future: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+
+_limiters: dict[str, Limiter] = {}
+
+
+def limiter(endpoint: str) -> Limiter:
+    found = _limiters.get(endpoint)
+    if found is None:
+        concurrency, queue = ADMISSION_LIMITS.get(endpoint, (ADMISSION_CONCURRENCY, ADMISSION_QUEUE))
+        found = _limiters[endpoint] = Limiter(endpoint, concurrency, queue)
+    return found
+
+
+async def admit(request: Request) -> AsyncIterator[None]:
+    """Route dependency: deadline plus an endpoint slot for the request."""
+    with deadline.within(deadline.REQUEST_DEADLINE):
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        slots = limiter(route_template(request.scope))
+        await slots.acquire()
+        try:
+            yield
+        finally:
+            slots.release()
+
+
+def stats() -> dict:
+    result = {
+        "active": sum(l.active for l in _limiters.values()),
+        "queued": sum(l.queued for l in _limiters.values()),
+        "admitted": sum(l.admitted for l in _limiters.values()),
+        "shed": sum(l.shed for l in _limiters.values()),
+    }
+    for endpoint, l in _limiters.items():
+        name = re.sub(r"\W+", "_", endpoint).strip("_")
+        result[f"{name}_active"] = l.active
+        result[f"{name}_queued"] = l.queued
+        result[f"{name}_shed"] = l.shed
+    return result
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Request
+from routers import admission
+from routers.responses import FastJSONResponse, slim
+from routers.schemas import Dashboard, UserProfile
+from routers.spotify import extract_token, upstream_error
+from services import artist_store, history_store, prefetch, profile_cache, share_store, spotify_client
+from services.concurrency import gather_or_cancel
+
+router = APIRouter()
+
+
+@router.get("", response_model=Dashboard, dependencies=[Depends(admission.admit)])
+async def dashboard(request: Request, time_range: str = "medium_term"):
+    """
+    Everything the dashboard renders in one call: the data pipeline payload
+    and the ML profile, computed from a single fetch and a single enrichment.
+    """
+    token = extract_token(request)
+
+    try:
+        tracks_data, top_artists_data, profile = await gather_or_cancel(
+            spotify_client.get_top_tracks(token, time_range=time_range),
+            spotify_client.get_top_artists(token, time_range=time_range),
+            spotify_client.get_user_profile(token),
+        )
+    except Exception as e:
+        raise upstream_error(e)
+
+    prefetch.touch(token, profile["id"], time_range)
+    artist_genres = await artist_store.enrich(token, tracks_data.get("items", []), top_artists_data.get("items", []))
+    data, ml_profile = await profile_cache.build(
+        profile["id"], time_range, tracks_data, top_artists_data, artist_genres
+    )
+    data = {"profile": slim(profile, UserProfile), **data}
+    ml_profile["share_id"] = share_store.share(ml_profile, profile.get("display_name"))
+    history_store.record_in_background(profile["id"], time_range, data["tracks"], data["top_artists"])
+
+    return FastJSONResponse({"pipeline": data, "ml_profile": ml_profile})
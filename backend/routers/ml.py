@@ -1,10 +1,31 @@
-from fastapi import APIRouter, HTTPException, Request
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
+from routers import admission
+from routers.responses import FastJSONResponse
+from routers.schemas import GroupCompatibility, MLProfile, MLProfileAllRanges
+from routers.spotify import upstream_error
 from services import spotify_client
+from services import artist_store
+from services import deep_history
+from services import ml_batch
 from services import ml_engine
+from services import ml_jobs
+from services import ml_pool
+from services import history_store
+from services import prefetch
+from services import profile_cache
+from services import share_store
+from services import similarity_index
+from services.concurrency import gather_or_cancel
 
 router = APIRouter()
 
+ML_GROUP_MAX_MEMBERS = int(os.getenv("ML_GROUP_MAX_MEMBERS", "5000"))
+# The pairwise matrix grows with the square of the group; past this size
+# only the summary is served.
+ML_GROUP_MATRIX_MAX_MEMBERS = int(os.getenv("ML_GROUP_MATRIX_MAX_MEMBERS", "500"))
+
 
 def extract_token(request: Request) -> str:
     auth = request.headers.get("authorization")
@@ -15,7 +36,7 @@ def extract_token(request: Request) -> str:
 
 @router.get("/status")
 def ml_status():
-    return {"status": "ready"}
+    return {"status": "ready", "pool": ml_pool.stats()}
 
 
 class CompatibilityRequest(BaseModel):
@@ -23,7 +44,7 @@ class CompatibilityRequest(BaseModel):
     other_genres: dict[str, int]
 
 
-@router.post("/compatibility")
+@router.post("/compatibility", dependencies=[Depends(admission.admit)])
 async def ml_compatibility(body: CompatibilityRequest, request: Request, time_range: str = "medium_term"):
     """
     Compare the current user's genre vector against a provided genre vector.
@@ -32,36 +53,241 @@ async def ml_compatibility(body: CompatibilityRequest, request: Request, time_ra
     token = extract_token(request)
 
     try:
-        tracks_data = await spotify_client.get_top_tracks(token, time_range=time_range)
-        top_artists_data = await spotify_client.get_top_artists(token, time_range=time_range)
+        tracks_data, top_artists_data = await gather_or_cancel(
+            spotify_client.get_top_tracks(token, time_range=time_range),
+            spotify_client.get_top_artists(token, time_range=time_range),
+        )
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Spotify API error: {e}")
+        raise upstream_error(e)
 
     my_vector = ml_engine.build_genre_vector(
         top_artists=top_artists_data.get("items", []),
         tracks=tracks_data.get("items", []),
     )
 
-    return ml_engine.compatibility_score(my_vector, body.other_genres)
+    try:
+        return ml_engine.compatibility_score(my_vector, body.other_genres)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+class GroupMember(BaseModel):
+    name: str
+    genres: dict[str, int]
+
+
+class GroupCompatibilityRequest(BaseModel):
+    """Genre vectors of every group member, keyed by genre name."""
+    members: list[GroupMember]
+    top_pairs: int = 5
+    include_matrix: bool = False
+
+
+@router.post("/group-compatibility", response_model=GroupCompatibility, dependencies=[Depends(admission.admit)])
+async def ml_group_compatibility(body: GroupCompatibilityRequest):
+    """
+    Compatibility across a group (friend group, party playlist): the genres
+    the group shares, each member's fit to the group and the most/least
+    compatible pairs. Pairs, `member_fit` and `incomparable` refer to
+    positions in `members`. include_matrix=true adds the full 0–100
+    pairwise matrix, for groups of up to ML_GROUP_MATRIX_MAX_MEMBERS.
+    """
+    if len(body.members) > ML_GROUP_MAX_MEMBERS:
+        raise HTTPException(status_code=422, detail=f"A group can have at most {ML_GROUP_MAX_MEMBERS} members")
+    if body.include_matrix and len(body.members) > ML_GROUP_MATRIX_MAX_MEMBERS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"include_matrix is limited to groups of at most {ML_GROUP_MATRIX_MAX_MEMBERS} members",
+        )
+
+    try:
+        result = await ml_pool.run(
+            ml_batch.group_compatibility,
+            [member.genres for member in body.members],
+            max(1, min(body.top_pairs, 50)),
+            12,
+            body.include_matrix,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return FastJSONResponse({"members": [member.name for member in body.members], **result})
 
 
-@router.get("/profile")
-async def ml_profile(request: Request, time_range: str = "medium_term"):
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+
+# (earlier, later) pairs reported by time_range=all, oldest listening first.
+DRIFT_PAIRS = (
+    ("long_term", "medium_term"),
+    ("medium_term", "short_term"),
+    ("long_term", "short_term"),
+)
+
+
+@router.get("/profile", response_model=MLProfile | MLProfileAllRanges, dependencies=[Depends(admission.admit)])
+async def ml_profile(request: Request, time_range: str = "medium_term", deep: bool = False):
     """
     Fetch the user's Spotify data and return a full ML music personality profile:
     archetype, mainstream score, era analysis, and diversity score.
+    With time_range=all, returns a profile per range plus drift metrics.
+    With deep=true, profiles all top items, saved tracks and recent plays
+    instead of the top 50 (see services.deep_history).
     """
     token = extract_token(request)
 
+    if deep:
+        if time_range == "all":
+            raise HTTPException(status_code=422, detail="deep=true takes a single time_range")
+        return FastJSONResponse(await _deep_profile(token, time_range))
+    if time_range == "all":
+        return FastJSONResponse(await _profile_all_ranges(token))
+
     try:
-        tracks_data = await spotify_client.get_top_tracks(token, time_range=time_range)
-        top_artists_data = await spotify_client.get_top_artists(token, time_range=time_range)
+        tracks_data, top_artists_data, profile = await gather_or_cancel(
+            spotify_client.get_top_tracks(token, time_range=time_range),
+            spotify_client.get_top_artists(token, time_range=time_range),
+            spotify_client.get_user_profile(token),
+        )
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Spotify API error: {e}")
+        raise upstream_error(e)
 
-    profile = ml_engine.build_profile(
-        tracks=tracks_data.get("items", []),
+    prefetch.touch(token, profile["id"], time_range)
+    artist_genres = await artist_store.enrich(token, tracks_data.get("items", []), top_artists_data.get("items", []))
+    # Run on the enriched pipeline data so tracks carry genres and release dates.
+    data, ml_profile = await profile_cache.build(
+        profile["id"], time_range, tracks_data, top_artists_data, artist_genres
+    )
+    ml_profile["share_id"] = share_store.share(ml_profile, profile.get("display_name"))
+    history_store.record_in_background(profile["id"], time_range, data["tracks"], data["top_artists"])
+    return FastJSONResponse(ml_profile)
+
+
+async def _deep_profile(token: str, time_range: str) -> dict:
+    try:
+        profile = await spotify_client.get_user_profile(token)
+        ml_profile = await deep_history.profile(token, profile["id"], time_range)
+    except ml_pool.PoolBusy:
+        raise
+    except Exception as e:
+        raise upstream_error(e)
+
+    ml_profile["share_id"] = share_store.share(ml_profile, profile.get("display_name"))
+    return ml_profile
+
+
+async def _profile_all_ranges(token: str) -> dict:
+    """All three time ranges from one concurrent fetch, plus cross-range drift."""
+    try:
+        responses = await gather_or_cancel(*(
+            fetch(token, time_range=tr)
+            for tr in TIME_RANGES
+            for fetch in (spotify_client.get_top_tracks, spotify_client.get_top_artists)
+        ))
+    except Exception as e:
+        raise upstream_error(e)
+
+    by_range = {tr: (responses[2 * i], responses[2 * i + 1]) for i, tr in enumerate(TIME_RANGES)}
+    artist_genres = await artist_store.enrich(
+        token,
+        [t for tracks_data, _ in by_range.values() for t in tracks_data.get("items", [])],
+        [a for _, top_artists_data in by_range.values() for a in top_artists_data.get("items", [])],
+    )
+    return await ml_pool.run(ml_jobs.profiles_with_drift, by_range, DRIFT_PAIRS, artist_genres)
+
+
+@router.get("/history", dependencies=[Depends(admission.admit)])
+async def ml_history(request: Request, time_range: str = "medium_term", limit: int = 100):
+    """
+    How the user's taste evolved: the recorded snapshots (oldest first) and
+    the drift between the first and the latest one. Snapshots are recorded
+    by /ml/profile and /dashboard, at most once per HISTORY_MIN_INTERVAL.
+    """
+    token = extract_token(request)
+    limit = max(1, min(limit, 1000))
+
+    try:
+        profile = await spotify_client.get_user_profile(token)
+    except Exception as e:
+        raise upstream_error(e)
+
+    snapshots = history_store.get_store().history(profile["id"], time_range, limit=limit)
+    vectors = [s.pop("genre_counts") for s in snapshots]
+
+    evolution = None
+    if len(snapshots) >= 2:
+        evolution = ml_engine.profile_drift(snapshots[0], snapshots[-1], vectors[0], vectors[-1])
+    return {"snapshots": snapshots, "evolution": evolution}
+
+
+async def _soulmate_request(request: Request, time_range: str):
+    token = extract_token(request)
+    try:
+        tracks_data, top_artists_data, profile = await gather_or_cancel(
+            spotify_client.get_top_tracks(token, time_range=time_range),
+            spotify_client.get_top_artists(token, time_range=time_range),
+            spotify_client.get_user_profile(token),
+        )
+    except Exception as e:
+        raise upstream_error(e)
+
+    my_vector = ml_engine.build_genre_vector(
         top_artists=top_artists_data.get("items", []),
+        tracks=tracks_data.get("items", []),
     )
+    return profile, my_vector
+
+
+def _soulmates(index: similarity_index.SimilarityIndex, match_id: str | None, my_vector, k: int) -> dict:
+    if match_id is None:
+        return {"joined": False, "match_id": None, "matches": []}
+    matches = index.search(my_vector, k=max(1, min(k, 50)), exclude=match_id)
+    return {
+        "joined": True,
+        "match_id": match_id,
+        "matches": [
+            {
+                "match_id": other_id,
+                "display_name": display_name,
+                **ml_engine.compatibility_label(round(min(score, 1.0) * 100, 1)),
+            }
+            for other_id, display_name, score in matches
+        ],
+    }
+
+
+@router.get("/soulmates", dependencies=[Depends(admission.admit)])
+async def ml_soulmates(request: Request, k: int = 10, time_range: str = "medium_term"):
+    """
+    The k users most similar to the current one ("musical soulmates"), best
+    match first. Only users who joined with POST /ml/soulmates are searched
+    and returned, and only to users who joined themselves; nothing is stored.
+    """
+    profile, my_vector = await _soulmate_request(request, time_range)
+    index = similarity_index.get_index()
+    return _soulmates(index, index.match_id(profile["id"]), my_vector, k)
+
 
-    return profile
+@router.post("/soulmates", dependencies=[Depends(admission.admit)])
+async def ml_join_soulmates(request: Request, k: int = 10, time_range: str = "medium_term"):
+    """
+    Opt in to soulmate matching: store the current user's genre vector (and
+    display name) so other members can find them, and return their matches.
+    Others only ever see the random `match_id`, not the Spotify user id.
+    """
+    profile, my_vector = await _soulmate_request(request, time_range)
+    if not my_vector:
+        raise HTTPException(status_code=422, detail="Not enough genre data to join")
+    index = similarity_index.get_index()
+    match_id = await index.join(profile["id"], profile.get("display_name"), my_vector)
+    return _soulmates(index, match_id, my_vector, k)
+
+
+@router.delete("/soulmates", dependencies=[Depends(admission.admit)])
+async def ml_leave_soulmates(request: Request):
+    """Opt out of soulmate matching; the user stops appearing in results."""
+    token = extract_token(request)
+    try:
+        profile = await spotify_client.get_user_profile(token)
+    except Exception as e:
+        raise upstream_error(e)
+    await similarity_index.get_index().leave(profile["id"])
+    return {"joined": False, "match_id": None, "matches": []}
@@ -0,0 +1,85 @@
+"""
+Fast JSON rendering and field selection for the hot endpoints.
+
+FastAPI sends plain-dict return values through jsonable_encoder and stdlib
+json, which costs milliseconds on a 50-track payload. The hot routes return
+FastJSONResponse instead, which hands the dict straight to orjson.
+"""
+from functools import lru_cache
+from types import UnionType
+from typing import Any, Union, get_args, get_origin
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from services import metrics
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (numpy scalars and arrays allowed)."""
+
+    def render(self, content: Any) -> bytes:
+        with metrics.span("render_json"):
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+# A shape is {key: nested shape or None}; None means "copy the value as is".
+Shape = dict[str, Any]
+
+
+def _nested_model(annotation) -> type[BaseModel] | None:
+    """The BaseModel inside `Model`, `Model | None` or `list[Model]`, if any."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    if get_origin(annotation) in (list, Union, UnionType):
+        for arg in get_args(annotation):
+            model = _nested_model(arg)
+            if model is not None:
+                return model
+    return None
+
+
+@lru_cache(maxsize=None)
+def _shape(model: type[BaseModel]) -> Shape:
+    shape: Shape = {}
+    for name, field in model.model_fields.items():
+        nested = _nested_model(field.annotation)
+        shape[name] = _shape(nested) if nested is not None else None
+    return shape
+
+
+def _project(value: Any, shape: Shape | None) -> Any:
+    if shape is None:
+        return value
+    if isinstance(value, list):
+        return [_project(v, shape) for v in value]
+    if isinstance(value, dict):
+        return {k: _project(value[k], sub) for k, sub in shape.items() if k in value}
+    return value
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> set[str] | None:
+    """Comma-separated `fields` query parameter → set of top-level field names."""
+    if not fields:
+        return None
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields {sorted(unknown)}; choose from {sorted(model.model_fields)}",
+        )
+    return selected
+
+
+def slim(data: Any, model: type[BaseModel], fields: set[str] | None = None) -> Any:
+    """
+    Drop every key `model` does not declare, recursively. With `fields`,
+    keep only those top-level keys as well.
+    """
+    shape = _shape(model)
+    if fields is not None:
+        shape = {k: v for k, v in shape.items() if k in fields}
+    return _project(data, shape)
@@ -0,0 +1,194 @@
+"""
+Response models for the hot endpoints.
+
+They document the API and define which upstream fields are passed through:
+routers.responses.slim() keeps only the keys a model declares. The hot
+routes return FastJSONResponse directly, so these models are not used to
+validate responses at runtime.
+"""
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class Image(BaseModel):
+    url: str
+    height: int | None = None
+    width: int | None = None
+
+
+class Followers(BaseModel):
+    total: int
+
+
+class UserProfile(BaseModel):
+    id: str
+    display_name: str | None = None
+    email: str | None = None
+    country: str | None = None
+    product: str | None = None
+    images: list[Image] = []
+    followers: Followers | None = None
+
+
+class ArtistRef(BaseModel):
+    id: str
+    name: str
+
+
+class Album(BaseModel):
+    id: str | None = None
+    name: str
+    release_date: str | None = None
+    images: list[Image] = []
+
+
+class Track(BaseModel):
+    id: str
+    name: str
+    artists: list[ArtistRef]
+    album: Album
+    popularity: int = 0
+    explicit: bool = False
+    duration_ms: int | None = None
+    preview_url: str | None = None
+
+
+class TopTracks(BaseModel):
+    items: list[Track]
+    total: int | None = None
+    limit: int | None = None
+    offset: int | None = None
+
+
+# -- data pipeline -------------------------------------------------------------
+
+class PipelineTrack(BaseModel):
+    id: str
+    name: str
+    artists: list[str]
+    album: str
+    release_date: str
+    popularity: int
+    explicit: bool
+    preview_url: str | None
+    image: str | None
+    genres: list[str]
+
+
+class PipelineArtist(BaseModel):
+    id: str
+    name: str
+    genres: list[str]
+    popularity: int
+    image: str | None
+
+
+class DataPipeline(BaseModel):
+    profile: UserProfile
+    tracks: list[PipelineTrack]
+    top_artists: list[PipelineArtist]
+
+
+# -- ML profile ----------------------------------------------------------------
+
+class Archetype(BaseModel):
+    name: str
+    emoji: str
+    description: str
+    top_genres: list[str]
+    confidence: float
+
+
+class ScoreLabel(BaseModel):
+    score: float
+    label: str
+    description: str
+
+
+class Era(BaseModel):
+    dominant_decade: str
+    distribution: dict[str, float]
+    description: str
+
+
+class GenreShare(BaseModel):
+    genre: str
+    count: int
+    pct: float
+
+
+class TasteMapPoint(BaseModel):
+    name: str
+    x: float
+    y: float
+    image: str | None
+    genres: list[str]
+
+
+class DeepSources(BaseModel):
+    # Distinct tracks each source added (a track counts for the first source it came from).
+    top_tracks: int
+    saved_tracks: int
+    recently_played: int
+    top_artists: int
+    tracks: int
+    unavailable: list[str]
+
+
+class MLProfile(BaseModel):
+    archetype: Archetype
+    mainstream: ScoreLabel
+    era: Era
+    diversity: ScoreLabel
+    top_genres: list[GenreShare]
+    taste_map: list[TasteMapPoint]
+    # Set on /ml/profile and /dashboard: id of the snapshot served at /share/{id}.
+    share_id: str | None = None
+    # Set with deep=true: what the profile was computed from.
+    sources: DeepSources | None = None
+
+
+class MLProfileAllRanges(BaseModel):
+    ranges: dict[str, MLProfile]
+    drift: dict[str, dict[str, Any]]
+
+
+class SharedGenre(BaseModel):
+    genre: str
+    weight: float
+    members: int
+
+
+class GroupPair(BaseModel):
+    a: int
+    b: int
+    score: float
+    label: str
+    description: str
+
+
+class GroupCompatibility(BaseModel):
+    members: list[str]
+    size: int
+    group: ScoreLabel
+    shared_genres: list[SharedGenre]
+    member_fit: list[float]
+    most_compatible: list[GroupPair]
+    least_compatible: list[GroupPair]
+    incomparable: list[int]
+    matrix: list[list[float]] | None
+
+
+class Dashboard(BaseModel):
+    pipeline: DataPipeline
+    ml_profile: MLProfile
+
+
+class SharedProfile(BaseModel):
+    archetype: dict[str, str]
+    mainstream: dict[str, Any]
+    era: dict[str, str]
+    diversity: dict[str, Any]
+    top_genres: list[GenreShare]
+    username: str
@@ -0,0 +1,32 @@
+import re
+from fastapi import APIRouter, HTTPException, Request, Response
+from routers.schemas import SharedProfile
+from services import share_store
+
+router = APIRouter()
+
+_SHARE_ID = re.compile(r"[0-9a-f]{20}")
+
+# Snapshots are content-addressed: a share id's body can never change.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/{share_id}", response_model=SharedProfile)
+def get_share(share_id: str, request: Request):
+    """
+    Public, unauthenticated snapshot of a shared profile. Served from the
+    local store only — no Spotify call and no ML recomputation.
+    """
+    if not _SHARE_ID.fullmatch(share_id):
+        raise HTTPException(status_code=404, detail="Share not found")
+
+    etag = f'"{share_id}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    body = share_store.get_store().get(share_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Share not found")
+    return Response(content=body, media_type="application/json", headers=headers)
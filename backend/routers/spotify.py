@@ -1,7 +1,16 @@
+import asyncio
+import math
 import os
-from fastapi import APIRouter, HTTPException, Request
+import httpx
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services import spotify_client
+from routers import admission
+from routers.responses import FastJSONResponse, parse_fields, slim
+from routers.schemas import DataPipeline, TopTracks, Track, UserProfile
+from services import artist_store, deadline, ml_engine, pipeline, prefetch, profile_cache, scheduler, spotify_client
+from services.concurrency import gather_or_cancel
 
 router = APIRouter()
 
@@ -26,6 +35,38 @@ def extract_token(request: Request) -> str:
     return auth[7:]
 
 
+def upstream_error(e: Exception, status_code: int = 502, user_token: bool = True) -> HTTPException:
+    """
+    Map a failed Spotify call to the error the client should see: a rate
+    limit or a missed request deadline becomes 503 with Retry-After, a
+    rejected user token 401, and anything else `status_code`.
+    """
+    if isinstance(e, deadline.DeadlineExceeded):
+        return HTTPException(
+            status_code=503,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if isinstance(e, scheduler.RateLimited):
+        return HTTPException(
+            status_code=503,
+            detail="Spotify rate limit reached, retry later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    if isinstance(e, httpx.HTTPStatusError):
+        upstream_status = e.response.status_code
+        if upstream_status == 429:
+            retry_after = scheduler.retry_after_seconds(e.response) or 1
+            return HTTPException(
+                status_code=503,
+                detail="Spotify rate limit reached, retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        if upstream_status == 401 and user_token:
+            return HTTPException(status_code=401, detail="Invalid or expired token")
+    return HTTPException(status_code=status_code, detail=f"Spotify API error: {e}")
+
+
 @router.post("/auth/token")
 async def exchange_token(body: TokenRequest):
     """Exchange Spotify auth code for access + refresh tokens."""
@@ -37,8 +78,10 @@ async def exchange_token(body: TokenRequest):
             client_secret=CLIENT_SECRET,
         )
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        # A 401 here means bad client credentials, not a bad user token.
+        raise upstream_error(e, status_code=400, user_token=False)
 
+    prefetch.remember_tokens(tokens["access_token"], tokens.get("refresh_token"), tokens.get("expires_in", 3600))
     return {
         "access_token": tokens["access_token"],
         "refresh_token": tokens.get("refresh_token", ""),
@@ -56,89 +99,179 @@ async def refresh_token(body: RefreshRequest):
             client_secret=CLIENT_SECRET,
         )
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        # A 401 here means bad client credentials, not a bad user token.
+        raise upstream_error(e, status_code=400, user_token=False)
 
+    prefetch.remember_tokens(
+        tokens["access_token"],
+        tokens.get("refresh_token") or body.refresh_token,
+        tokens.get("expires_in", 3600),
+    )
     return {
         "access_token": tokens["access_token"],
         "expires_in": tokens.get("expires_in", 3600),
     }
 
 
-@router.get("/profile")
-async def get_profile(request: Request):
+@router.get("/pool-stats")
+def pool_stats():
+    """Upstream connection pool utilisation for this worker."""
+    return spotify_client.pool_stats()
+
+
+@router.get("/cache-stats")
+def cache_stats():
+    """Upstream response cache hit rate and size for this worker."""
+    return spotify_client.cache_stats()
+
+
+@router.get("/prefetch-stats")
+def prefetch_stats():
+    """Background prefetch worker state and profile cache hit rate for this worker."""
+    return {**prefetch.stats(), "profile_cache": profile_cache.stats()}
+
+
+@router.get("/scheduler-stats")
+def scheduler_stats():
+    """Upstream rate-limit budgets, queue depths and retry counters for this worker."""
+    return spotify_client.scheduler_stats()
+
+
+@router.get("/profile", response_model=UserProfile, dependencies=[Depends(admission.admit)])
+async def get_profile(request: Request, fields: str | None = None):
+    """The user's Spotify profile; `fields` is a comma-separated subset of keys."""
     token = extract_token(request)
+    selected = parse_fields(fields, UserProfile)
     try:
-        return await spotify_client.get_user_profile(token)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+        profile = await spotify_client.get_user_profile(token)
+    except Exception as e:
+        raise upstream_error(e)
+    return FastJSONResponse(slim(profile, UserProfile, selected))
 
 
-@router.get("/top-tracks")
+@router.get("/top-tracks", response_model=TopTracks, dependencies=[Depends(admission.admit)])
 async def get_top_tracks(
     request: Request,
     limit: int = 50,
     time_range: str = "medium_term",
+    fields: str | None = None,
 ):
+    """The user's top tracks; `fields` is a comma-separated subset of track keys."""
     token = extract_token(request)
+    selected = parse_fields(fields, Track)
     try:
-        return await spotify_client.get_top_tracks(token, limit, time_range)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+        data = await spotify_client.get_top_tracks(token, limit, time_range)
+    except Exception as e:
+        raise upstream_error(e)
+    top_tracks = slim(data, TopTracks)
+    if selected is not None:
+        top_tracks["items"] = slim(top_tracks.get("items", []), Track, selected)
+    return FastJSONResponse(top_tracks)
 
 
-@router.get("/data-pipeline")
+@router.get("/data-pipeline", response_model=DataPipeline, dependencies=[Depends(admission.admit)])
 async def data_pipeline(request: Request, time_range: str = "medium_term"):
     """Fetch top tracks + top artists (with genres) + profile in one call."""
     token = extract_token(request)
 
     try:
-        tracks_data = await spotify_client.get_top_tracks(token, time_range=time_range)
-        top_artists_data = await spotify_client.get_top_artists(token, time_range=time_range)
-        profile = await spotify_client.get_user_profile(token)
+        tracks_data, top_artists_data, profile = await gather_or_cancel(
+            spotify_client.get_top_tracks(token, time_range=time_range),
+            spotify_client.get_top_artists(token, time_range=time_range),
+            spotify_client.get_user_profile(token),
+        )
+    except Exception as e:
+        raise upstream_error(e)
+
+    prefetch.touch(token, profile["id"], time_range)
+    artist_genres = await artist_store.enrich(token, tracks_data.get("items", []), top_artists_data.get("items", []))
+    data = pipeline.build_pipeline(tracks_data, top_artists_data, slim(profile, UserProfile), artist_genres)
+    return FastJSONResponse(data)
+
 
-        # Build artist_id → genres lookup from top 50 artists only.
-        # The batch /v1/artists endpoint is restricted for new Spotify apps (post Nov 2024),
-        # so we skip the extra fetch for artists not in the top 50.
-        artist_genres: dict[str, list[str]] = {
-            a["id"]: a.get("genres", [])
-            for a in top_artists_data["items"]
-        }
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
 
+
+def _encode_event(event: str, data, fmt: str) -> bytes:
+    payload = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    if fmt == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+    return b'{"event":"' + event.encode() + b'","data":' + payload + b"}\n"
+
+
+async def _pipeline_events(token: str, profile: dict, tracks_task, artists_task, fmt: str, include_ml: bool):
+    try:
+        yield _encode_event("profile", slim(profile, UserProfile), fmt)
+
+        try:
+            top_artists_data = await artists_task
+        except Exception as e:
+            error = upstream_error(e)
+            yield _encode_event("error", {"status": error.status_code, "detail": error.detail}, fmt)
+            return
+        raw_artists = top_artists_data.get("items", [])
+        top_artists = pipeline.shape_top_artists(raw_artists)
+        yield _encode_event("top_artists", top_artists, fmt)
+
+        try:
+            tracks_data = await tracks_task
+        except Exception as e:
+            error = upstream_error(e)
+            yield _encode_event("error", {"status": error.status_code, "detail": error.detail}, fmt)
+            return
+        raw_tracks = tracks_data.get("items", [])
+        artist_genres = await artist_store.enrich(token, raw_tracks, raw_artists)
+        tracks = pipeline.enrich_tracks(raw_tracks, pipeline.artist_genre_lookup(raw_artists, artist_genres))
+        yield _encode_event("tracks", tracks, fmt)
+
+        if include_ml:
+            for section, value in ml_engine.profile_sections(tracks, top_artists):
+                yield _encode_event(f"ml.{section}", value, fmt)
+
+        yield _encode_event("done", None, fmt)
+    finally:
+        # Client went away (or a fetch failed): stop whatever is still running.
+        for task in (tracks_task, artists_task):
+            task.cancel()
+        await asyncio.gather(tracks_task, artists_task, return_exceptions=True)
+
+
+@router.get("/data-pipeline/stream", dependencies=[Depends(admission.admit)])
+async def data_pipeline_stream(
+    request: Request,
+    time_range: str = "medium_term",
+    format: str = "ndjson",
+    include_ml: bool = False,
+):
+    """
+    Streaming /data-pipeline: emits `profile`, `top_artists`, `tracks` and,
+    with include_ml=true, one `ml.<section>` event per ML profile section,
+    then `done`. format=ndjson writes one {"event", "data"} object per line;
+    format=sse writes Server-Sent Events. Upstream failures after the first
+    event arrive as an `error` event.
+    """
+    token = extract_token(request)
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=422, detail=f"format must be one of {sorted(STREAM_MEDIA_TYPES)}")
+
+    tracks_task = asyncio.create_task(spotify_client.get_top_tracks(token, time_range=time_range))
+    artists_task = asyncio.create_task(spotify_client.get_top_artists(token, time_range=time_range))
+
+    # The profile arrives first (the other fetches resolve the user through
+    # it), so a bad token still gets a proper status code instead of a stream.
+    try:
+        profile = await spotify_client.get_user_profile(token)
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Spotify API error: {e}")
-
-    enriched = []
-    for track in tracks_data["items"]:
-        # Collect all genres from all artists on the track
-        genres: list[str] = []
-        for a in track["artists"]:
-            genres.extend(artist_genres.get(a["id"], []))
-        genres = list(dict.fromkeys(genres))  # deduplicate, preserve order
-
-        enriched.append({
-            "id": track.get("id", ""),
-            "name": track.get("name", ""),
-            "artists": [a["name"] for a in track["artists"]],
-            "album": track["album"]["name"],
-            "release_date": track["album"].get("release_date", ""),
-            "popularity": track.get("popularity", 0),
-            "explicit": track.get("explicit", False),
-            "preview_url": track.get("preview_url"),
-            "image": track["album"]["images"][0]["url"] if track["album"].get("images") else None,
-            "genres": genres,
-        })
+        for task in (tracks_task, artists_task):
+            task.cancel()
+        await asyncio.gather(tracks_task, artists_task, return_exceptions=True)
+        raise upstream_error(e)
 
-    return {
-        "profile": profile,
-        "tracks": enriched,
-        "top_artists": [
-            {
-                "id": a.get("id", ""),
-                "name": a.get("name", ""),
-                "genres": a.get("genres", []),
-                "popularity": a.get("popularity", 0),
-                "image": a["images"][0]["url"] if a.get("images") else None,
-            }
-            for a in top_artists_data["items"]
-        ],
-    }
+    return StreamingResponse(
+        _pipeline_events(token, profile, tracks_task, artists_task, format, include_ml),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
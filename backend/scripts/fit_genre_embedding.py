@@ -0,0 +1,38 @@
+"""
+Fit the global genre embedding used by ml_engine.taste_map.
+
+    python -m scripts.fit_genre_embedding artists.jsonl data/genre_embedding
+
+`artists.jsonl` holds one Spotify artist object (at least {"genres": [...]})
+per line. Point GENRE_EMBEDDING_PATH at the output prefix to use it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+from services import genre_embedding
+
+
+def _read_artists(path: str):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit the global genre embedding for the taste map.")
+    parser.add_argument("artists", help="JSONL file of artist objects")
+    parser.add_argument("prefix", help="output path prefix (writes <prefix>.npy and <prefix>.json)")
+    args = parser.parse_args()
+
+    embedding = genre_embedding.fit(_read_artists(args.artists))
+    os.makedirs(os.path.dirname(args.prefix) or ".", exist_ok=True)
+    embedding.save(args.prefix)
+    print(f"Wrote {len(embedding.genres)} genres to {args.prefix}.npy / {args.prefix}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Shared artist → genres/popularity knowledge.
+
+Spotify only attaches genres to artist objects, and a user's top tracks
+often credit featured or secondary artists who are not among their top
+artists. Every top-artists response is written into this store, and so is
+every artist fetched for enrichment, so it fills up with traffic. It is
+persisted in SQLite (WAL) so every worker and every restart shares it, with
+an LRU of hot entries in memory in front. The memory LRU is updated first
+and SQLite reads and writes run in worker threads, so a busy database never
+blocks the event loop.
+
+enrich() returns genres for the track artists a user's own top artists do
+not cover. Ids the store does not know (or knows only from more than
+ARTIST_TTL ago) are fetched through the batch /v1/artists endpoint by
+ArtistBatcher, which merges ids from concurrent requests into calls of up to
+50 ids sent at most ARTIST_BATCH_WINDOW after the first id is queued. That
+endpoint is restricted for Spotify apps created after Nov 2024: on 403,
+lookups stop for ARTIST_BATCH_RETRY_AFTER seconds and enrichment uses
+whatever the store already knows, stale entries included.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import marshal
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import httpx
+
+from services import deadline, metrics, spotify_client
+from services.concurrency import in_background
+
+logger = logging.getLogger(__name__)
+
+ARTIST_DB_PATH = os.getenv("ARTIST_DB_PATH", "artists.sqlite3")
+# Genres change slowly; refetch an artist at most this often.
+ARTIST_TTL = float(os.getenv("ARTIST_TTL", str(30 * 24 * 3600)))
+MEMORY_ENTRIES = int(os.getenv("ARTIST_MEMORY_ENTRIES", "100000"))
+ARTIST_BATCH_WINDOW = float(os.getenv("ARTIST_BATCH_WINDOW", "0.02"))
+ARTIST_BATCH_RETRY_AFTER = float(os.getenv("ARTIST_BATCH_RETRY_AFTER", "3600"))
+# Spotify's maximum for GET /v1/artists.
+ARTIST_BATCH_SIZE = 50
+# Bound parameters per SELECT ... IN (...), well under SQLite's limit.
+_SQL_CHUNK = 500
+
+_store: ArtistStore | None = None
+_restricted_until = 0.0
+_stats = {"enriched": 0, "fetched": 0, "not_found": 0, "failed": 0, "restricted": 0}
+
+# artist_id → (genres, popularity, updated_at)
+Entry = tuple[list[str], int, float]
+
+
+class ArtistStore:
+    def __init__(self, path: str = ARTIST_DB_PATH):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artists ("
+            " artist_id TEXT PRIMARY KEY,"
+            " genres BLOB NOT NULL,"
+            " popularity INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._memory: OrderedDict[str, Entry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Rows in the table: counted once here, then kept up to date by write()
+        # (rows added by other workers since opening are not seen).
+        (self.known,) = self._conn.execute("SELECT COUNT(*) FROM artists").fetchone()
+        # write() runs in worker threads and transactions cannot interleave
+        # on one connection.
+        self._write_lock = threading.Lock()
+
+    def _remember(self, artist_id: str, entry: Entry) -> None:
+        self._memory[artist_id] = entry
+        self._memory.move_to_end(artist_id)
+        if len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def get_many(self, artist_ids: list[str]) -> dict[str, Entry]:
+        """Known entries for `artist_ids`, fresh or not."""
+        found, missing = self._lookup(artist_ids)
+        self._found(found, self.load(missing), len(artist_ids))
+        return found
+
+    async def get_many_async(self, artist_ids: list[str]) -> dict[str, Entry]:
+        """get_many() with the SQLite read in a worker thread."""
+        found, missing = self._lookup(artist_ids)
+        loaded = await asyncio.to_thread(self.load, missing) if missing else {}
+        self._found(found, loaded, len(artist_ids))
+        return found
+
+    def _lookup(self, artist_ids: list[str]) -> tuple[dict[str, Entry], list[str]]:
+        found: dict[str, Entry] = {}
+        missing = []
+        for artist_id in artist_ids:
+            entry = self._memory.get(artist_id)
+            if entry is None:
+                missing.append(artist_id)
+            else:
+                self._memory.move_to_end(artist_id)
+                found[artist_id] = entry
+        return found, missing
+
+    def _found(self, found: dict[str, Entry], loaded: dict[str, Entry], requested: int) -> None:
+        for artist_id, entry in loaded.items():
+            self._remember(artist_id, entry)
+            found[artist_id] = entry
+        self.hits += len(found)
+        self.misses += requested - len(found)
+
+    def load(self, artist_ids: list[str]) -> dict[str, Entry]:
+        """Entries for `artist_ids` read from SQLite (no memory access)."""
+        loaded: dict[str, Entry] = {}
+        for i in range(0, len(artist_ids), _SQL_CHUNK):
+            chunk = artist_ids[i:i + _SQL_CHUNK]
+            rows = self._conn.execute(
+                "SELECT artist_id, genres, popularity, updated_at FROM artists"
+                f" WHERE artist_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for artist_id, genres, popularity, updated_at in rows:
+                loaded[artist_id] = (marshal.loads(genres), popularity, updated_at)
+        return loaded
+
+    def put_many(self, artists: list[dict], now: float | None = None) -> None:
+        """Upsert Spotify artist objects; unchanged, recently written ones are skipped."""
+        rows = self.stage(artists, now)
+        if rows:
+            self.write(rows)
+
+    def stage(self, artists: list[dict], now: float | None = None) -> list[tuple]:
+        """
+        Put artist objects into memory. Returns the rows still to be written
+        to SQLite: unchanged, recently written artists are skipped.
+        """
+        now = time.time() if now is None else now
+        rows = []
+        for artist in artists:
+            genres = artist.get("genres") or []
+            popularity = artist.get("popularity") or 0
+            known = self._memory.get(artist["id"])
+            if known is not None and known[:2] == (genres, popularity) and now - known[2] < ARTIST_TTL / 2:
+                continue
+            self._remember(artist["id"], (genres, popularity, now))
+            rows.append((artist["id"], marshal.dumps(genres), popularity, now))
+        return rows
+
+    def write(self, rows: list[tuple]) -> None:
+        inserted = 0
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for artist_id, genres, popularity, updated_at in rows:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO artists (artist_id, genres, popularity, updated_at) VALUES (?, ?, ?, ?)",
+                        (artist_id, genres, popularity, updated_at),
+                    )
+                    if cursor.rowcount:
+                        inserted += 1
+                    else:
+                        self._conn.execute(
+                            "UPDATE artists SET genres = ?, popularity = ?, updated_at = ? WHERE artist_id = ?",
+                            (genres, popularity, updated_at, artist_id),
+                        )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.known += inserted
+
+    def stats(self) -> dict:
+        return {"known": self.known, "memory_entries": len(self._memory), "hits": self.hits, "misses": self.misses}
+
+
+def get_store() -> ArtistStore:
+    """The process-wide store backed by ARTIST_DB_PATH, opened on first use."""
+    global _store
+    if _store is None:
+        _store = ArtistStore(ARTIST_DB_PATH)
+    return _store
+
+
+class ArtistBatcher:
+    """
+    Merges artist lookups from concurrent callers into batch fetches of at
+    most `batch_size` ids. A batch is sent as soon as it is full, or
+    `window` seconds after its first id was queued. Ids already queued or in
+    flight are shared, not requested twice.
+
+    `fetch(access_token, ids)` returns the artist objects (or None) for
+    `ids`. Artist data is the same for every user, so a batch goes out with
+    the token of its latest caller, and is retried with the tokens of its
+    other callers (up to `max_tokens` in all) when that one is rejected
+    with 401.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, list[str]], Awaitable[list[dict | None]]],
+        window: float = ARTIST_BATCH_WINDOW,
+        batch_size: int = ARTIST_BATCH_SIZE,
+        max_tokens: int = 3,
+    ):
+        self._fetch = fetch
+        self.window = window
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self._waiting: dict[str, asyncio.Future] = {}  # queued or in flight
+        self._queue: list[str] = []
+        # Tokens of the callers since the last send, oldest first.
+        self._tokens: dict[str, None] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.batches = 0
+
+    async def get(self, access_token: str, artist_ids: list[str]) -> dict[str, dict | None]:
+        """
+        Artist objects for `artist_ids` (None if Spotify does not know the
+        id). Ids whose batch failed, or is still in flight when the
+        request's deadline comes, are left out.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # State left over from a previous (closed) event loop is useless.
+            self._loop = loop
+            self._waiting.clear()
+            self._queue.clear()
+            self._tokens.clear()
+            self._timer = None
+
+        futures = []
+        for artist_id in artist_ids:
+            future = self._waiting.get(artist_id)
+            if future is None:
+                future = self._waiting[artist_id] = loop.create_future()
+                self._queue.append(artist_id)
+            futures.append((artist_id, future))
+        self._tokens.pop(access_token, None)
+        self._tokens[access_token] = None
+
+        while len(self._queue) >= self.batch_size:
+            self._send(self._queue[:self.batch_size])
+            del self._queue[:self.batch_size]
+        if not self._queue:
+            self._tokens.clear()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        if futures:
+            # Not gather(): cancelling this caller must not cancel futures
+            # other callers are waiting on too.
+            left = deadline.remaining()
+            await asyncio.wait([f for _, f in futures], timeout=None if left is None else max(left, 0))
+        return {
+            artist_id: future.result()
+            for artist_id, future in futures
+            if future.done() and not future.cancelled() and future.exception() is None
+        }
+
+    def _flush(self) -> None:
+        self._timer = None
+        while self._queue:
+            self._send(self._queue[:self.batch_size])
+            del self._queue[:self.batch_size]
+        self._tokens.clear()
+
+    def _send(self, artist_ids: list[str]) -> None:
+        self.batches += 1
+        tokens = list(reversed(self._tokens))[:self.max_tokens]  # latest first
+        task = asyncio.get_running_loop().create_task(self._run(artist_ids, tokens))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, artist_ids: list[str], tokens: list[str]) -> None:
+        error: Exception | None = None
+        artists: list[dict | None] = []
+        # The batch serves several requests; none of their deadlines applies.
+        with deadline.detached():
+            for access_token in tokens:
+                try:
+                    artists, error = await self._fetch(access_token, artist_ids), None
+                    break
+                except httpx.HTTPStatusError as e:
+                    error = e
+                    if e.response.status_code != 401:
+                        break
+                    # That caller's token expired or was revoked; try another's.
+                except Exception as e:
+                    error = e
+                    break
+        found = {a["id"]: a for a in artists if a}
+
+        for artist_id in artist_ids:
+            future = self._waiting.pop(artist_id, None)
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(found.get(artist_id))
+
+
+async def _fetch_artists(access_token: str, artist_ids: list[str]) -> list[dict | None]:
+    """One batch /v1/artists call; results (and misses) go into the store."""
+    global _restricted_until
+    try:
+        response = await spotify_client.get_artists(access_token, artist_ids)
+    except httpx.HTTPStatusError as e:
+        _stats["failed"] += 1
+        if e.response.status_code == 403:
+            _stats["restricted"] += 1
+            _restricted_until = time.time() + ARTIST_BATCH_RETRY_AFTER
+            logger.info("batch artist lookups are restricted; using stored genres only")
+        raise
+    except Exception:
+        _stats["failed"] += 1
+        raise
+
+    artists = response.get("artists", [])
+    found = [a for a in artists if a]
+    known_ids = {a["id"] for a in found}
+    # Remember unknown ids too, so they are not asked for again until ARTIST_TTL.
+    not_found = [{"id": i, "genres": [], "popularity": 0} for i in artist_ids if i not in known_ids]
+    _put_in_background(get_store(), found + not_found)
+    _stats["fetched"] += len(found)
+    _stats["not_found"] += len(not_found)
+    return artists
+
+
+def _put_in_background(store: ArtistStore, artists: list[dict]) -> None:
+    rows = store.stage(artists)
+    if rows:
+        in_background(store.write, rows)
+
+
+_batcher = ArtistBatcher(_fetch_artists)
+
+
+async def enrich(access_token: str, tracks: list[dict], top_artists: list[dict]) -> dict[str, list[str]]:
+    """
+    artist_id → genres for artists credited on `tracks` (raw Spotify track
+    objects) but missing from `top_artists`, which are recorded in the store
+    on the way. Best effort: artists that cannot be resolved are left out.
+    """
+    with metrics.span("artist_enrichment"):
+        store = get_store()
+        _put_in_background(store, top_artists)
+
+        top_ids = {a["id"] for a in top_artists}
+        artist_ids = list(dict.fromkeys(
+            a["id"] for t in tracks for a in t.get("artists", []) if a.get("id") and a["id"] not in top_ids
+        ))
+        if not artist_ids:
+            return {}
+
+        now = time.time()
+        known = await store.get_many_async(artist_ids)
+        stale = [i for i in artist_ids if i not in known or now - known[i][2] >= ARTIST_TTL]
+        genres = {artist_id: entry[0] for artist_id, entry in known.items()}
+
+        if stale and now >= _restricted_until:
+            fetched = await _batcher.get(access_token, stale)
+            genres.update({i: (a or {}).get("genres") or [] for i, a in fetched.items()})
+
+        _stats["enriched"] += sum(1 for g in genres.values() if g)
+        return {artist_id: g for artist_id, g in genres.items() if g}
+
+
+def stats() -> dict:
+    return {
+        **get_store().stats(),
+        **_stats,
+        "batches": _batcher.batches,
+        "restricted_for_seconds": round(max(_restricted_until - time.time(), 0.0), 1),
+    }
@@ -0,0 +1,235 @@
+import asyncio
+import marshal
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+_MISSING = object()
+
+# CACHE_BACKEND=memory keeps entries in this worker only.
+# CACHE_BACKEND=sqlite shares one store between all workers on the host and
+# survives restarts, so the hit rate grows with the number of workers instead
+# of being split between them.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3")
+
+# marshal is the most compact/fast stdlib encoding for JSON-shaped data
+# (dicts, lists, str, int, float, bool, None). Its format is tied to the
+# Python version, so the interpreter's major.minor version (and the marshal
+# format) is part of every key.
+_MARSHAL_VERSION = 4
+_KEY_PREFIX = f"py{sys.version_info[0]}.{sys.version_info[1]}m{_MARSHAL_VERSION}"
+
+
+def dumps(value: Any) -> bytes:
+    return marshal.dumps(value, _MARSHAL_VERSION)
+
+
+def loads(data: bytes) -> Any:
+    return marshal.loads(data)
+
+
+class MemoryBackend:
+    """Per-process LRU store bounded by the total size of the stored bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, data = entry
+        if expires_at <= time.time():
+            self._drop(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return data
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.time() + ttl, data)
+        self._bytes += len(data)
+
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteBackend:
+    """
+    Host-wide store in a local SQLite file (WAL mode, so readers in other
+    workers never block on a writer). Entries are evicted earliest-expiry
+    first once the total payload size passes `max_bytes`.
+
+    Calls are synchronous: a primary-key lookup in a local WAL database is
+    tens of microseconds, well below the cost of handing it to a thread.
+    """
+
+    _PRUNE_EVERY = 200  # writes between size checks
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._writes = 0
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+
+    def get(self, key: str) -> bytes | None:
+        row = self._conn.execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, data, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self) -> None:
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Walk entries in expiry order until enough bytes are reclaimed.
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self._conn.execute("SELECT key, LENGTH(value) FROM cache ORDER BY expires_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        entries, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+def make_backend(max_bytes: int) -> MemoryBackend | SQLiteBackend:
+    """Build the backend selected by CACHE_BACKEND."""
+    if CACHE_BACKEND == "memory":
+        return MemoryBackend(max_bytes)
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(CACHE_SQLITE_PATH, max_bytes)
+    raise ValueError(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r} (expected 'memory' or 'sqlite')")
+
+
+class TTLCache:
+    """
+    TTL cache over a pluggable backend. Values are stored marshalled, so every
+    hit returns a fresh copy that callers are free to mutate.
+    """
+
+    def __init__(self, namespace: str, ttl: float, backend: MemoryBackend | SQLiteBackend):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: tuple) -> str:
+        return "|".join((_KEY_PREFIX, self.namespace, *map(str, key)))
+
+    def get(self, key: tuple) -> Any:
+        data = self.backend.get(self._key(key))
+        if data is None:
+            self.misses += 1
+            return _MISSING
+
+        self.hits += 1
+        return loads(data)
+
+    def set(self, key: tuple, value: Any) -> None:
+        self.backend.set(self._key(key), dumps(value), self.ttl)
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "namespace": self.namespace,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: while a call is in flight,
+    later callers await its result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls: dict[Any, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        existing = self._calls.get(key)
+        if existing is not None:
+            self.coalesced += 1
+            # shield() so one waiter being cancelled does not cancel the shared call.
+            return await asyncio.shield(existing)
+
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Any, future: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        # Mark the exception as retrieved in case every waiter was cancelled.
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Strong references to in_background() tasks until they finish.
+_background: set[asyncio.Task] = set()
+
+
+async def gather_or_cancel(*aws: Awaitable[Any]) -> list[Any]:
+    """
+    Run awaitables concurrently and return their results in order.
+
+    Unlike asyncio.gather, the first failure cancels every sibling that is
+    still running and is re-raised as-is, so callers can keep a plain
+    `except Exception` around the whole fan-out.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        # The caller itself was cancelled — take the children down with it.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    if pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # Several siblings may fail in the same tick; read every exception so none
+    # is reported as "never retrieved", then raise the first in argument order.
+    errors = [task.exception() for task in tasks if not task.cancelled()]
+    for error in errors:
+        if error is not None:
+            raise error
+
+    return [task.result() for task in tasks]
+
+
+def in_background(fn: Callable[..., Any], *args: Any) -> None:
+    """
+    Run the blocking `fn(*args)` in a worker thread without waiting for it,
+    for side effects (e.g. SQLite writes) the response does not depend on.
+    Failures are logged, never raised to the request that scheduled it.
+    """
+    async def run() -> None:
+        try:
+            await asyncio.to_thread(fn, *args)
+        except Exception:
+            logger.exception("background %s failed", getattr(fn, "__qualname__", fn))
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def drain() -> None:
+    """Wait for every in_background() task, including ones they schedule."""
+    while _background:
+        await asyncio.gather(*_background)
@@ -0,0 +1,108 @@
+"""
+Per-request deadline, carried in a contextvar so every layer below the
+route can see how much time the request has left without threading it
+through call signatures.
+
+routers.admission.admit() opens one of REQUEST_DEADLINE seconds for every
+Spotify-backed request. spotify_client bounds each upstream call and each
+wait on a shared (single-flight) fetch by the time left, the scheduler
+fails fast on a Retry-After that outlasts it, ml_pool bounds its wait the
+same way and ml_engine checks it between profile stages. Running out
+raises DeadlineExceeded, which main.py answers with 503 + Retry-After
+unless a cache had a stale copy to serve instead.
+
+Work outside a request (prefetch, warm-up) and inside pool workers has no
+deadline: remaining() is None and check() does nothing. Work shared by
+several requests runs detached() from whichever request started it.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Iterator
+
+from services import metrics
+
+# Seconds; 0 disables deadlines.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+DEADLINE_RETRY_AFTER = int(os.getenv("DEADLINE_RETRY_AFTER", "2"))
+
+# time.monotonic() by which the current request must be done.
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The current request ran out of time in `stage`."""
+
+    def __init__(self, stage: str, retry_after: int = DEADLINE_RETRY_AFTER):
+        super().__init__(f"request deadline exceeded in {stage}")
+        self.detail = "The server is too busy to answer in time, retry shortly"
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+@contextmanager
+def within(seconds: float = REQUEST_DEADLINE) -> Iterator[None]:
+    """Run the block with a deadline `seconds` from now (never past an enclosing one)."""
+    if seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    reset = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(reset)
+
+
+@contextmanager
+def detached() -> Iterator[None]:
+    """Run the block without the current request's deadline."""
+    reset = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(reset)
+
+
+def remaining() -> float | None:
+    """Seconds left for the current request, or None without a deadline."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def exceeded(stage: str) -> DeadlineExceeded:
+    metrics.inc("deadline_exceeded_total", stage=stage)
+    return DeadlineExceeded(stage)
+
+
+def check(stage: str) -> None:
+    """Raise DeadlineExceeded if the current request is already out of time."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise exceeded(stage)
+
+
+async def bounded(aw: Awaitable[Any], stage: str) -> Any:
+    """Await `aw`, cancelling it with DeadlineExceeded when time runs out."""
+    left = remaining()
+    if left is None:
+        return await aw
+    if left <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise exceeded(stage)
+    timeout = asyncio.timeout(left)
+    try:
+        async with timeout:
+            return await aw
+    except TimeoutError:
+        if not timeout.expired():
+            raise
+        raise exceeded(stage) from None
@@ -0,0 +1,222 @@
+"""
+Deep profiles: the ML profile over everything Spotify will return for a
+user instead of one page of 50 top items.
+
+Sources are every page of top tracks and top artists for the time range,
+the saved-tracks library (up to DEEP_MAX_SAVED tracks) and the last 50
+plays. The first page of each source is requested straight away; its
+`total` tells which other offsets exist, and those pages are requested
+concurrently, at most DEEP_PAGE_CONCURRENCY pages per profile in flight or
+being folded at a time (the scheduler's per-token cap applies on top).
+
+Nothing is buffered: each page is enriched as it arrives (artist_store's
+batcher merges the artist lookups of all pages in flight) and folded into
+one ml_engine.TasteAggregates, then dropped. What grows with the library is
+the set of track ids already counted, so a track that is both a top track
+and saved counts once. Top artists are kept whole (at most ~100) since
+tracks need their genres and taste_map needs the artists themselves.
+
+Results are cached per user and time range for DEEP_CACHE_TTL, and
+concurrent requests for the same profile share one collection. The
+collection runs without a request deadline: a caller that runs out of time
+gets 503 + Retry-After, but the collection carries on and fills the cache,
+so the retry is answered from it instead of starting over.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Awaitable, Callable
+
+import httpx
+
+from services import artist_store, deadline, metrics, ml_engine, ml_pool, pipeline, scheduler, spotify_client
+from services.cache import _MISSING, SingleFlight, TTLCache, make_backend
+from services.concurrency import gather_or_cancel
+
+logger = logging.getLogger(__name__)
+
+DEEP_PAGE_CONCURRENCY = int(os.getenv("DEEP_PAGE_CONCURRENCY", str(scheduler.PER_TOKEN_CONCURRENCY)))
+DEEP_MAX_SAVED = int(os.getenv("DEEP_MAX_SAVED", "10000"))
+DEEP_CACHE_TTL = float(os.getenv("DEEP_CACHE_TTL", "1800"))
+DEEP_CACHE_MAX_BYTES = int(os.getenv("DEEP_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Spotify's maximum page size for every source used here.
+PAGE_SIZE = 50
+
+_cache = TTLCache("deep_profile", ttl=DEEP_CACHE_TTL, backend=make_backend(DEEP_CACHE_MAX_BYTES))
+_flight = SingleFlight()
+_stats = {"collections": 0, "pages": 0, "tracks": 0, "sources_unavailable": 0}
+
+# offset → page response
+PageFetch = Callable[[int], Awaitable[dict]]
+
+
+def _track_contribution(track: dict, artist_genres: dict[str, list[str]]) -> ml_engine.TrackContribution:
+    """
+    ml_engine.track_contribution() of the pipeline.enrich_tracks() form of a
+    raw track, without building the display fields nothing here reads.
+    """
+    genres = dict.fromkeys(g for a in track["artists"] for g in artist_genres.get(a["id"], ()))
+    return (
+        tuple(g.lower() for g in genres),
+        track.get("popularity", 0),
+        ml_engine._decade(track["album"].get("release_date", "")),
+    )
+
+
+class _Collector:
+    """One deep profile being folded together from its pages."""
+
+    def __init__(self, access_token: str, time_range: str):
+        self.access_token = access_token
+        self.time_range = time_range
+        self.aggregates = ml_engine.TasteAggregates()
+        self.seen: set[str] = set()
+        self.counts = {"top_tracks": 0, "saved_tracks": 0, "recently_played": 0}
+        self.unavailable: list[str] = []
+        self.pages = 0
+        self._slots = asyncio.Semaphore(DEEP_PAGE_CONCURRENCY)
+        self._top_artists: asyncio.Future | None = None
+        self._lookup: dict[str, list[str]] = {}
+
+    async def run(self) -> list[dict]:
+        """Fold every source into self.aggregates; returns the top artists."""
+        token, time_range = self.access_token, self.time_range
+        self._top_artists = asyncio.ensure_future(self._collect_top_artists())
+        await gather_or_cancel(
+            self._top_artists,
+            self._paged(
+                lambda offset: spotify_client.get_top_tracks(token, time_range=time_range, offset=offset),
+                None,
+                lambda items: self._fold_tracks("top_tracks", items),
+            ),
+            self._optional("saved_tracks", self._paged(
+                lambda offset: spotify_client.get_saved_tracks(token, offset=offset),
+                DEEP_MAX_SAVED,
+                lambda items: self._fold_tracks("saved_tracks", [item.get("track") for item in items]),
+            )),
+            self._optional("recently_played", self._page(
+                lambda _: spotify_client.get_recently_played(token),
+                0,
+                lambda items: self._fold_tracks("recently_played", [item.get("track") for item in items]),
+            )),
+        )
+        return self._top_artists.result()
+
+    async def _page(self, fetch: PageFetch, offset: int, consume, bounded: bool = True) -> int:
+        """Fetch and fold one page; returns the source's `total`."""
+        # The slot is held until the page is folded, which is what bounds
+        # how many pages are in memory at once.
+        async with self._slots if bounded else contextlib.nullcontext():
+            page = await fetch(offset)
+            self.pages += 1
+            await consume(page.get("items", []))
+        return page.get("total") or 0
+
+    async def _paged(self, fetch: PageFetch, max_items: int | None, consume, bounded: bool = True) -> None:
+        total = await self._page(fetch, 0, consume, bounded)
+        if max_items is not None:
+            total = min(total, max_items)
+        await gather_or_cancel(*(
+            self._page(fetch, offset, consume, bounded) for offset in range(PAGE_SIZE, total, PAGE_SIZE)
+        ))
+
+    async def _optional(self, source: str, collect: Awaitable[None]) -> None:
+        # Saved and recently played tracks need scopes older logins may not
+        # have granted; profile without them rather than failing.
+        try:
+            await collect
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 403:
+                raise
+            logger.info("deep profile: %s unavailable (403)", source)
+            self.unavailable.append(source)
+            _stats["sources_unavailable"] += 1
+
+    async def _collect_top_artists(self) -> list[dict]:
+        token, time_range = self.access_token, self.time_range
+        pages: dict[int, list[dict]] = {}
+
+        def fetch(offset: int) -> Awaitable[dict]:
+            async def fetch_page() -> dict:
+                page = await spotify_client.get_top_artists(token, time_range=time_range, offset=offset)
+                pages[offset] = page.get("items", [])
+                return page
+            return fetch_page()
+
+        async def consume(items: list[dict]) -> None:
+            self.aggregates.update(artists=[ml_engine.artist_contribution(a) for a in items])
+
+        # Not bounded by the slots: track pages hold theirs while they wait
+        # for the top artists, and there are only a couple of these pages.
+        await self._paged(fetch, None, consume, bounded=False)
+        # Pages land in any order; keep Spotify's ranking.
+        top_artists = [a for offset in sorted(pages) for a in pages[offset]]
+        self._lookup = pipeline.artist_genre_lookup(top_artists)
+        return top_artists
+
+    async def _fold_tracks(self, source: str, tracks: list[dict | None]) -> None:
+        # Local files and removed tracks come back without an id (or as null);
+        # recent plays repeat tracks within a page.
+        new = {}
+        for track in tracks:
+            if track and track.get("id") and track["id"] not in self.seen:
+                new.setdefault(track["id"], track)
+        if not new:
+            return
+        self.seen.update(new)
+        tracks = list(new.values())
+
+        top_artists = await asyncio.shield(self._top_artists)
+        artist_genres = await artist_store.enrich(self.access_token, tracks, top_artists)
+        lookup = {**artist_genres, **self._lookup} if artist_genres else self._lookup
+        self.aggregates.update(tracks=[_track_contribution(t, lookup) for t in tracks])
+        self.counts[source] += len(tracks)
+
+
+async def _collect(access_token: str, time_range: str) -> dict:
+    collector = _Collector(access_token, time_range)
+    with metrics.span("deep_history"):
+        top_artists = await collector.run()
+
+    shaped = pipeline.shape_top_artists(top_artists)
+    result = collector.aggregates.profile()
+    result["taste_map"] = await ml_pool.run(ml_engine.taste_map, shaped)
+    result["sources"] = {
+        **collector.counts,
+        "top_artists": len(top_artists),
+        "tracks": len(collector.seen),
+        "unavailable": collector.unavailable,
+    }
+
+    _stats["collections"] += 1
+    _stats["pages"] += collector.pages
+    _stats["tracks"] += len(collector.seen)
+    return result
+
+
+async def profile(access_token: str, user_id: str, time_range: str = "medium_term") -> dict:
+    """
+    The ML profile over the user's whole available history, plus a
+    `sources` breakdown of how many distinct tracks each source added.
+    """
+    key = (user_id, time_range)
+    cached = _cache.get(key)
+    if cached is not _MISSING:
+        return cached
+
+    async def collect_and_store() -> dict:
+        # Shared by every caller and worth finishing after they give up;
+        # each caller bounds its own wait instead.
+        with deadline.detached():
+            result = await _collect(access_token, time_range)
+        _cache.set(key, result)
+        return result
+
+    return await deadline.bounded(_flight.do(key, collect_and_store), "deep_history")
+
+
+def stats() -> dict:
+    return {**_cache.stats(), **_stats, "coalesced": _flight.coalesced}
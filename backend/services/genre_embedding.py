@@ -0,0 +1,124 @@
+"""
+Global 2-D genre embedding for the taste map.
+
+The embedding is fitted offline over a large artist corpus (see
+scripts/fit_genre_embedding.py) and stored as two files:
+
+    <prefix>.npy   float32 (n_genres, 2) genre coordinates, memory-mapped at startup
+    <prefix>.json  {"genres": [...], "offset": [x, y]}
+
+An artist's position is the sum of its genres' coordinates minus the corpus
+mean projection, i.e. PCA fitted once on everyone instead of per request.
+Positions are therefore stable across users and comparable over time, and
+projecting a request is one sparse mat-vec.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Iterable
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, svds
+
+GENRE_EMBEDDING_PATH = os.getenv("GENRE_EMBEDDING_PATH")
+
+_embedding: GenreEmbedding | None = None
+_loaded = False
+
+
+class GenreEmbedding:
+    def __init__(self, genres: list[str], coords: np.ndarray, offset: np.ndarray):
+        self.genres = genres
+        self.index = {g: i for i, g in enumerate(genres)}
+        self.coords = coords
+        self.offset = offset
+
+    def artist_matrix(self, artists: list[dict]) -> tuple[sparse.csr_matrix, list[int]]:
+        """Binary artist × genre matrix over known genres, plus the rows it kept."""
+        indptr = [0]
+        indices: list[int] = []
+        kept: list[int] = []
+        for i, artist in enumerate(artists):
+            cols = {self.index[g] for g in artist.get("genres", []) if g in self.index}
+            if cols:
+                indices.extend(sorted(cols))
+                indptr.append(len(indices))
+                kept.append(i)
+        data = np.ones(len(indices), dtype=np.float32)
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(kept), len(self.genres)))
+        return matrix, kept
+
+    def project(self, artists: list[dict]) -> tuple[np.ndarray, list[int]]:
+        """2-D coordinates for the artists that have at least one known genre."""
+        matrix, kept = self.artist_matrix(artists)
+        return np.asarray(matrix @ self.coords) - self.offset, kept
+
+    def save(self, prefix: str) -> None:
+        np.save(f"{prefix}.npy", np.asarray(self.coords, dtype=np.float32))
+        with open(f"{prefix}.json", "w") as f:
+            json.dump({"genres": self.genres, "offset": [float(v) for v in self.offset]}, f)
+
+
+def load(prefix: str | None = None) -> GenreEmbedding | None:
+    """Memory-map a stored embedding. Returns None if it does not exist."""
+    prefix = prefix or GENRE_EMBEDDING_PATH
+    if not prefix or not os.path.exists(f"{prefix}.npy"):
+        return None
+
+    with open(f"{prefix}.json") as f:
+        meta = json.load(f)
+    coords = np.load(f"{prefix}.npy", mmap_mode="r")
+    return GenreEmbedding(meta["genres"], coords, np.asarray(meta["offset"], dtype=np.float64))
+
+
+def get() -> GenreEmbedding | None:
+    """The process-wide embedding from GENRE_EMBEDDING_PATH, loaded once."""
+    global _embedding, _loaded
+    if not _loaded:
+        _embedding = load()
+        _loaded = True
+    return _embedding
+
+
+def fit(artists: Iterable[dict]) -> GenreEmbedding:
+    """
+    Fit the embedding: a rank-2 PCA of the binary artist × genre matrix,
+    centred implicitly so the sparse matrix is never densified.
+    """
+    genre_index: dict[str, int] = {}
+    indptr = [0]
+    indices: list[int] = []
+    for artist in artists:
+        cols = {genre_index.setdefault(g, len(genre_index)) for g in artist.get("genres", [])}
+        if cols:
+            indices.extend(sorted(cols))
+            indptr.append(len(indices))
+
+    n_rows, n_genres = len(indptr) - 1, len(genre_index)
+    if n_rows < 3 or n_genres < 3:
+        raise ValueError("Need at least 3 artists and 3 distinct genres to fit an embedding")
+
+    matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_rows, n_genres))
+    mean = np.asarray(matrix.mean(axis=0)).ravel()
+    ones = np.ones(n_rows)
+
+    def matvec(v: np.ndarray) -> np.ndarray:
+        v = np.ravel(v)
+        return matrix @ v - ones * (mean @ v)
+
+    def rmatvec(v: np.ndarray) -> np.ndarray:
+        v = np.ravel(v)
+        return matrix.T @ v - mean * v.sum()
+
+    centred = LinearOperator((n_rows, n_genres), matvec=matvec, rmatvec=rmatvec, dtype=np.float64)
+    _, _, vt = svds(centred, k=2)
+    vt = vt[::-1]  # svds returns ascending singular values
+
+    # Same deterministic sign convention as sklearn's PCA
+    signs = np.sign(vt[np.arange(2), np.abs(vt).argmax(axis=1)])
+    vt = vt * signs[:, None]
+
+    coords = vt.T.astype(np.float32)
+    return GenreEmbedding(list(genre_index), coords, mean @ vt.T)
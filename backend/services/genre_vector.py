@@ -0,0 +1,165 @@
+"""
+Compact genre vectors over a process-wide interned genre vocabulary.
+
+A GenreVector stores parallel int32 arrays of genre ids (sorted) and counts,
+plus the display order (most frequent first). Totals, norms and entropy are
+computed once and cached, and vector–vector operations are sorted-array
+merges instead of dict scans. It also behaves as a read-only mapping of
+genre → count, so code written against the old dict vectors keeps working.
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+
+import numpy as np
+
+_INT32_MAX = np.iinfo(np.int32).max
+_INT32_MIN = np.iinfo(np.int32).min
+
+# Interned vocabulary. Ids are only meaningful inside this process — vectors
+# pickle themselves as plain {genre: count} dicts (see __reduce__).
+_VOCAB: dict[str, int] = {}
+_GENRES: list[str] = []
+# New genres are interned from worker threads too (history_store), so
+# additions are serialised. Lookups stay lock-free: a genre is appended to
+# _GENRES before its id is published in _VOCAB.
+_intern_lock = threading.Lock()
+
+
+def intern(genre: str) -> int:
+    gid = _VOCAB.get(genre)
+    if gid is None:
+        with _intern_lock:
+            gid = _VOCAB.get(genre)
+            if gid is None:
+                gid = len(_GENRES)
+                _GENRES.append(genre)
+                _VOCAB[genre] = gid
+    return gid
+
+
+def genre_name(gid: int) -> str:
+    return _GENRES[gid]
+
+
+def vocab_size() -> int:
+    return len(_GENRES)
+
+
+def counts_array(counts: list[int]) -> np.ndarray:
+    """Genre counts as int64, raising ValueError unless each fits in int32."""
+    try:
+        array = np.fromiter(counts, dtype=np.int64, count=len(counts))
+    except OverflowError:
+        array = None
+    if array is None or (len(array) and (array.max() > _INT32_MAX or array.min() < _INT32_MIN)):
+        raise ValueError("Genre counts must fit in a 32-bit integer")
+    return array
+
+
+class GenreVector(Mapping):
+    __slots__ = ("ids", "counts", "_order", "_total", "_sum_sq", "_entropy")
+
+    def __init__(self, ids: np.ndarray, counts: np.ndarray, order: np.ndarray):
+        self.ids = ids
+        self.counts = counts
+        self._order = order
+        self._total: int | None = None
+        self._sum_sq: int | None = None
+        self._entropy: float | None = None
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[tuple[str, int]]) -> GenreVector:
+        """Build from (genre, count) pairs given in display order; genres must be unique."""
+        pairs = list(pairs)
+        raw_counts = counts_array([c for _, c in pairs])
+        raw_ids = np.fromiter((intern(g) for g, _ in pairs), dtype=np.int64, count=len(pairs))
+
+        sort = np.argsort(raw_ids, kind="stable")
+        # order[k] = position in the sorted arrays of the k-th genre in display order
+        order = np.empty(len(sort), dtype=np.int32)
+        order[sort] = np.arange(len(sort), dtype=np.int32)
+        return cls(raw_ids[sort].astype(np.int32), raw_counts[sort].astype(np.int32), order)
+
+    @classmethod
+    def coerce(cls, value: GenreVector | Mapping[str, int]) -> GenreVector:
+        """Accept a GenreVector or any {genre: count} mapping."""
+        if isinstance(value, GenreVector):
+            return value
+        return cls.from_pairs(value.items())
+
+    # -- cached aggregates ---------------------------------------------------
+
+    @property
+    def total(self) -> int:
+        if self._total is None:
+            self._total = int(self.counts.sum(dtype=np.int64))
+        return self._total
+
+    @property
+    def sum_sq(self) -> int:
+        if self._sum_sq is None:
+            c = self.counts.astype(np.int64)
+            self._sum_sq = int((c * c).sum())
+        return self._sum_sq
+
+    @property
+    def norm(self) -> float:
+        return float(self.sum_sq) ** 0.5
+
+    @property
+    def entropy(self) -> float:
+        """Shannon entropy (bits) of the positive counts relative to the total."""
+        if self._entropy is None:
+            positive = self.counts[self.counts > 0]
+            if len(positive) and self.total:
+                p = positive / self.total
+                self._entropy = float(-(p * np.log2(p)).sum())
+            else:
+                self._entropy = 0.0
+        return self._entropy
+
+    def dot(self, other: GenreVector) -> int:
+        """Exact integer dot product via a merge of the sorted id arrays."""
+        _, ia, ib = np.intersect1d(self.ids, other.ids, assume_unique=True, return_indices=True)
+        return int((self.counts[ia].astype(np.int64) * other.counts[ib]).sum())
+
+    # -- read-only mapping interface -----------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[str]:
+        for gid in self.ids[self._order].tolist():
+            yield _GENRES[gid]
+
+    def __getitem__(self, genre: str) -> int:
+        gid = _VOCAB.get(genre)
+        if gid is not None:
+            pos = int(np.searchsorted(self.ids, gid))
+            if pos < len(self.ids) and self.ids[pos] == gid:
+                return int(self.counts[pos])
+        raise KeyError(genre)
+
+    def items(self) -> list[tuple[str, int]]:
+        """(genre, count) pairs, most frequent first."""
+        ids = self.ids[self._order].tolist()
+        counts = self.counts[self._order].tolist()
+        return [(_GENRES[g], c) for g, c in zip(ids, counts)]
+
+    def keys(self) -> list[str]:
+        return [_GENRES[g] for g in self.ids[self._order].tolist()]
+
+    def values(self) -> list[int]:
+        return self.counts[self._order].tolist()
+
+    def to_dict(self) -> dict[str, int]:
+        return dict(self.items())
+
+    def __reduce__(self):
+        return (GenreVector.from_pairs, (self.items(),))
+
+    def __repr__(self) -> str:
+        return f"GenreVector({self.to_dict()!r})"
@@ -0,0 +1,185 @@
+"""
+Per-user listening history: one snapshot of top tracks/artists at a time.
+
+For every (user, time_range) the store keeps the latest snapshot's items
+(as compact ml_engine contributions) plus the running TasteAggregates in
+`history_state`, and appends one row per recorded snapshot to the
+append-only `history_log`. Recording a new snapshot diffs its items
+against the previous ones and applies only the additions and removals to
+the aggregates, so history rows are cheap to produce and "how did my taste
+evolve" queries are a range scan over the log.
+"""
+from __future__ import annotations
+
+import marshal
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from services import ml_engine
+from services.concurrency import in_background
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.sqlite3")
+# Minimum seconds between recorded snapshots of the same user and range.
+MIN_INTERVAL_SECONDS = float(os.getenv("HISTORY_MIN_INTERVAL", str(6 * 3600)))
+
+_store: HistoryStore | None = None
+
+
+def _diff(old: dict[str, Any], new: dict[str, Any]) -> tuple[list, list]:
+    """(removed, added) contributions between two {item_id: contribution} maps."""
+    removed = [c for item_id, c in old.items() if new.get(item_id) != c]
+    added = [c for item_id, c in new.items() if old.get(item_id) != c]
+    return removed, added
+
+
+class HistoryStore:
+    def __init__(self, path: str = HISTORY_DB_PATH, min_interval: float = MIN_INTERVAL_SECONDS):
+        self.min_interval = min_interval
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history_state ("
+            " user_id TEXT NOT NULL,"
+            " time_range TEXT NOT NULL,"
+            " items BLOB NOT NULL,"
+            " aggregates BLOB NOT NULL,"
+            " recorded_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, time_range))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history_log ("
+            " user_id TEXT NOT NULL,"
+            " time_range TEXT NOT NULL,"
+            " recorded_at REAL NOT NULL,"
+            " added INTEGER NOT NULL,"
+            " removed INTEGER NOT NULL,"
+            " summary BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS history_log_user ON history_log (user_id, time_range, recorded_at)"
+        )
+        # (user_id, time_range) → last recorded_at seen by this worker; skips
+        # the database entirely for throttled calls.
+        self._last_recorded: dict[tuple[str, str], float] = {}
+        # record() runs in worker threads (record_in_background) and
+        # transactions cannot interleave on one connection.
+        self._write_lock = threading.Lock()
+
+    def due(self, user_id: str, time_range: str, now: float | None = None) -> bool:
+        """Whether a snapshot for this user/range would be recorded now."""
+        now = time.time() if now is None else now
+        return now - self._last_recorded.get((user_id, time_range), 0.0) >= self.min_interval
+
+    def record(
+        self,
+        user_id: str,
+        time_range: str,
+        tracks: list[dict],
+        top_artists: list[dict],
+        now: float | None = None,
+    ) -> dict[str, Any] | None:
+        """
+        Record a snapshot from enriched pipeline tracks/artists. Returns the
+        new history row, or None when throttled by min_interval.
+        """
+        now = time.time() if now is None else now
+        if not self.due(user_id, time_range, now):
+            return None
+
+        new_items = {
+            "artists": {a["id"]: ml_engine.artist_contribution(a) for a in top_artists},
+            "tracks": {t["id"]: ml_engine.track_contribution(t) for t in tracks},
+        }
+
+        with self._write_lock:
+            return self._record(user_id, time_range, new_items, now)
+
+    def _record(self, user_id: str, time_range: str, new_items: dict[str, Any], now: float) -> dict[str, Any] | None:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT items, aggregates, recorded_at FROM history_state WHERE user_id = ? AND time_range = ?",
+                (user_id, time_range),
+            ).fetchone()
+            if row is not None and now - row[2] < self.min_interval:
+                # Another worker recorded it first.
+                self._conn.execute("COMMIT")
+                self._last_recorded[(user_id, time_range)] = row[2]
+                return None
+
+            if row is None:
+                old_items = {"artists": {}, "tracks": {}}
+                aggregates = ml_engine.TasteAggregates()
+            else:
+                old_items = marshal.loads(row[0])
+                aggregates = ml_engine.TasteAggregates.from_state(marshal.loads(row[1]))
+
+            removed_artists, added_artists = _diff(old_items["artists"], new_items["artists"])
+            removed_tracks, added_tracks = _diff(old_items["tracks"], new_items["tracks"])
+            aggregates.update(removed_artists, removed_tracks, sign=-1)
+            aggregates.update(added_artists, added_tracks)
+
+            summary = {
+                **aggregates.profile(top=5),
+                "genre_counts": dict(aggregates.genre_counts),
+            }
+            added = len(added_artists) + len(added_tracks)
+            removed = len(removed_artists) + len(removed_tracks)
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO history_state (user_id, time_range, items, aggregates, recorded_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (user_id, time_range, marshal.dumps(new_items), marshal.dumps(aggregates.to_state()), now),
+            )
+            self._conn.execute(
+                "INSERT INTO history_log (user_id, time_range, recorded_at, added, removed, summary)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, time_range, now, added, removed, marshal.dumps(summary)),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        self._last_recorded[(user_id, time_range)] = now
+        return {"recorded_at": now, "added": added, "removed": removed, **summary}
+
+    def history(
+        self,
+        user_id: str,
+        time_range: str,
+        since: float = 0.0,
+        limit: int = 100,
+    ) -> list[dict[str, Any]]:
+        """Recorded snapshots for a user/range, oldest first (the most recent `limit`)."""
+        rows = self._conn.execute(
+            "SELECT recorded_at, added, removed, summary FROM history_log"
+            " WHERE user_id = ? AND time_range = ? AND recorded_at >= ?"
+            " ORDER BY recorded_at DESC LIMIT ?",
+            (user_id, time_range, since, limit),
+        ).fetchall()
+        return [
+            {"recorded_at": recorded_at, "added": added, "removed": removed, **marshal.loads(summary)}
+            for recorded_at, added, removed, summary in reversed(rows)
+        ]
+
+
+def get_store() -> HistoryStore:
+    """The process-wide store backed by HISTORY_DB_PATH, opened on first use."""
+    global _store
+    if _store is None:
+        _store = HistoryStore(HISTORY_DB_PATH)
+    return _store
+
+
+def record_in_background(user_id: str, time_range: str, tracks: list[dict], top_artists: list[dict]) -> None:
+    """
+    Record a snapshot off the event loop (a write can wait out the SQLite
+    busy timeout). Responses never wait for it; failures are only logged.
+    """
+    store = get_store()
+    if store.due(user_id, time_range):
+        in_background(store.record, user_id, time_range, tracks, top_artists)
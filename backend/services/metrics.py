@@ -0,0 +1,215 @@
+"""
+In-process request metrics, rendered in the Prometheus text format.
+
+span(name) times a block of code: the duration goes into the
+`stage_duration_seconds` histogram and, when Server-Timing is on, into the
+current request's header. middleware.MetricsMiddleware opens a per-request
+span list and records `http_request_duration_seconds`; spotify_client
+records every upstream attempt's status in `spotify_responses_total`.
+
+Work done in the ML process pool runs under capture(), which returns the
+spans to the parent, where record_spans() replays them as if they had run
+in the request (see ml_pool.run).
+
+With METRICS_ENABLED=0, span() returns a shared no-op context manager and
+nothing is recorded. Counters are plain ints updated from the event loop
+(and occasionally a threadpool thread); they are not locked, so a rare lost
+increment is possible and accepted.
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+SERVER_TIMING_ENABLED = METRICS_ENABLED and os.getenv("SERVER_TIMING", "0") not in ("0", "false", "False")
+
+# Seconds; spans from ~100µs ML stages up to slow upstream calls.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+# Spans of the current request (or pool job): [(name, description, seconds)].
+_spans: ContextVar[list[tuple[str, str, float]] | None] = ContextVar("metrics_spans", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# name → {sorted label pairs: series}
+_histograms: dict[str, dict[Labels, Histogram]] = {}
+_counters: dict[str, dict[Labels, int]] = {}
+_help = {
+    "http_request_duration_seconds": "Time to serve a request, by route template and status.",
+    "stage_duration_seconds": "Time spent in a named stage (Spotify call, ML step, rendering).",
+    "spotify_responses_total": "Upstream Spotify attempts by endpoint and status (error = transport failure).",
+    "admission_wait_seconds": "Time requests queued for an endpoint slot.",
+    "admission_shed_total": "Requests refused with 503 by endpoint and reason (queue_full, timeout).",
+    "deadline_exceeded_total": "Requests that ran out of their deadline, by the stage they were in.",
+    "stale_served_total": "Expired cache entries served because fresh data could not be had in time.",
+}
+# name → callable returning a flat dict of numbers, rendered as gauges.
+_collectors: dict[str, Callable[[], dict]] = {}
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    if not METRICS_ENABLED:
+        return
+    series = _histograms.setdefault(name, {})
+    key = tuple(sorted(labels.items()))
+    histogram = series.get(key)
+    if histogram is None:
+        histogram = series[key] = Histogram()
+    histogram.observe(value)
+
+
+def inc(name: str, amount: int = 1, **labels: str) -> None:
+    if not METRICS_ENABLED:
+        return
+    series = _counters.setdefault(name, {})
+    key = tuple(sorted(labels.items()))
+    series[key] = series.get(key, 0) + amount
+
+
+def register_collector(prefix: str, collect: Callable[[], dict]) -> None:
+    """Expose `collect()`'s numeric values as `<prefix>_<key>` gauges on /metrics."""
+    _collectors[prefix] = collect
+
+
+def _finish(name: str, description: str, seconds: float) -> None:
+    observe("stage_duration_seconds", seconds, stage=f"{name}:{description}" if description else name)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, description, seconds))
+
+
+class _Span:
+    __slots__ = ("name", "description", "start")
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _finish(self.name, self.description, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, description: str = ""):
+    """
+    Context manager timing one stage. The histogram label is "name" or
+    "name:description"; Server-Timing shows `description` as desc.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(name, description)
+
+
+@contextmanager
+def request_spans() -> Iterator[list[tuple[str, str, float]] | None]:
+    """Collect the spans of one request (middleware); yields None when disabled."""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    spans: list[tuple[str, str, float]] = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def capture() -> list[tuple[str, str, float]]:
+    """Start collecting spans in this context (pool workers); returns the list."""
+    spans: list[tuple[str, str, float]] = []
+    _spans.set(spans)
+    return spans
+
+
+def record_spans(spans: list[tuple[str, str, float]]) -> None:
+    """Replay spans captured elsewhere (a pool worker) into this process."""
+    for name, description, seconds in spans:
+        _finish(name, description, seconds)
+
+
+def server_timing(spans: list[tuple[str, str, float]], total: float) -> str:
+    """Server-Timing header value: one entry per span plus the total."""
+    entries = [
+        f'{name};dur={seconds * 1000:.2f}' + (f';desc="{description}"' if description else "")
+        for name, description, seconds in spans
+    ]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+# -- exposition ------------------------------------------------------------------
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines: list[str] = []
+    for name, series in _histograms.items():
+        lines.append(f"# HELP {name} {_help.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series.items():
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    for name, series in _counters.items():
+        lines.append(f"# HELP {name} {_help.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series.items():
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+    for prefix, collect in _collectors.items():
+        for key, value in collect().items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,372 @@
+"""
+Vectorised profile engine for many users at once (nightly recompute,
+"wrapped"-style emails). Produces exactly what ml_engine.build_profile
+returns for each user, but computes genre vectors, archetype scores,
+diversity, mainstream and era histograms as NumPy/SciPy array operations
+over a shared genre vocabulary.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Mapping
+
+import numpy as np
+from scipy import sparse
+
+from services import ml_engine
+
+_YEAR = re.compile(r"(\d{4})")
+# group_compatibility: largest dense genre × member matrix worth building.
+DENSE_TRANSPOSE_BYTES = 64 * 1024 * 1024
+
+
+def _group_bounds(rows: np.ndarray, n_groups: int) -> np.ndarray:
+    """Start offsets of each group in a row-sorted array (length n_groups + 1)."""
+    return np.searchsorted(rows, np.arange(n_groups + 1))
+
+
+def _unique_pairs(rows: np.ndarray, cols: np.ndarray, weights: np.ndarray, n_cols: int):
+    """
+    Collapse duplicate (row, col) entries. Returns unique rows/cols, summed
+    weights and the position at which each pair was first seen.
+    """
+    keys = rows.astype(np.int64) * n_cols + cols
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    summed = np.bincount(inverse, weights=weights, minlength=len(uniq))
+    return uniq // n_cols, uniq % n_cols, summed, first
+
+
+class _Interner(dict):
+    """raw genre → vocabulary id, lowercasing each distinct raw string once."""
+
+    def __init__(self):
+        super().__init__()
+        self.vocab: dict[str, int] = {}
+
+    def __missing__(self, raw: str) -> int:
+        gid = self[raw] = self.vocab.setdefault(raw.lower(), len(self.vocab))
+        return gid
+
+
+def _genre_matrix(users: list[dict]):
+    """
+    Sparse user × genre count matrix in the same weighting as
+    ml_engine.build_genre_vector (artist genres ×2, track genres ×1).
+    """
+    interner = _Interner()
+    rows: list[int] = []
+    cols: list[int] = []
+    weights: list[int] = []
+
+    for u, user in enumerate(users):
+        artist_ids = [interner[g] for a in user.get("top_artists", []) for g in a.get("genres", [])]
+        track_ids = [interner[g] for t in user.get("tracks", []) for g in t.get("genres", [])]
+        cols += artist_ids
+        cols += track_ids
+        rows += [u] * (len(artist_ids) + len(track_ids))
+        weights += [2] * len(artist_ids)
+        weights += [1] * len(track_ids)
+
+    genres = list(interner.vocab)
+    n_genres = max(len(genres), 1)
+    u_rows, u_cols, counts, first = _unique_pairs(
+        np.asarray(rows, dtype=np.int64),
+        np.asarray(cols, dtype=np.int64),
+        np.asarray(weights, dtype=np.float64),
+        n_genres,
+    )
+    matrix = sparse.csr_matrix((counts, (u_rows, u_cols)), shape=(len(users), n_genres))
+    return genres, matrix, u_rows, u_cols, counts, first
+
+
+def _archetype_weights(genres: list[str]) -> np.ndarray:
+    """Genre × archetype matrix: 1.0 for an exact keyword, 0.5 for a partial match."""
+    index = ml_engine._ARCHETYPE_INDEX
+    weights = np.zeros((max(len(genres), 1), len(index.archetypes)))
+    for g, genre in enumerate(genres):
+        exact, partial = index.match(genre)
+        weights[g, list(exact)] = 1.0
+        weights[g, list(partial)] = 0.5
+    return weights
+
+
+class _Decades(dict):
+    """release_date → decade (or -1), parsed like ml_engine.era_analysis."""
+
+    def __missing__(self, release_date: str) -> int:
+        match = _YEAR.match(release_date)
+        decade = self[release_date] = (int(match.group(1)) // 10) * 10 if match else -1
+        return decade
+
+
+def _era_histograms(users: list[dict]):
+    """Per-user decade counts, keeping the first-seen order within each user."""
+    parse = _Decades()
+    rows: list[int] = []
+    decades: list[int] = []
+    for u, user in enumerate(users):
+        user_decades = [parse[t.get("release_date", "")] for t in user.get("tracks", [])]
+        decades += user_decades
+        rows += [u] * len(user_decades)
+
+    rows_arr = np.asarray(rows, dtype=np.int64)
+    decades_arr = np.asarray(decades, dtype=np.int64)
+    dated = decades_arr >= 0
+    decade_values, decade_cols = np.unique(decades_arr[dated], return_inverse=True)
+    u_rows, u_cols, counts, first = _unique_pairs(
+        rows_arr[dated],
+        decade_cols.astype(np.int64),
+        np.ones(int(dated.sum())),
+        max(len(decade_values), 1),
+    )
+    return decade_values, u_rows, u_cols, counts, first
+
+
+def _mainstream_stats(users: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    rows: list[int] = []
+    pops: list[int] = []
+    for u, user in enumerate(users):
+        user_pops = [p for t in user.get("tracks", []) if (p := t.get("popularity", 0)) > 0]
+        pops += user_pops
+        rows += [u] * len(user_pops)
+
+    rows_arr = np.asarray(rows, dtype=np.int64)
+    sums = np.bincount(rows_arr, weights=np.asarray(pops, dtype=np.float64), minlength=len(users))
+    lens = np.bincount(rows_arr, minlength=len(users))
+    return sums, lens
+
+
+def build_profiles_batch(users: list[dict], include_taste_map: bool = True) -> list[dict[str, Any]]:
+    """
+    Run the full profile pipeline for many users.
+
+    `users` is a list of {"tracks": [...], "top_artists": [...]} dicts, the
+    same inputs build_profile takes. Returns one profile per user, in order.
+    taste_map is a per-user PCA and stays per-user; pass
+    include_taste_map=False to skip it for jobs that do not render the chart.
+    """
+    n_users = len(users)
+    if not n_users:
+        return []
+
+    genres, matrix, g_rows, g_cols, g_counts, g_first = _genre_matrix(users)
+
+    # Genre totals and unique counts per user
+    totals = np.asarray(matrix.sum(axis=1)).ravel()
+    uniques = np.diff(matrix.indptr)
+
+    # Archetypes: one sparse × dense product over the whole batch
+    raw_scores = matrix @ _archetype_weights(genres)
+    arch_scores = raw_scores / np.where(totals > 0, totals, 1)[:, None]
+    best = arch_scores.argmax(axis=1)
+    best_score = arch_scores[np.arange(n_users), best]
+
+    # Diversity: Shannon entropy per user; scored by ml_engine's thresholds
+    p = g_counts / totals[g_rows]
+    entropy = -np.bincount(g_rows, weights=p * np.log2(p), minlength=n_users)
+
+    # Top genres: order by count desc, then first appearance (Counter.most_common)
+    order = np.lexsort((g_first, -g_counts, g_rows))
+    g_bounds = _group_bounds(g_rows[order], n_users)
+    g_pct = g_counts / np.where(totals > 0, totals, 1)[g_rows] * 100
+
+    pop_sums, pop_lens = _mainstream_stats(users)
+    decade_values, e_rows, e_cols, e_counts, e_first = _era_histograms(users)
+    e_bounds = _group_bounds(e_rows, n_users)
+
+    archetypes = ml_engine._ARCHETYPE_INDEX.archetypes
+
+    profiles = []
+    for u, user in enumerate(users):
+        if uniques[u]:
+            arch = archetypes[best[u]]
+            archetype = {
+                "name": arch["name"],
+                "emoji": arch["emoji"],
+                "description": arch["description"],
+                "top_genres": list(arch["genres"])[:4],
+                "confidence": round(min(float(best_score[u]) * 100, 100), 1),
+            }
+        else:
+            archetype = ml_engine.get_archetype({})
+
+        top = order[g_bounds[u]:g_bounds[u + 1]][:12]
+        top_genres = [
+            {
+                "genre": genres[g_cols[i]],
+                "count": int(g_counts[i]),
+                "pct": round(float(g_pct[i]), 1),
+            }
+            for i in top
+        ]
+
+        start, end = e_bounds[u], e_bounds[u + 1]
+        if start == end:
+            era = {
+                "dominant_decade": "Unknown",
+                "distribution": {},
+                "description": "Not enough release date data.",
+            }
+        else:
+            labels = [f"{decade_values[c]}s" for c in e_cols[start:end]]
+            counts = e_counts[start:end]
+            total = float(counts.sum())
+            # Ties go to the decade seen first, as with Counter.most_common
+            dominant = labels[min(range(end - start), key=lambda i: (-counts[i], e_first[start + i]))]
+            era = {
+                "dominant_decade": dominant,
+                "distribution": {
+                    label: round((int(count) / total) * 100)
+                    for label, count in sorted(zip(labels, counts))
+                },
+                "description": f"Most of your listening lives in the {dominant}.",
+            }
+
+        profiles.append({
+            "archetype": archetype,
+            "mainstream": ml_engine._mainstream_from_sums(int(pop_sums[u]), int(pop_lens[u])),
+            "era": era,
+            "diversity": (
+                ml_engine._diversity_from_entropy(int(uniques[u]), float(entropy[u]))
+                if uniques[u] else ml_engine.diversity_score({})
+            ),
+            "top_genres": top_genres,
+            "taste_map": ml_engine.taste_map(user.get("top_artists", [])) if include_taste_map else [],
+        })
+
+    return profiles
+
+
+def _extreme_pairs(scores: np.ndarray, comparable: np.ndarray, k: int, largest: bool) -> list[tuple[int, int, float]]:
+    """
+    The k (i, j, score) pairs, i < j, with the highest/lowest score among
+    comparable members of the symmetric `scores` matrix.
+
+    Each pair sits in two rows, so the top k pairs all lie in the 2k rows
+    with the best row extremes: only those rows are searched. The diagonal
+    and incomparable rows/columns are masked in place and restored after.
+    """
+    n = len(scores)
+    m = int(comparable.sum())
+    k = min(k, m * (m - 1) // 2)
+    if k <= 0:
+        return []
+
+    fill = -np.inf if largest else np.inf
+    diagonal = scores.diagonal().copy()
+    excluded = np.flatnonzero(~comparable)
+    np.fill_diagonal(scores, fill)
+    scores[excluded, :] = fill
+    scores[:, excluded] = fill
+    try:
+        extremes = scores.max(axis=1) if largest else scores.min(axis=1)
+        rows = np.argsort(-extremes if largest else extremes, kind="stable")[:2 * k]
+        values = scores[rows].ravel()
+    finally:
+        scores[excluded, :] = 0
+        scores[:, excluded] = 0
+        np.fill_diagonal(scores, diagonal)
+
+    i = np.repeat(rows, n)
+    j = np.tile(np.arange(n), len(rows))
+    keep = np.isfinite(values)
+    i, j, values = np.minimum(i, j)[keep], np.maximum(i, j)[keep], values[keep]
+    # Best first, ties by member position; then drop the mirrored duplicates.
+    order = np.lexsort((j, i, -values if largest else values))
+    result: list[tuple[int, int, float]] = []
+    seen: set[tuple[int, int]] = set()
+    for o in order:
+        pair = (int(i[o]), int(j[o]))
+        if pair not in seen:
+            seen.add(pair)
+            result.append((*pair, round(float(values[o]), 1)))
+            if len(result) == k:
+                break
+    return result
+
+
+def group_compatibility(
+    vectors: list[Mapping[str, int]],
+    top_pairs: int = 5,
+    top_genres: int = 12,
+    include_matrix: bool = True,
+) -> dict[str, Any]:
+    """
+    Compatibility within a group of genre vectors ({genre: count} or
+    GenreVector), as one product of the L2-normalised member × genre matrix
+    with its transpose instead of a compatibility_score() call per pair.
+    Scores agree with compatibility_score() up to float32 rounding.
+
+    Returns the group's mean pairwise score, the genres of the normalised
+    centroid ("shared taste") with how many members have each, every
+    member's fit to that centroid, the most and least compatible pairs (as
+    member positions), the positions of members without genres (left out of
+    everything else), and the full 0–100 matrix as a float32 array.
+    """
+    n = len(vectors)
+    if n < 2:
+        raise ValueError("A group needs at least two members.")
+
+    # Local vocabulary: request-supplied genres stay out of the interned one.
+    vocab: dict[str, int] = {}
+    lengths = np.fromiter((len(v) for v in vectors), dtype=np.int64, count=n)
+    nnz = int(lengths.sum())
+    cols = np.fromiter((vocab.setdefault(g, len(vocab)) for v in vectors for g in v), dtype=np.int64, count=nnz)
+    counts = np.fromiter((c for v in vectors for c in v.values()), dtype=np.float32, count=nnz)
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    matrix = sparse.csr_matrix((counts, cols, indptr), shape=(n, max(len(vocab), 1)))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+    comparable = norms > 0
+    normalised = sparse.diags(np.where(comparable, 1 / np.where(comparable, norms, 1), 0)).astype(np.float32) @ matrix
+
+    # Group scores are mostly non-zero, and sparse × dense beats sparse ×
+    # sparse by a wide margin then; fall back when the dense copy is large.
+    if normalised.shape[1] * n * 4 <= DENSE_TRANSPOSE_BYTES:
+        scores = normalised @ normalised.T.toarray()
+    else:
+        scores = (normalised @ normalised.T).toarray()
+    scores *= 100
+    np.round(scores, 1, out=scores)
+
+    # Mean pairwise cosine without touching the n × n matrix:
+    # |Σ rows|² = Σ_ij cos(i, j), and the diagonal contributes one per member.
+    m = int(comparable.sum())
+    row_sum = np.asarray(normalised.sum(axis=0), dtype=np.float64).ravel()
+    n_pairs = m * (m - 1) // 2
+    mean_cos = (row_sum @ row_sum - m) / 2 / n_pairs if n_pairs else 0.0
+
+    centroid = row_sum / max(m, 1)
+    centroid_norm = float(np.sqrt(centroid @ centroid))
+    fit = normalised @ centroid / (centroid_norm or 1) * 100
+
+    genres = list(vocab)
+    members_with = np.bincount(cols[counts > 0], minlength=len(genres))
+    top = np.argsort(-centroid, kind="stable")[:top_genres]
+    centroid_total = centroid.sum() or 1
+    shared_genres = [
+        {
+            "genre": genres[g],
+            "weight": round(float(centroid[g] / centroid_total * 100), 1),
+            "members": int(members_with[g]),
+        }
+        for g in top
+        if centroid[g] > 0
+    ]
+
+    def pairs(largest: bool) -> list[dict[str, Any]]:
+        return [
+            {"a": i, "b": j, **ml_engine.compatibility_label(score)}
+            for i, j, score in _extreme_pairs(scores, comparable, top_pairs, largest)
+        ]
+
+    return {
+        "size": n,
+        "group": ml_engine.compatibility_label(round(float(mean_cos) * 100, 1)),
+        "shared_genres": shared_genres,
+        "member_fit": [round(float(f), 1) for f in fit],
+        "most_compatible": pairs(largest=True),
+        "least_compatible": pairs(largest=False),
+        "incomparable": np.flatnonzero(~comparable).tolist(),
+        "matrix": scores if include_matrix else None,
+    }
@@ -1,9 +1,17 @@
 from __future__ import annotations
 
 import re
+import threading
 from collections import Counter
+from contextlib import contextmanager
 from math import log2
-from typing import Any
+from typing import Any, Iterator, Mapping
+
+import numpy as np
+
+from services import genre_vector as gv
+from services import deadline, metrics
+from services.genre_vector import GenreVector
 
 
 # ---------------------------------------------------------------------------
@@ -70,6 +78,143 @@ ARCHETYPES: list[dict] = [
 ]
 
 
+# ---------------------------------------------------------------------------
+# Archetype index
+# Built once at import. A genre scores full weight for an archetype that lists
+# it exactly, and half weight for one where a keyword and the genre contain
+# each other (e.g. "dark trap" / "trap"). Both lookups are precomputed, so
+# scoring a user is one pass over their genres however many archetypes exist.
+# ---------------------------------------------------------------------------
+
+class _KeywordAutomaton:
+    """Aho–Corasick automaton: which archetypes have a keyword inside `text`."""
+
+    def __init__(self, keywords: dict[str, set[int]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._out: list[set[int]] = [set()]
+
+        for keyword, archetype_ids in keywords.items():
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._out.append(set())
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state] |= archetype_ids
+
+        # Breadth-first failure links; each state inherits its fallback's outputs.
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+        self._root_out = frozenset(self._out[0])
+
+    def search(self, text: str) -> set[int]:
+        found = set(self._root_out)
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            found |= self._out[state]
+        return found
+
+
+class ArchetypeIndex:
+    """Precomputed genre → archetype matcher for a list of archetypes."""
+
+    _MEMO_SIZE = 50_000
+
+    def __init__(self, archetypes: list[dict]):
+        self.archetypes = archetypes
+
+        # keyword → archetypes listing it exactly
+        self._exact: dict[str, set[int]] = {}
+        # every substring of every keyword → archetypes owning that keyword
+        self._inside_keyword: dict[str, set[int]] = {}
+        for i, archetype in enumerate(archetypes):
+            for keyword in archetype["genres"]:
+                self._exact.setdefault(keyword, set()).add(i)
+                for start in range(len(keyword) + 1):
+                    for end in range(start, len(keyword) + 1):
+                        self._inside_keyword.setdefault(keyword[start:end], set()).add(i)
+
+        self._automaton = _KeywordAutomaton(self._exact)
+        self._memo: dict[str, tuple[tuple[int, ...], tuple[int, ...]]] = {}
+
+        # Row per interned genre id: 1.0 exact / 0.5 partial for each archetype.
+        # Filled lazily as the vocabulary grows, under a lock since profiles
+        # are also built in worker threads (history_store).
+        self._weights = np.zeros((256, len(archetypes)))
+        self._filled = 0
+        self._weights_lock = threading.Lock()
+
+    def match(self, genre: str) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        """Return (exact, partial) archetype indices for a single genre."""
+        hit = self._memo.get(genre)
+        if hit is not None:
+            return hit
+
+        exact = self._exact.get(genre, set())
+        partial = (self._automaton.search(genre) | self._inside_keyword.get(genre, set())) - exact
+        hit = (tuple(sorted(exact)), tuple(sorted(partial)))
+
+        if len(self._memo) >= self._MEMO_SIZE:
+            self._memo.clear()
+        self._memo[genre] = hit
+        return hit
+
+    def _weight_rows(self, ids: np.ndarray) -> np.ndarray:
+        size = gv.vocab_size()
+        if size > self._filled:
+            with self._weights_lock:
+                self._fill(size)
+        return self._weights[ids]
+
+    def _fill(self, size: int) -> None:
+        if size <= self._filled:
+            return
+        weights = self._weights
+        if size > len(weights):
+            weights = np.zeros((max(size, 2 * len(weights)), len(self.archetypes)))
+            weights[:self._filled] = self._weights[:self._filled]
+        for gid in range(self._filled, size):
+            exact, partial = self.match(gv.genre_name(gid))
+            weights[gid, list(exact)] = 1.0
+            weights[gid, list(partial)] = 0.5
+        # Publish the rows before the count, so lock-free readers of rows
+        # below _filled always find them filled in.
+        self._weights = weights
+        self._filled = size
+
+    def scores(self, genre_vector: GenreVector | Mapping[str, int]) -> list[float]:
+        """Weighted overlap (0–1) of the genre vector with every archetype."""
+        vector = GenreVector.coerce(genre_vector)
+        total = vector.total or 1
+        # Counts are integers and weights are 1 or 0.5, so this sum is exact.
+        acc = vector.counts.astype(np.float64) @ self._weight_rows(vector.ids)
+        return (acc / total).tolist()
+
+
+def build_archetype_index(archetypes: list[dict]) -> ArchetypeIndex:
+    """Build the matcher for `archetypes`; rebuild it if the list changes."""
+    return ArchetypeIndex(archetypes)
+
+
+_ARCHETYPE_INDEX = build_archetype_index(ARCHETYPES)
+
+
 # ---------------------------------------------------------------------------
 # Core functions
 # ---------------------------------------------------------------------------
@@ -77,9 +222,9 @@ ARCHETYPES: list[dict] = [
 def build_genre_vector(
     top_artists: list[dict],
     tracks: list[dict],
-) -> dict[str, int]:
+) -> GenreVector:
     """
-    Build a weighted genre frequency map.
+    Build a weighted genre frequency vector.
     Artist genres are weighted 2× — they are more authoritative than
     track-derived genre tags.
     Returns genres sorted by frequency (descending).
@@ -94,28 +239,10 @@ def build_genre_vector(
         for genre in track.get("genres", []):
             counts[genre.lower()] += 1
 
-    return dict(counts.most_common())
-
-
-def _archetype_score(genre_vector: dict[str, int], archetype: dict) -> float:
-    """
-    Weighted overlap between the user's genre vector and an archetype's genre set.
-    Partial string matches (e.g. "dark trap" containing "trap") count at half weight.
-    """
-    total = sum(genre_vector.values()) or 1
-    score = 0.0
-    for genre, count in genre_vector.items():
-        if genre in archetype["genres"]:
-            score += count
-        else:
-            for ag in archetype["genres"]:
-                if ag in genre or genre in ag:
-                    score += count * 0.5
-                    break
-    return score / total
+    return GenreVector.from_pairs(counts.most_common())
 
 
-def get_archetype(genre_vector: dict[str, int]) -> dict[str, Any]:
+def get_archetype(genre_vector: GenreVector | Mapping[str, int]) -> dict[str, Any]:
     """Return the best-matching archetype and confidence score (0–100)."""
     if not genre_vector:
         return {
@@ -126,11 +253,9 @@ def get_archetype(genre_vector: dict[str, int]) -> dict[str, Any]:
             "confidence": 0.0,
         }
 
-    scored = [
-        (archetype, _archetype_score(genre_vector, archetype))
-        for archetype in ARCHETYPES
-    ]
-    best, best_score = max(scored, key=lambda x: x[1])
+    scores = _ARCHETYPE_INDEX.scores(genre_vector)
+    best_i = max(range(len(scores)), key=scores.__getitem__)
+    best, best_score = _ARCHETYPE_INDEX.archetypes[best_i], scores[best_i]
 
     return {
         "name": best["name"],
@@ -144,11 +269,14 @@ def get_archetype(genre_vector: dict[str, int]) -> dict[str, Any]:
 def mainstream_score(tracks: list[dict]) -> dict[str, Any]:
     """Average track popularity with a human-readable label."""
     pops = [t.get("popularity", 0) for t in tracks if t.get("popularity", 0) > 0]
+    return _mainstream_from_sums(sum(pops), len(pops))
+
 
-    if not pops:
+def _mainstream_from_sums(popularity_sum: int, n: int) -> dict[str, Any]:
+    if not n:
         return {"score": 0, "label": "Unknown", "description": "Not enough popularity data."}
 
-    avg = round(sum(pops) / len(pops), 1)
+    avg = round(popularity_sum / n, 1)
 
     if avg >= 70:
         label, description = "Mainstream", "You're tuned into what the world is listening to right now."
@@ -160,16 +288,26 @@ def mainstream_score(tracks: list[dict]) -> dict[str, Any]:
     return {"score": avg, "label": label, "description": description}
 
 
+def _decade(release_date: str) -> str | None:
+    match = re.match(r"(\d{4})", release_date)
+    if not match:
+        return None
+    return f"{(int(match.group(1)) // 10) * 10}s"
+
+
 def era_analysis(tracks: list[dict]) -> dict[str, Any]:
     """Decade distribution of top tracks by release year."""
     decade_counts: Counter = Counter()
 
     for track in tracks:
-        match = re.match(r"(\d{4})", track.get("release_date", ""))
-        if match:
-            year = int(match.group(1))
-            decade_counts[f"{(year // 10) * 10}s"] += 1
+        decade = _decade(track.get("release_date", ""))
+        if decade:
+            decade_counts[decade] += 1
+
+    return _era_from_counts(decade_counts)
+
 
+def _era_from_counts(decade_counts: Counter) -> dict[str, Any]:
     if not decade_counts:
         return {
             "dominant_decade": "Unknown",
@@ -191,7 +329,7 @@ def era_analysis(tracks: list[dict]) -> dict[str, Any]:
     }
 
 
-def diversity_score(genre_vector: dict[str, int]) -> dict[str, Any]:
+def diversity_score(genre_vector: GenreVector | Mapping[str, int]) -> dict[str, Any]:
     """
     Composite diversity score (0–1) combining:
     - unique genre ratio (scaled to 30 genres = 1.0)
@@ -200,12 +338,13 @@ def diversity_score(genre_vector: dict[str, int]) -> dict[str, Any]:
     if not genre_vector:
         return {"score": 0.0, "label": "Unknown", "description": "No genre data available."}
 
-    total = sum(genre_vector.values())
-    unique = len(genre_vector)
+    vector = GenreVector.coerce(genre_vector)
+    return _diversity_from_entropy(len(vector), vector.entropy)
 
+
+def _diversity_from_entropy(unique: int, entropy: float) -> dict[str, Any]:
     breadth = min(unique / 30, 1.0)
 
-    entropy = -sum((c / total) * log2(c / total) for c in genre_vector.values() if c > 0)
     max_entropy = log2(unique) if unique > 1 else 1
     evenness = entropy / max_entropy if max_entropy > 0 else 0
 
@@ -223,38 +362,57 @@ def diversity_score(genre_vector: dict[str, int]) -> dict[str, Any]:
 
 def taste_map(top_artists: list[dict]) -> list[dict]:
     """
-    PCA reduction of artist genre vectors to 2D for scatter plot visualisation.
+    2D projection of artist genre vectors for scatter plot visualisation.
+    Uses the global genre embedding when one is configured (stable across
+    users), otherwise a per-request PCA of the artists' genre matrix.
     Returns a list of {name, x, y, image, genres} dicts.
     Falls back to empty list if there is insufficient data.
     """
-    import numpy as np
-    from sklearn.decomposition import PCA
+    from services import genre_embedding
 
     artists_with_genres = [a for a in top_artists if a.get("genres")]
     if len(artists_with_genres) < 2:
         return []
 
+    embedding = genre_embedding.get()
+    if embedding is not None:
+        coords, kept = embedding.project(artists_with_genres)
+        if len(kept) >= 2:
+            return _taste_map_points([artists_with_genres[i] for i in kept], coords)
+
     all_genres = sorted({g for a in artists_with_genres for g in a["genres"]})
     if len(all_genres) < 2:
         return []
 
-    # Build binary genre matrix: rows = artists, cols = genres
-    matrix = np.array(
-        [[1 if g in a["genres"] else 0 for g in all_genres] for a in artists_with_genres],
-        dtype=float,
-    )
+    # Binary genre matrix: rows = artists, cols = genres
+    col = {g: j for j, g in enumerate(all_genres)}
+    matrix = np.zeros((len(artists_with_genres), len(all_genres)))
+    for i, artist in enumerate(artists_with_genres):
+        matrix[i, [col[g] for g in artist["genres"]]] = 1.0
 
     n_components = min(2, matrix.shape[0] - 1, matrix.shape[1])
     if n_components < 1:
         return []
 
+    # PCA via a thin SVD of the centred matrix — at most 50 × a few hundred,
+    # so this is cheaper than going through sklearn.
+    centred = matrix - matrix.mean(axis=0)
     try:
-        coords = PCA(n_components=n_components).fit_transform(matrix)
-    except Exception:
+        u, s, vt = np.linalg.svd(centred, full_matrices=False)
+    except np.linalg.LinAlgError:
         return []
+    u, s, vt = u[:, :n_components], s[:n_components], vt[:n_components]
+
+    # Same deterministic sign convention as sklearn's PCA
+    signs = np.sign(vt[np.arange(n_components), np.abs(vt).argmax(axis=1)])
+    coords = u * s * signs
 
+    return _taste_map_points(artists_with_genres, coords)
+
+
+def _taste_map_points(artists: list[dict], coords) -> list[dict]:
     result = []
-    for i, artist in enumerate(artists_with_genres):
+    for i, artist in enumerate(artists):
         result.append({
             "name": artist.get("name", ""),
             "x": round(float(coords[i, 0]), 3),
@@ -265,23 +423,48 @@ def taste_map(top_artists: list[dict]) -> list[dict]:
     return result
 
 
-def compatibility_score(vector_a: dict[str, int], vector_b: dict[str, int]) -> dict[str, Any]:
+def compatibility_score(
+    vector_a: GenreVector | Mapping[str, int],
+    vector_b: GenreVector | Mapping[str, int],
+) -> dict[str, Any]:
     """
     Cosine similarity between two genre vectors, expressed as a 0–100 score.
     """
-    all_genres = set(vector_a) | set(vector_b)
-    if not all_genres:
+    if not vector_a and not vector_b:
         return {"score": 0, "label": "Incomparable", "description": "Not enough genre data to compare."}
 
-    dot = sum(vector_a.get(g, 0) * vector_b.get(g, 0) for g in all_genres)
-    mag_a = sum(v ** 2 for v in vector_a.values()) ** 0.5
-    mag_b = sum(v ** 2 for v in vector_b.values()) ** 0.5
+    if isinstance(vector_a, GenreVector) and isinstance(vector_b, GenreVector):
+        dot = vector_a.dot(vector_b)
+        mag_a = vector_a.norm
+        mag_b = vector_b.norm
+    else:
+        dot, mag_a, mag_b = _mapping_cosine_parts(vector_a, vector_b)
 
     if mag_a == 0 or mag_b == 0:
         return {"score": 0, "label": "Incomparable", "description": "Not enough genre data to compare."}
 
-    score = round((dot / (mag_a * mag_b)) * 100, 1)
+    return compatibility_label(round((dot / (mag_a * mag_b)) * 100, 1))
+
+
+def _mapping_cosine_parts(
+    vector_a: GenreVector | Mapping[str, int],
+    vector_b: GenreVector | Mapping[str, int],
+) -> tuple[int, float, float]:
+    # Plain mappings usually come from a request body: compare them as
+    # dicts so their genres never enter the interned vocabulary.
+    counts_a = gv.counts_array(list(vector_a.values())).tolist()
+    counts_b = gv.counts_array(list(vector_b.values())).tolist()
+    small, large = (vector_a, vector_b) if len(vector_a) <= len(vector_b) else (vector_b, vector_a)
+    dot = sum(count * large.get(genre, 0) for genre, count in small.items())
+    return (
+        dot,
+        float(sum(c * c for c in counts_a)) ** 0.5,
+        float(sum(c * c for c in counts_b)) ** 0.5,
+    )
+
 
+def compatibility_label(score: float) -> dict[str, Any]:
+    """Label and description for a 0–100 compatibility score."""
     if score >= 75:
         label = "Musical Soulmates"
         description = "You're practically listening to the same playlist. Uncanny."
@@ -298,25 +481,225 @@ def compatibility_score(vector_a: dict[str, int], vector_b: dict[str, int]) -> d
     return {"score": score, "label": label, "description": description}
 
 
-def build_profile(tracks: list[dict], top_artists: list[dict]) -> dict[str, Any]:
-    """Run the full ML profile pipeline for a single user."""
-    genre_vector = build_genre_vector(top_artists, tracks)
-    total_genre_weight = sum(genre_vector.values()) or 1
+@contextmanager
+def _stage(name: str) -> Iterator[None]:
+    # Out of time (inline, in a request) → stop before the next stage.
+    deadline.check(name)
+    with metrics.span(name):
+        yield
+
 
-    top_genres_list = [
+def profile_sections(
+    tracks: list[dict],
+    top_artists: list[dict],
+    genre_vector: GenreVector | None = None,
+) -> Iterator[tuple[str, Any]]:
+    """
+    Yield (section, value) for each part of the ML profile as soon as it is
+    computed, in build_profile() key order. Used to stream the profile.
+    """
+    if genre_vector is None:
+        with _stage("build_genre_vector"):
+            genre_vector = build_genre_vector(top_artists, tracks)
+    total_genre_weight = genre_vector.total or 1
+
+    with _stage("get_archetype"):
+        archetype = get_archetype(genre_vector)
+    yield "archetype", archetype
+    with _stage("mainstream_score"):
+        mainstream = mainstream_score(tracks)
+    yield "mainstream", mainstream
+    with _stage("era_analysis"):
+        era = era_analysis(tracks)
+    yield "era", era
+    with _stage("diversity_score"):
+        diversity = diversity_score(genre_vector)
+    yield "diversity", diversity
+    yield "top_genres", [
         {
             "genre": genre,
             "count": count,
             "pct": round(count / total_genre_weight * 100, 1),
         }
-        for genre, count in list(genre_vector.items())[:12]
+        for genre, count in genre_vector.items()[:12]
     ]
+    with _stage("taste_map"):
+        points = taste_map(top_artists)
+    yield "taste_map", points
+
+
+def build_profile(
+    tracks: list[dict],
+    top_artists: list[dict],
+    genre_vector: GenreVector | None = None,
+) -> dict[str, Any]:
+    """
+    Run the full ML profile pipeline for a single user.
+    Pass `genre_vector` if the caller already built it from the same data.
+    """
+    return dict(profile_sections(tracks, top_artists, genre_vector))
+
+
+def _mean_decade(distribution: dict[str, int]) -> float | None:
+    """Percentage-weighted mean of an era distribution, in years."""
+    total = sum(distribution.values())
+    if not total:
+        return None
+    return sum(int(decade[:-1]) * pct for decade, pct in distribution.items()) / total
+
+
+def profile_drift(
+    earlier: dict[str, Any],
+    later: dict[str, Any],
+    earlier_vector: GenreVector | Mapping[str, int],
+    later_vector: GenreVector | Mapping[str, int],
+) -> dict[str, Any]:
+    """
+    How taste moved between two profiles of the same user (e.g. long_term →
+    short_term): genre vector cosine, archetype change and era shift.
+    """
+    earlier_era = _mean_decade(earlier["era"]["distribution"])
+    later_era = _mean_decade(later["era"]["distribution"])
 
     return {
-        "archetype": get_archetype(genre_vector),
-        "mainstream": mainstream_score(tracks),
-        "era": era_analysis(tracks),
-        "diversity": diversity_score(genre_vector),
-        "top_genres": top_genres_list,
-        "taste_map": taste_map(top_artists),
+        "genre_similarity": compatibility_score(earlier_vector, later_vector)["score"],
+        "archetype_changed": earlier["archetype"]["name"] != later["archetype"]["name"],
+        "archetype": {"from": earlier["archetype"]["name"], "to": later["archetype"]["name"]},
+        "dominant_decade": {
+            "from": earlier["era"]["dominant_decade"],
+            "to": later["era"]["dominant_decade"],
+        },
+        "era_shift_years": (
+            round(later_era - earlier_era, 1) if earlier_era is not None and later_era is not None else None
+        ),
+        "mainstream_shift": round(later["mainstream"]["score"] - earlier["mainstream"]["score"], 1),
+        "diversity_shift": round(later["diversity"]["score"] - earlier["diversity"]["score"], 2),
     }
+
+
+# ---------------------------------------------------------------------------
+# Running aggregates
+# ---------------------------------------------------------------------------
+
+# Compact per-item contributions, so snapshots can be diffed and stored cheaply.
+ArtistContribution = tuple[str, ...]                     # lowercased genres
+TrackContribution = tuple[tuple[str, ...], int, str | None]  # genres, popularity, decade
+
+
+def artist_contribution(artist: dict) -> ArtistContribution:
+    return tuple(g.lower() for g in artist.get("genres", []))
+
+
+def track_contribution(track: dict) -> TrackContribution:
+    return (
+        tuple(g.lower() for g in track.get("genres", [])),
+        track.get("popularity", 0),
+        _decade(track.get("release_date", "")),
+    )
+
+
+def _c_log_c(c: int) -> float:
+    return c * log2(c) if c > 0 else 0.0
+
+
+class TasteAggregates:
+    """
+    The sums a profile is derived from — genre counts, popularity sum,
+    decade histogram and the entropy term S = Σ c·log2(c) — kept up to date
+    by adding and removing individual artists/tracks, so a new snapshot
+    costs O(items that changed) instead of a full rebuild.
+    Entropy follows from the running terms as H = log2(T) − S / T.
+    """
+
+    def __init__(self):
+        self.genre_counts: Counter = Counter()
+        self.genre_total = 0
+        self.sum_c_log_c = 0.0
+        self.popularity_sum = 0
+        self.popularity_n = 0
+        self.decade_counts: Counter = Counter()
+
+    def _add_genre(self, genre: str, delta: int) -> None:
+        old = self.genre_counts[genre]
+        new = old + delta
+        self.sum_c_log_c += _c_log_c(new) - _c_log_c(old)
+        self.genre_total += delta
+        if new:
+            self.genre_counts[genre] = new
+        else:
+            del self.genre_counts[genre]
+
+    def update(
+        self,
+        artists: list[ArtistContribution] = (),
+        tracks: list[TrackContribution] = (),
+        sign: int = 1,
+    ) -> None:
+        """Add (sign=1) or remove (sign=-1) artist and track contributions."""
+        for genres in artists:
+            for genre in genres:
+                self._add_genre(genre, 2 * sign)  # artist genres count 2×, as in build_genre_vector
+
+        for genres, popularity, decade in tracks:
+            for genre in genres:
+                self._add_genre(genre, sign)
+            if popularity > 0:
+                self.popularity_sum += popularity * sign
+                self.popularity_n += sign
+            if decade:
+                self.decade_counts[decade] += sign
+                if not self.decade_counts[decade]:
+                    del self.decade_counts[decade]
+
+    @property
+    def entropy(self) -> float:
+        if self.genre_total <= 0:
+            return 0.0
+        return max(log2(self.genre_total) - self.sum_c_log_c / self.genre_total, 0.0)
+
+    def genre_vector(self) -> GenreVector:
+        return GenreVector.from_pairs(self.genre_counts.most_common())
+
+    def profile(self, top: int = 12) -> dict[str, Any]:
+        """
+        build_profile() from the running sums (everything except taste_map).
+        Ties between equally common decades or genres may break differently
+        from a rebuild, since the sums do not remember track order.
+        """
+        vector = self.genre_vector()
+        total = self.genre_total or 1
+        if vector:
+            diversity = _diversity_from_entropy(len(vector), self.entropy)
+        else:
+            diversity = diversity_score(vector)
+        return {
+            "archetype": get_archetype(vector),
+            "mainstream": _mainstream_from_sums(self.popularity_sum, self.popularity_n),
+            "era": _era_from_counts(self.decade_counts),
+            "diversity": diversity,
+            "top_genres": [
+                {"genre": genre, "count": count, "pct": round(count / total * 100, 1)}
+                for genre, count in vector.items()[:top]
+            ],
+        }
+
+    def to_state(self) -> dict[str, Any]:
+        """Plain-dict form for persistence (marshal/JSON safe)."""
+        return {
+            "genre_counts": dict(self.genre_counts),
+            "sum_c_log_c": self.sum_c_log_c,
+            "popularity_sum": self.popularity_sum,
+            "popularity_n": self.popularity_n,
+            "decade_counts": dict(self.decade_counts),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict[str, Any]) -> TasteAggregates:
+        aggregates = cls()
+        aggregates.genre_counts = Counter(state["genre_counts"])
+        aggregates.genre_total = sum(aggregates.genre_counts.values())
+        aggregates.sum_c_log_c = state["sum_c_log_c"]
+        aggregates.popularity_sum = state["popularity_sum"]
+        aggregates.popularity_n = state["popularity_n"]
+        aggregates.decade_counts = Counter(state["decade_counts"])
+        return aggregates
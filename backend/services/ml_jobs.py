@@ -0,0 +1,67 @@
+"""
+CPU-bound ML jobs run through services.ml_pool.
+
+Top-level functions of plain-data arguments so they pickle by reference;
+each takes raw Spotify responses and returns JSON-shaped results.
+"""
+from services import genre_embedding, metrics, ml_batch, ml_engine, pipeline
+
+
+def profile(
+    tracks_data: dict,
+    top_artists_data: dict,
+    artist_genres: dict[str, list[str]] | None = None,
+) -> tuple[dict, dict]:
+    """(pipeline data without profile, ML profile) for one time range."""
+    with metrics.span("build_pipeline"):
+        data = pipeline.build_pipeline(tracks_data, top_artists_data, profile=None, artist_genres=artist_genres)
+    ml_profile = ml_engine.build_profile(tracks=data["tracks"], top_artists=data["top_artists"])
+    return data, ml_profile
+
+
+def profiles_with_drift(
+    responses: dict[str, tuple[dict, dict]],
+    drift_pairs: tuple[tuple[str, str], ...],
+    artist_genres: dict[str, list[str]] | None = None,
+) -> dict:
+    """
+    Profiles for several time ranges ({range: (tracks_data, top_artists_data)})
+    plus profile_drift() for each (earlier, later) pair.
+    """
+    profiles: dict[str, dict] = {}
+    vectors: dict[str, ml_engine.GenreVector] = {}
+    for time_range, (tracks_data, top_artists_data) in responses.items():
+        with metrics.span("build_pipeline"):
+            data = pipeline.build_pipeline(tracks_data, top_artists_data, profile=None, artist_genres=artist_genres)
+        # Genre strings are interned once per process, so the vectors share
+        # one vocabulary and compare as sorted-id merges.
+        with metrics.span("build_genre_vector"):
+            vectors[time_range] = ml_engine.build_genre_vector(data["top_artists"], data["tracks"])
+        profiles[time_range] = ml_engine.build_profile(
+            data["tracks"], data["top_artists"], genre_vector=vectors[time_range]
+        )
+
+    with metrics.span("profile_drift"):
+        drift = {
+            f"{earlier}_to_{later}": ml_engine.profile_drift(
+                profiles[earlier], profiles[later], vectors[earlier], vectors[later]
+            )
+            for earlier, later in drift_pairs
+        }
+    return {"ranges": profiles, "drift": drift}
+
+
+def warm() -> None:
+    """
+    Pay first-call costs up front: the genre embedding, and one small
+    profile and group comparison (numpy/scipy code paths, archetype index).
+    Run by every pool worker on start and by the app's startup warm-up.
+    """
+    genre_embedding.get()
+    artists = [
+        {"name": "a", "genres": ["pop", "dance pop"], "popularity": 80, "image": None},
+        {"name": "b", "genres": ["trap", "pop rap"], "popularity": 60, "image": None},
+    ]
+    tracks = [{"popularity": 50, "release_date": "2020-01-01", "genres": ["pop"]}]
+    ml_engine.build_profile(tracks, artists)
+    ml_batch.group_compatibility([{"pop": 2, "dance pop": 1}, {"trap": 1, "pop rap": 2}])
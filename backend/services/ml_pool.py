@@ -0,0 +1,170 @@
+"""
+Process pool for CPU-bound ML work, so profile computation never stalls the
+event loop of the worker serving it.
+
+Workers are started with the `spawn` method and warmed by an initializer
+(ml_jobs.warm: imports numpy/scipy/ml_engine, memory-maps the genre
+embedding and runs one small profile), so the first real job does not pay
+import costs. start() (called from the app lifespan) submits one no-op per
+worker to bring them all up in the background, and ready() waits for them.
+
+Backpressure: at most ML_POOL_MAX_PENDING jobs may be queued or running;
+beyond that run() raises PoolBusy immediately instead of queueing, and a job
+that takes longer than ML_POOL_TIMEOUT raises PoolBusy too (or
+DeadlineExceeded, when the request's deadline comes first). main.py turns
+PoolBusy into 503 with Retry-After. ML_POOL_WORKERS=0 runs jobs inline on
+the event loop (the old behaviour).
+
+Jobs run under metrics.capture() in the worker and their spans are replayed
+in the parent, so ML stage timings show up on /metrics and in Server-Timing
+either way; the `ml_pool` span covers the whole round trip, queueing
+included.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from services import deadline, metrics
+
+ML_POOL_WORKERS = int(os.getenv("ML_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+ML_POOL_MAX_PENDING = int(os.getenv("ML_POOL_MAX_PENDING", str(max(ML_POOL_WORKERS, 1) * 8)))
+ML_POOL_TIMEOUT = float(os.getenv("ML_POOL_TIMEOUT", "10"))
+
+_executor: ProcessPoolExecutor | None = None
+# The start-up no-ops, which complete once workers have run _warm().
+_warming: list[Future] = []
+_workers = ML_POOL_WORKERS
+_pending = 0
+_stats = {"submitted": 0, "inline": 0, "rejected": 0, "timed_out": 0, "restarts": 0}
+
+
+class PoolBusy(Exception):
+    """The ML pool is saturated or a job overran its deadline."""
+
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _warm() -> None:
+    """Worker initializer: pay imports and first-call costs up front."""
+    from services import ml_jobs
+
+    ml_jobs.warm()
+
+
+def _noop() -> None:
+    return None
+
+
+def _traced(fn: Callable[..., Any], args: tuple) -> tuple[Any, list]:
+    """Worker side of run(): fn(*args) plus the metrics spans it recorded."""
+    spans = metrics.capture()
+    return fn(*args), spans
+
+
+def start(workers: int | None = None) -> None:
+    """Create the pool and begin warming its workers (app lifespan)."""
+    global _executor, _workers
+    if workers is not None:
+        _workers = workers
+    if _executor is not None or _workers <= 0:
+        return
+    _executor = ProcessPoolExecutor(
+        max_workers=_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm,
+    )
+    _warming[:] = [_executor.submit(_noop) for _ in range(_workers)]
+
+
+async def ready() -> None:
+    """
+    Wait for the start-up no-ops. Queued jobs only go to workers that have
+    finished _warm(), so once one of these is done no job waits on a cold
+    worker; waiting for all of them means the pool is at full capacity.
+    """
+    if _warming:
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in _warming))
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run the picklable `fn(*args)` in the pool and return its result.
+    Raises PoolBusy when the pool is saturated or the job times out, and
+    DeadlineExceeded when the request runs out of time first.
+    """
+    global _pending
+    deadline.check("ml_pool")
+    if _workers <= 0:
+        _stats["inline"] += 1
+        return fn(*args)
+    if _executor is None:
+        start()
+
+    if _pending >= ML_POOL_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise PoolBusy("ML workers are saturated, retry shortly")
+
+    executor = _executor
+    try:
+        future = asyncio.get_running_loop().run_in_executor(executor, _traced, fn, args)
+    except BrokenProcessPool:
+        _restart(executor)
+        raise PoolBusy("ML worker crashed, retry shortly")
+
+    _pending += 1
+    _stats["submitted"] += 1
+
+    def _release(_):
+        # A timed-out job keeps its slot until the worker actually finishes.
+        global _pending
+        _pending -= 1
+
+    future.add_done_callback(_release)
+    left = deadline.remaining()
+    timeout = ML_POOL_TIMEOUT if left is None else min(ML_POOL_TIMEOUT, left)
+    try:
+        with metrics.span("ml_pool"):
+            result, spans = await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        _stats["timed_out"] += 1
+        if timeout < ML_POOL_TIMEOUT:
+            raise deadline.exceeded("ml_pool") from None
+        raise PoolBusy("ML computation timed out, retry shortly", retry_after=int(ML_POOL_TIMEOUT))
+    except BrokenProcessPool:
+        _restart(executor)
+        raise PoolBusy("ML worker crashed, retry shortly")
+    metrics.record_spans(spans)
+    return result
+
+
+def _restart(broken: ProcessPoolExecutor) -> None:
+    """Replace a pool whose worker died (e.g. OOM-killed), once per breakage."""
+    if _executor is broken:
+        _stats["restarts"] += 1
+        shutdown()
+        start()
+
+
+def stats() -> dict:
+    return {
+        "workers": _workers,
+        "max_pending": ML_POOL_MAX_PENDING,
+        "timeout_seconds": ML_POOL_TIMEOUT,
+        "pending": _pending,
+        **_stats,
+    }
@@ -0,0 +1,73 @@
+"""
+Shapes raw Spotify top tracks / top artists into the dashboard payload.
+Shared by /spotify/data-pipeline, /ml/profile and /dashboard so every route
+enriches the same way and ml_engine sees track genres and release dates.
+"""
+
+
+def artist_genre_lookup(
+    top_artists: list[dict],
+    artist_genres: dict[str, list[str]] | None = None,
+) -> dict[str, list[str]]:
+    # artist_id → genres from the top artists, plus `artist_genres` for the
+    # other artists on the tracks (see services.artist_store.enrich).
+    lookup = dict(artist_genres) if artist_genres else {}
+    lookup.update((a["id"], a.get("genres", [])) for a in top_artists)
+    return lookup
+
+
+def enrich_tracks(tracks: list[dict], artist_genres: dict[str, list[str]]) -> list[dict]:
+    enriched = []
+    for track in tracks:
+        # Collect all genres from all artists on the track
+        genres: list[str] = []
+        for a in track["artists"]:
+            genres.extend(artist_genres.get(a["id"], []))
+        genres = list(dict.fromkeys(genres))  # deduplicate, preserve order
+
+        enriched.append({
+            "id": track.get("id", ""),
+            "name": track.get("name", ""),
+            "artists": [a["name"] for a in track["artists"]],
+            "album": track["album"]["name"],
+            "release_date": track["album"].get("release_date", ""),
+            "popularity": track.get("popularity", 0),
+            "explicit": track.get("explicit", False),
+            "preview_url": track.get("preview_url"),
+            "image": track["album"]["images"][0]["url"] if track["album"].get("images") else None,
+            "genres": genres,
+        })
+    return enriched
+
+
+def shape_top_artists(top_artists: list[dict]) -> list[dict]:
+    return [
+        {
+            "id": a.get("id", ""),
+            "name": a.get("name", ""),
+            "genres": a.get("genres", []),
+            "popularity": a.get("popularity", 0),
+            "image": a["images"][0]["url"] if a.get("images") else None,
+        }
+        for a in top_artists
+    ]
+
+
+def build_pipeline(
+    tracks_data: dict,
+    top_artists_data: dict,
+    profile: dict | None,
+    artist_genres: dict[str, list[str]] | None = None,
+) -> dict:
+    """
+    The /spotify/data-pipeline payload from raw Spotify responses.
+    `artist_genres` adds genres for track artists outside the top artists.
+    """
+    top_artists = top_artists_data.get("items", [])
+    pipeline = {
+        "tracks": enrich_tracks(tracks_data.get("items", []), artist_genre_lookup(top_artists, artist_genres)),
+        "top_artists": shape_top_artists(top_artists),
+    }
+    if profile is not None:
+        pipeline = {"profile": profile, **pipeline}
+    return pipeline
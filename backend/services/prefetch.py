@@ -0,0 +1,211 @@
+"""
+Background prefetch: keep recently active users' data warm.
+
+Routes call touch() with the token behind each profile/dashboard request,
+and the auth routes call remember_tokens() so expired access tokens can be
+refreshed. A single background task, started from the app lifespan, wakes
+every PREFETCH_INTERVAL seconds and, for every (user, time_range) seen in the
+last PREFETCH_ACTIVE_WINDOW seconds whose cached data expires within
+PREFETCH_MARGIN, re-fetches top tracks/artists and recomputes the profile
+before the TTL runs out. Refreshes run at batch priority in the upstream
+scheduler, at most PREFETCH_CONCURRENCY at a time, each after a random delay
+so they do not all hit Spotify at once.
+
+Tokens live in this worker's memory only and are dropped when the user goes
+inactive. Tokens remembered for a user who never shows up are dropped once
+the access token expires, and at most PREFETCH_MAX_TOKENS are kept.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+
+import httpx
+
+from services import artist_store, profile_cache, scheduler, spotify_client
+from services.concurrency import gather_or_cancel
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") not in ("0", "false", "False")
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "30"))
+PREFETCH_ACTIVE_WINDOW = float(os.getenv("PREFETCH_ACTIVE_WINDOW", "1800"))
+PREFETCH_MARGIN = float(os.getenv("PREFETCH_MARGIN", "60"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+PREFETCH_JITTER = float(os.getenv("PREFETCH_JITTER", "10"))
+# Refresh tokens remembered for users not (yet) seen by touch().
+PREFETCH_MAX_TOKENS = int(os.getenv("PREFETCH_MAX_TOKENS", "10000"))
+# Refresh access tokens this many seconds before Spotify says they expire.
+TOKEN_REFRESH_MARGIN = 120
+
+CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+
+
+class _ActiveUser:
+    __slots__ = ("access_token", "refresh_token", "expires_at", "last_seen", "refreshed_at")
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+        self.refresh_token: str | None = None
+        self.expires_at: float | None = None
+        self.last_seen = 0.0
+        self.refreshed_at: dict[str, float] = {}  # time_range → when its data was last fetched
+
+
+_users: dict[str, _ActiveUser] = {}
+# token key → (refresh_token, expires_at), from /auth/token and /auth/refresh,
+# oldest first
+_tokens: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+_task: asyncio.Task | None = None
+
+_stats = {"refreshed": 0, "failed": 0, "token_refreshes": 0, "dropped": 0, "tokens_dropped": 0}
+
+
+def remember_tokens(access_token: str, refresh_token: str | None, expires_in: float) -> None:
+    """Record how to refresh `access_token` once its user shows up in touch()."""
+    key = spotify_client._token_key(access_token)
+    _tokens[key] = (refresh_token, time.time() + expires_in)
+    _tokens.move_to_end(key)
+    while len(_tokens) > PREFETCH_MAX_TOKENS:
+        _tokens.popitem(last=False)
+        _stats["tokens_dropped"] += 1
+
+
+def touch(access_token: str, user_id: str, time_range: str) -> None:
+    """Mark a user/time range as active; called by the routes on every load."""
+    now = time.time()
+    user = _users.get(user_id)
+    if user is None:
+        user = _users[user_id] = _ActiveUser(access_token)
+    if user.access_token != access_token or user.refresh_token is None:
+        user.access_token = access_token
+        known = _tokens.pop(spotify_client._token_key(access_token), None)
+        if known is not None:
+            user.refresh_token, user.expires_at = known[0] or user.refresh_token, known[1]
+    user.last_seen = now
+    # Data served to this request is at most one TTL old from here on.
+    user.refreshed_at.setdefault(time_range, now)
+
+
+async def _valid_token(user: _ActiveUser, force: bool = False) -> str | None:
+    """The user's access token, refreshed first if it is (about to be) expired."""
+    expiring = user.expires_at is not None and user.expires_at - time.time() < TOKEN_REFRESH_MARGIN
+    if not (force or expiring):
+        return user.access_token
+    if not user.refresh_token or not CLIENT_ID:
+        return None
+
+    tokens = await spotify_client.refresh_access_token(user.refresh_token, CLIENT_ID, CLIENT_SECRET)
+    user.access_token = tokens["access_token"]
+    user.refresh_token = tokens.get("refresh_token") or user.refresh_token
+    user.expires_at = time.time() + tokens.get("expires_in", 3600)
+    _stats["token_refreshes"] += 1
+    return user.access_token
+
+
+async def refresh(user_id: str, time_range: str) -> None:
+    """Re-fetch one user's top items for `time_range` and recompute the profile."""
+    user = _users[user_id]
+    with scheduler.batch_priority():
+        for attempt in range(2):
+            token = await _valid_token(user, force=attempt > 0)
+            if token is None:
+                raise PermissionError("access token expired and cannot be refreshed")
+            try:
+                tracks_data, top_artists_data = await gather_or_cancel(
+                    spotify_client.get_top_tracks(token, time_range=time_range, refresh=True),
+                    spotify_client.get_top_artists(token, time_range=time_range, refresh=True),
+                )
+                break
+            except httpx.HTTPStatusError as e:
+                # Token revoked or expired early: refresh once and retry.
+                if e.response.status_code != 401 or attempt:
+                    raise
+        artist_genres = await artist_store.enrich(
+            token, tracks_data.get("items", []), top_artists_data.get("items", [])
+        )
+    await profile_cache.build(user_id, time_range, tracks_data, top_artists_data, artist_genres)
+    user.refreshed_at[time_range] = time.time()
+
+
+def due(now: float | None = None) -> list[tuple[str, str]]:
+    """(user_id, time_range) pairs whose cached data should be refreshed now."""
+    now = time.time() if now is None else now
+    for user_id in [u for u, user in _users.items() if now - user.last_seen > PREFETCH_ACTIVE_WINDOW]:
+        del _users[user_id]
+        _stats["dropped"] += 1
+    # An expired access token can no longer reach touch(), so its refresh
+    # token would never be claimed.
+    for key in [k for k, (_, expires_at) in _tokens.items() if expires_at <= now]:
+        del _tokens[key]
+        _stats["tokens_dropped"] += 1
+
+    stale_after = max(spotify_client.CACHE_TTL_SECONDS - PREFETCH_MARGIN, 0)
+    return [
+        (user_id, time_range)
+        for user_id, user in _users.items()
+        for time_range, refreshed_at in user.refreshed_at.items()
+        if now - refreshed_at >= stale_after
+    ]
+
+
+async def run_once() -> None:
+    """Refresh everything that is due, with bounded concurrency and jitter."""
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+    async def one(user_id: str, time_range: str) -> None:
+        await asyncio.sleep(random.uniform(0, PREFETCH_JITTER))
+        async with semaphore:
+            try:
+                await refresh(user_id, time_range)
+                _stats["refreshed"] += 1
+            except Exception as e:
+                _stats["failed"] += 1
+                logger.warning("prefetch for %s/%s failed: %s", user_id, time_range, e)
+                if isinstance(e, PermissionError):
+                    _users.pop(user_id, None)
+
+    await asyncio.gather(*(one(u, tr) for u, tr in due()))
+
+
+async def _run_forever() -> None:
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL * random.uniform(0.8, 1.2))
+        try:
+            await run_once()
+        except Exception:
+            logger.exception("prefetch pass failed")
+
+
+def start() -> None:
+    """Start the background worker (app lifespan)."""
+    global _task
+    if PREFETCH_ENABLED and _task is None:
+        _task = asyncio.create_task(_run_forever(), name="prefetch")
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def stats() -> dict:
+    return {
+        "enabled": PREFETCH_ENABLED,
+        "running": _task is not None and not _task.done(),
+        "active_users": len(_users),
+        "pending_tokens": len(_tokens),
+        "due": len(due()),
+        **_stats,
+    }
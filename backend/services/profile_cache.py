@@ -0,0 +1,71 @@
+"""
+Cache of computed profiles: the enriched pipeline data plus build_profile()
+for one user and time range.
+
+Entries carry a fingerprint of the raw Spotify responses they were computed
+from, so a hit is only served while the upstream data is unchanged; the
+prefetch worker refreshes both together so interactive requests find them
+warm. When recomputing is not possible (pool saturated, request out of
+time), the entry is served anyway, stale, rather than failing.
+"""
+import hashlib
+import os
+
+from services import deadline, metrics, ml_jobs, ml_pool
+from services.cache import _MISSING, TTLCache, make_backend
+from services.spotify_client import CACHE_TTL_SECONDS
+
+PROFILE_CACHE_MAX_BYTES = int(os.getenv("PROFILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_cache = TTLCache("profile", ttl=CACHE_TTL_SECONDS, backend=make_backend(PROFILE_CACHE_MAX_BYTES))
+
+
+def fingerprint(
+    tracks_data: dict,
+    top_artists_data: dict,
+    artist_genres: dict[str, list[str]] | None = None,
+) -> str:
+    """
+    Cheap identity of a pair of top-items responses (ids, order and
+    popularity) and of which other track artists had genres available.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for item in (*tracks_data.get("items", []), *top_artists_data.get("items", [])):
+        h.update(f"{item.get('id')}:{item.get('popularity')}|".encode())
+    for artist_id in sorted(artist_genres or ()):
+        h.update(f"{artist_id}:{len(artist_genres[artist_id])}|".encode())
+    return h.hexdigest()
+
+
+async def build(
+    user_id: str,
+    time_range: str,
+    tracks_data: dict,
+    top_artists_data: dict,
+    artist_genres: dict[str, list[str]] | None = None,
+) -> tuple[dict, dict]:
+    """
+    (pipeline data without profile, ML profile) for these responses, from the
+    cache when they were already computed for the same upstream data, else
+    computed in the ML process pool (falling back to the cached profile of
+    older data if the pool cannot take the job in time).
+    """
+    key = (user_id, time_range)
+    fp = fingerprint(tracks_data, top_artists_data, artist_genres)
+    entry = _cache.get(key)
+    if entry is not _MISSING and entry["fp"] == fp:
+        return entry["data"], entry["ml_profile"]
+
+    try:
+        data, ml_profile = await ml_pool.run(ml_jobs.profile, tracks_data, top_artists_data, artist_genres)
+    except (ml_pool.PoolBusy, deadline.DeadlineExceeded):
+        if entry is _MISSING:
+            raise
+        metrics.inc("stale_served_total", cache="profile")
+        return entry["data"], entry["ml_profile"]
+    _cache.set(key, {"fp": fp, "data": data, "ml_profile": ml_profile})
+    return data, ml_profile
+
+
+def stats() -> dict:
+    return _cache.stats()
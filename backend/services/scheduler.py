@@ -0,0 +1,261 @@
+"""
+Rate-limit-aware scheduler for upstream Spotify calls.
+
+Every request made by spotify_client passes through UpstreamScheduler.run(),
+which enforces, in order:
+
+- a per-access-token concurrency cap, so one user cannot hog the pool
+- a global concurrency cap, handed out by priority (interactive before batch)
+- a shared pause while Spotify's Retry-After from a 429 is in effect
+- an app-wide token bucket on request rate
+
+429s are retried after Retry-After (plus jitter) when the wait is short
+enough, and 5xx / transport errors are retried with jittered exponential
+backoff. Once retries are exhausted the last response (or error) is
+returned to the caller, so routers can answer 503 + Retry-After. While a
+Retry-After longer than MAX_RETRY_AFTER (or than the request's remaining
+deadline) is in effect, new calls fail fast with RateLimited instead of
+queueing behind it.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+import httpx
+
+from services import deadline
+
+INTERACTIVE = 0
+BATCH = 1
+
+MAX_CONCURRENCY = int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "64"))
+PER_TOKEN_CONCURRENCY = int(os.getenv("SPOTIFY_PER_TOKEN_CONCURRENCY", "6"))
+RATE_PER_SECOND = float(os.getenv("SPOTIFY_RATE_PER_SECOND", "50"))
+RATE_BURST = int(os.getenv("SPOTIFY_RATE_BURST", "100"))
+MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("SPOTIFY_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("SPOTIFY_BACKOFF_MAX", "5"))
+# Retry-After longer than this is not waited out inside a request.
+MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "5"))
+
+_priority: ContextVar[int] = ContextVar("spotify_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def batch_priority():
+    """Run upstream calls made inside this block at batch priority."""
+    reset = _priority.set(BATCH)
+    try:
+        yield
+    finally:
+        _priority.reset(reset)
+
+
+class RateLimited(Exception):
+    """Raised instead of queueing while a long Retry-After is in effect."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited for {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    """Parse Retry-After (delta-seconds or HTTP-date)."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _PrioritySemaphore:
+    """Semaphore that wakes the lowest priority value first, FIFO within a priority."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we were cancelled — pass it on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    def depth(self, priority: int) -> int:
+        return sum(1 for p, _, f in self._waiters if p == priority and not f.done())
+
+
+class _TokenBucket:
+    """
+    Token bucket without a lock: each caller reserves a token up front (the
+    balance may go negative) and sleeps until its reservation is covered,
+    which keeps callers in arrival order and binds to no event loop.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class UpstreamScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        per_token_concurrency: int = PER_TOKEN_CONCURRENCY,
+        rate_per_second: float = RATE_PER_SECOND,
+        burst: int = RATE_BURST,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_token_concurrency = per_token_concurrency
+        self.max_retries = max_retries
+        self._slots = _PrioritySemaphore(max_concurrency)
+        self._bucket = _TokenBucket(rate_per_second, burst)
+        self._per_token: dict[str, asyncio.Semaphore] = {}
+        self._per_token_users: dict[str, int] = {}
+        self._blocked_until = 0.0
+
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.gave_up = 0
+        self.shed = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def _wait_unblocked(self) -> None:
+        delay = self._blocked_until - time.monotonic()
+        left = deadline.remaining()
+        if delay > MAX_RETRY_AFTER or (delay > 0 and left is not None and delay >= left):
+            self.shed += 1
+            raise RateLimited(delay)
+        if delay > 0:
+            await asyncio.sleep(delay + random.uniform(0, 0.1 * delay + 0.05))
+
+    async def _attempt(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        priority: int,
+    ) -> httpx.Response:
+        await self._slots.acquire(priority)
+        try:
+            await self._wait_unblocked()
+            await self._bucket.acquire()
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                return await send()
+            finally:
+                self.in_flight -= 1
+        finally:
+            self._slots.release()
+
+    async def run(self, send: Callable[[], Awaitable[httpx.Response]], token_key: str) -> httpx.Response:
+        """Send a request under the budgets above, retrying as described."""
+        priority = _priority.get()
+
+        semaphore = self._per_token.get(token_key)
+        if semaphore is None:
+            semaphore = self._per_token[token_key] = asyncio.Semaphore(self.per_token_concurrency)
+        self._per_token_users[token_key] = self._per_token_users.get(token_key, 0) + 1
+
+        try:
+            async with semaphore:
+                attempt = 0
+                while True:
+                    try:
+                        response = await self._attempt(send, priority)
+                    except httpx.TransportError:
+                        if attempt >= self.max_retries:
+                            self.gave_up += 1
+                            raise
+                        delay = self._backoff(attempt)
+                    else:
+                        if response.status_code == 429:
+                            self.rate_limited += 1
+                            delay = retry_after_seconds(response)
+                            if delay is None:
+                                delay = self._backoff(attempt)
+                            # Spotify rate limits are per app: pause everyone.
+                            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                            if attempt >= self.max_retries or delay > MAX_RETRY_AFTER:
+                                self.gave_up += 1
+                                return response
+                        elif response.status_code >= 500 and attempt < self.max_retries:
+                            delay = self._backoff(attempt)
+                        else:
+                            return response
+
+                    attempt += 1
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            # Drop idle per-token semaphores so the map does not grow forever.
+            remaining = self._per_token_users[token_key] - 1
+            if remaining:
+                self._per_token_users[token_key] = remaining
+            else:
+                del self._per_token_users[token_key]
+                del self._per_token[token_key]
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_token_concurrency": self.per_token_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth_interactive": self._slots.depth(INTERACTIVE),
+            "queue_depth_batch": self._slots.depth(BATCH),
+            "active_tokens": len(self._per_token),
+            "rate_limited_for_seconds": round(max(self._blocked_until - time.monotonic(), 0.0), 2),
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "gave_up": self.gave_up,
+            "shed": self.shed,
+        }
@@ -0,0 +1,141 @@
+"""
+Content-addressed store of shareable profile snapshots.
+
+A snapshot is the compact slice of an ML profile the share page and OG card
+render (archetype, headline scores, top genres, username). It is stored
+under a hash of its canonical JSON, so the same profile always maps to the
+same share id, rows never change once written, and share views are served
+straight from SQLite without touching Spotify or ml_engine.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import orjson
+
+from services.concurrency import in_background
+
+SHARE_DB_PATH = os.getenv("SHARE_DB_PATH", "shares.sqlite3")
+SHARE_TOP_GENRES = 8
+# Hot snapshots kept in memory in front of SQLite.
+MEMORY_ENTRIES = int(os.getenv("SHARE_MEMORY_ENTRIES", "10000"))
+
+_store: ShareStore | None = None
+
+
+def snapshot(ml_profile: dict[str, Any], username: str | None) -> dict[str, Any]:
+    """The compact, share-safe part of an ML profile."""
+    archetype = ml_profile["archetype"]
+    return {
+        "archetype": {
+            "name": archetype["name"],
+            "emoji": archetype["emoji"],
+            "description": archetype["description"],
+        },
+        "mainstream": {"score": ml_profile["mainstream"]["score"], "label": ml_profile["mainstream"]["label"]},
+        "era": {"dominant_decade": ml_profile["era"]["dominant_decade"]},
+        "diversity": {"label": ml_profile["diversity"]["label"], "score": ml_profile["diversity"]["score"]},
+        "top_genres": [
+            {"genre": g["genre"], "pct": g["pct"], "count": g["count"]}
+            for g in ml_profile["top_genres"][:SHARE_TOP_GENRES]
+        ],
+        "username": username or "",
+    }
+
+
+class ShareStore:
+    def __init__(self, path: str = SHARE_DB_PATH):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shares ("
+            " share_id TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        # Ids known to be in SQLite, kept apart from _memory so a snapshot
+        # whose write failed is written again the next time it is shared.
+        # write() runs in worker threads, hence the lock.
+        self._persisted: OrderedDict[str, None] = OrderedDict()
+        self._persisted_lock = threading.Lock()
+
+    def _remember(self, share_id: str, body: bytes) -> None:
+        self._memory[share_id] = body
+        self._memory.move_to_end(share_id)
+        if len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _mark_persisted(self, share_id: str) -> None:
+        with self._persisted_lock:
+            self._persisted[share_id] = None
+            self._persisted.move_to_end(share_id)
+            if len(self._persisted) > MEMORY_ENTRIES:
+                self._persisted.popitem(last=False)
+
+    def save(self, snap: dict[str, Any]) -> str:
+        """Store a snapshot (idempotent) and return its share id."""
+        share_id, body = self.stage(snap)
+        if body is not None:
+            self.write(share_id, body)
+        return share_id
+
+    def stage(self, snap: dict[str, Any]) -> tuple[str, bytes | None]:
+        """
+        Hash a snapshot and keep it in memory. Returns its share id and the
+        body still to be written to SQLite (None when already stored).
+        """
+        body = orjson.dumps(snap, option=orjson.OPT_SORT_KEYS)
+        share_id = hashlib.sha256(body).hexdigest()[:20]
+        self._remember(share_id, body)
+        with self._persisted_lock:
+            if share_id in self._persisted:
+                return share_id, None
+        return share_id, body
+
+    def write(self, share_id: str, body: bytes) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO shares (share_id, body, created_at) VALUES (?, ?, ?)",
+            (share_id, body, time.time()),
+        )
+        self._mark_persisted(share_id)
+
+    def get(self, share_id: str) -> bytes | None:
+        """Snapshot JSON for `share_id`, or None if unknown."""
+        body = self._memory.get(share_id)
+        if body is not None:
+            self._memory.move_to_end(share_id)
+            return body
+        row = self._conn.execute("SELECT body FROM shares WHERE share_id = ?", (share_id,)).fetchone()
+        if row is None:
+            return None
+        self._remember(share_id, row[0])
+        self._mark_persisted(share_id)
+        return row[0]
+
+
+def get_store() -> ShareStore:
+    """The process-wide store backed by SHARE_DB_PATH, opened on first use."""
+    global _store
+    if _store is None:
+        _store = ShareStore(SHARE_DB_PATH)
+    return _store
+
+
+def share(ml_profile: dict[str, Any], username: str | None) -> str:
+    """
+    Snapshot `ml_profile` into the process-wide store; returns the share id.
+    The id is a content hash, so it is known before the SQLite write, which
+    runs in the background (the snapshot is served from memory meanwhile).
+    """
+    store = get_store()
+    share_id, body = store.stage(snapshot(ml_profile, username))
+    if body is not None:
+        in_background(store.write, share_id, body)
+    return share_id
@@ -0,0 +1,349 @@
+"""
+"Find my musical soulmates": top-k cosine similarity across users who
+opted in.
+
+Joining is explicit (POST /ml/soulmates): only users who joined are stored
+and returned. Each is known to others by a random match id, never by their
+Spotify id, and leave() withdraws them again. Their L2-normalised genre
+vector is persisted in SQLite so every worker (and every restart) sees the
+same population. In memory the index
+is a normalised sparse users × genres matrix in CSC layout: a query only
+touches the columns of the genres it actually has, so cost scales with the
+number of users sharing those genres rather than with the total user count.
+
+Recent upserts sit in a small pending buffer that is scored directly and
+folded into the matrix once it grows past REBUILD_THRESHOLD. Inside the
+app the fold runs in a worker thread and the new matrix is swapped in when
+it is done, so requests keep being served from the old one meanwhile.
+search_exact() is the brute-force reference used to check results.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import marshal
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Mapping
+
+import numpy as np
+from scipy import sparse
+
+from services import genre_vector as gv
+from services.genre_vector import GenreVector
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_DB_PATH = os.getenv("SIMILARITY_DB_PATH", "similarity.sqlite3")
+REBUILD_THRESHOLD = int(os.getenv("SIMILARITY_REBUILD_THRESHOLD", "1000"))
+SYNC_INTERVAL_SECONDS = float(os.getenv("SIMILARITY_SYNC_INTERVAL", "30"))
+
+_index: SimilarityIndex | None = None
+
+
+def normalise(vector: GenreVector | Mapping[str, int]) -> dict[str, float]:
+    """L2-normalised {genre: weight}; empty if the vector has no magnitude."""
+    vector = GenreVector.coerce(vector)
+    norm = vector.norm
+    if norm == 0:
+        return {}
+    return {genre: count / norm for genre, count in vector.items()}
+
+
+def _sparse_row(weights: Mapping[str, float]) -> tuple[np.ndarray, np.ndarray]:
+    ids = np.fromiter((gv.intern(g) for g in weights), dtype=np.int64, count=len(weights))
+    vals = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+    order = np.argsort(ids)
+    return ids[order], vals[order]
+
+
+class SimilarityIndex:
+    def __init__(self, path: str | None = SIMILARITY_DB_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        # _sync() reads on the event loop through its own connection, so it
+        # only ever sees committed rows while a write is open in a thread.
+        self._read_conn: sqlite3.Connection | None = None
+
+        self._matrix = sparse.csc_matrix((0, 0), dtype=np.float32)
+        self._match_ids: list[str] = []
+        self._names: list[str | None] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._position: dict[str, int] = {}
+
+        # match_id → (display_name, ids, vals) not yet in the matrix
+        self._pending: dict[str, tuple[str | None, np.ndarray, np.ndarray]] = {}
+        # Spotify user_id → match_id of everyone who has joined
+        self._by_user: dict[str, str] = {}
+        self._last_seq = 0
+        self._last_sync = 0.0
+        self._rebuilding: asyncio.Task | None = None
+        # Writes run in worker threads and share the connection.
+        self._write_lock = threading.Lock()
+
+        if path:
+            self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS soulmates ("
+                " user_id TEXT PRIMARY KEY,"
+                " match_id TEXT NOT NULL UNIQUE,"
+                " display_name TEXT,"
+                " weights BLOB NOT NULL,"
+                " seq INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS soulmates_seq ON soulmates (seq)")
+            self._read_conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._sync()
+            self._rebuild()
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + sum(1 for u in self._pending if u not in self._position)
+
+    # -- writes ----------------------------------------------------------------
+
+    async def join(self, user_id: str, display_name: str | None, vector: GenreVector | Mapping[str, int]) -> str:
+        """Opt a user in (or refresh their vector); returns their match id."""
+        weights = normalise(vector)
+        match_id = await asyncio.to_thread(self._write, user_id, display_name, weights)
+        self._by_user[user_id] = match_id
+        self._stage(match_id, display_name, weights)
+        return match_id
+
+    async def leave(self, user_id: str) -> None:
+        """Opt a user out; the row is kept as an empty tombstone so other workers see it."""
+        match_id = await asyncio.to_thread(self._write, user_id, None, {})
+        self._by_user.pop(user_id, None)
+        if match_id is None:
+            return
+        self._stage(match_id, None, {})
+
+    def match_id(self, user_id: str) -> str | None:
+        """The user's match id if they have joined, else None."""
+        return self._by_user.get(user_id)
+
+    def _write(self, user_id: str, display_name: str | None, weights: Mapping[str, float]) -> str | None:
+        """
+        Persist a row (worker thread), keeping the user's match id if they
+        have one. Empty weights (leaving) for an unknown user write nothing
+        and return None.
+        """
+        if self._conn is None:
+            return self._by_user.get(user_id) or (secrets.token_urlsafe(12) if weights else None)
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT match_id FROM soulmates WHERE user_id = ?", (user_id,)).fetchone()
+                if row is None and not weights:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                match_id = row[0] if row else secrets.token_urlsafe(12)
+                seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM soulmates").fetchone()[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO soulmates (user_id, match_id, display_name, weights, seq)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (user_id, match_id, display_name, marshal.dumps(dict(weights)), seq),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return match_id
+
+    def load_matrix(self, match_ids: list[str], names: list[str | None], matrix: sparse.spmatrix) -> None:
+        """
+        Replace the in-memory index with a users × genres matrix whose columns
+        are interned genre ids (benchmarks, offline backfills). Rows are
+        L2-normalised here; nothing is written to SQLite.
+        """
+        matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = sparse.diags(1 / np.where(norms > 0, norms, 1)).astype(np.float32) @ matrix
+        matrix.resize((matrix.shape[0], max(matrix.shape[1], gv.vocab_size())))
+
+        self._matrix = matrix.tocsc()
+        self._match_ids = list(match_ids)
+        self._names = list(names)
+        self._alive = np.ones(len(self._match_ids), dtype=bool)
+        self._position = {u: i for i, u in enumerate(self._match_ids)}
+        self._pending.clear()
+
+    def _stage(self, match_id: str, display_name: str | None, weights: Mapping[str, float]) -> None:
+        self._pending[match_id] = (display_name, *_sparse_row(weights))
+        self._maybe_rebuild()
+
+    def _sync(self) -> None:
+        """Pull rows written by other workers since the last sync."""
+        self._last_sync = time.monotonic()
+        if self._read_conn is None:
+            return
+        rows = self._read_conn.execute(
+            "SELECT user_id, match_id, display_name, weights, seq FROM soulmates WHERE seq > ? ORDER BY seq",
+            (self._last_seq,),
+        ).fetchall()
+        for user_id, match_id, display_name, blob, seq in rows:
+            weights = marshal.loads(blob)
+            if weights:
+                self._by_user[user_id] = match_id
+            else:
+                self._by_user.pop(user_id, None)
+            self._pending[match_id] = (display_name, *_sparse_row(weights))
+            self._last_seq = seq
+
+    def _maybe_rebuild(self) -> None:
+        if len(self._pending) < REBUILD_THRESHOLD or self._rebuilding is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._rebuild()  # no event loop (scripts, benchmarks): fold inline
+            return
+        self._rebuilding = loop.create_task(self._rebuild_in_thread())
+
+    async def _rebuild_in_thread(self) -> None:
+        try:
+            pending = dict(self._pending)
+            folded = await asyncio.to_thread(self._fold, pending, gv.vocab_size())
+            self._swap(pending, *folded)
+        except Exception:
+            logger.exception("similarity index rebuild failed")
+        finally:
+            self._rebuilding = None
+
+    def _rebuild(self) -> None:
+        """Fold pending rows into the CSC matrix, dropping superseded rows."""
+        if not self._pending:
+            return
+        pending = dict(self._pending)
+        self._swap(pending, *self._fold(pending, gv.vocab_size()))
+
+    def _fold(self, pending: dict, n_genres: int) -> tuple[sparse.csc_matrix, list[str], list[str | None]]:
+        """The matrix, user ids and names with `pending` folded in; changes nothing."""
+        alive = self._alive.copy()
+        alive[[pos for u in pending if (pos := self._position.get(u)) is not None]] = False
+        keep = np.flatnonzero(alive)
+        old = self._matrix[keep] if len(keep) else sparse.csr_matrix((0, n_genres), dtype=np.float32)
+        old = sparse.csr_matrix(old)
+        old.resize((old.shape[0], n_genres))
+
+        new_ids = list(pending)
+        indptr = [0]
+        indices, data = [], []
+        for _, ids, vals in pending.values():
+            indices.append(ids)
+            data.append(vals)
+            indptr.append(indptr[-1] + len(ids))
+        new = sparse.csr_matrix(
+            (
+                np.concatenate(data) if data else np.zeros(0, dtype=np.float32),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                indptr,
+            ),
+            shape=(len(new_ids), n_genres),
+        )
+
+        return (
+            sparse.vstack([old, new], format="csc", dtype=np.float32),
+            [self._match_ids[i] for i in keep] + new_ids,
+            [self._names[i] for i in keep] + [p[0] for p in pending.values()],
+        )
+
+    def _swap(self, pending: dict, matrix: sparse.csc_matrix, match_ids: list[str], names: list[str | None]) -> None:
+        self._matrix = matrix
+        self._match_ids = match_ids
+        self._names = names
+        self._alive = np.ones(len(match_ids), dtype=bool)
+        self._position = {u: i for i, u in enumerate(match_ids)}
+        # Rows staged again while the fold ran stay pending; they supersede
+        # the folded copy until the next rebuild.
+        for match_id, entry in pending.items():
+            if self._pending.get(match_id) is entry:
+                del self._pending[match_id]
+
+    # -- queries ---------------------------------------------------------------
+
+    def search(
+        self,
+        vector: GenreVector | Mapping[str, int],
+        k: int = 10,
+        exclude: str | None = None,
+    ) -> list[tuple[str, str | None, float]]:
+        """Top-k (match_id, display_name, cosine) by similarity to `vector`."""
+        if time.monotonic() - self._last_sync > SYNC_INTERVAL_SECONDS:
+            self._sync()
+            self._maybe_rebuild()
+
+        weights = normalise(vector)
+        if not weights or k <= 0:
+            return []
+        q_ids, q_vals = _sparse_row(weights)
+
+        candidates: list[tuple[float, str, str | None]] = []
+
+        # Indexed rows: only the query's genre columns are touched.
+        in_range = q_ids < self._matrix.shape[1]
+        if self._matrix.shape[0] and in_range.any():
+            scores = self._matrix[:, q_ids[in_range]] @ q_vals[in_range]
+            scores = np.where(self._alive, scores, -np.inf)
+            for match_id in (exclude, *self._pending):
+                pos = self._position.get(match_id)
+                if pos is not None:
+                    scores[pos] = -np.inf
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            candidates += [
+                (float(scores[i]), self._match_ids[i], self._names[i])
+                for i in best
+                if scores[i] > 0
+            ]
+
+        # Pending rows: scored directly with a sorted-id merge.
+        for match_id, (name, ids, vals) in self._pending.items():
+            if match_id == exclude:
+                continue
+            _, ia, ib = np.intersect1d(ids, q_ids, assume_unique=True, return_indices=True)
+            score = float(vals[ia] @ q_vals[ib])
+            if score > 0:
+                candidates.append((score, match_id, name))
+
+        return [(u, n, s) for s, u, n in heapq.nlargest(k, candidates, key=lambda c: c[0])]
+
+    def search_exact(
+        self,
+        vector: GenreVector | Mapping[str, int],
+        k: int = 10,
+        exclude: str | None = None,
+    ) -> list[tuple[str, str | None, float]]:
+        """Brute-force reference: cosine against every stored user in Python."""
+        query = normalise(vector)
+        rows: dict[str, tuple[str | None, dict[str, float]]] = {}
+        matrix = self._matrix.tocsr()
+        for i in np.flatnonzero(self._alive):
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            rows[self._match_ids[i]] = (
+                self._names[i],
+                {gv.genre_name(g): float(v) for g, v in zip(matrix.indices[start:end], matrix.data[start:end])},
+            )
+        for match_id, (name, ids, vals) in self._pending.items():
+            rows[match_id] = (name, {gv.genre_name(g): float(v) for g, v in zip(ids, vals)})
+
+        scored = []
+        for match_id, (name, weights) in rows.items():
+            if match_id == exclude:
+                continue
+            score = sum(w * weights.get(g, 0.0) for g, w in query.items())
+            if score > 0:
+                scored.append((score, match_id, name))
+        return [(u, n, s) for s, u, n in heapq.nlargest(k, scored, key=lambda c: c[0])]
+
+
+def get_index() -> SimilarityIndex:
+    """The process-wide index backed by SIMILARITY_DB_PATH, opened on first use."""
+    global _index
+    if _index is None:
+        _index = SimilarityIndex(SIMILARITY_DB_PATH)
+    return _index
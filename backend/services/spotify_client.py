@@ -1,79 +1,349 @@
+import asyncio
+import hashlib
+import os
+
 import httpx
 
-SPOTIFY_API_BASE = "https://api.spotify.com/v1"
-SPOTIFY_AUTH_BASE = "https://accounts.spotify.com"
+from services import deadline, metrics
+from services.cache import _MISSING, SingleFlight, TTLCache, make_backend
+from services.scheduler import RateLimited, UpstreamScheduler
+
+# Overridable so benchmarks and staging can point at a fake upstream.
+SPOTIFY_API_BASE = os.getenv("SPOTIFY_API_BASE", "https://api.spotify.com/v1")
+SPOTIFY_AUTH_BASE = os.getenv("SPOTIFY_AUTH_BASE", "https://accounts.spotify.com")
+
+# Connection pool settings for the shared upstream client.
+# One client lives for the whole app lifetime (see main.py lifespan) so that
+# TCP + TLS handshakes to Spotify are paid once per connection, not per call.
+HTTP2_ENABLED = os.getenv("SPOTIFY_HTTP2", "1") not in ("0", "false", "False")
+MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("SPOTIFY_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SPOTIFY_READ_TIMEOUT", "10"))
+POOL_TIMEOUT = float(os.getenv("SPOTIFY_POOL_TIMEOUT", "5"))
+
+# Per-user response cache for idempotent /me endpoints.
+CACHE_TTL_SECONDS = float(os.getenv("SPOTIFY_CACHE_TTL", "300"))
+CACHE_MAX_BYTES = int(os.getenv("SPOTIFY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# How long a copy of each cached response is kept to be served stale when a
+# fresh one cannot be had in time (deadline, rate limit, upstream failure).
+STALE_TTL_SECONDS = float(os.getenv("SPOTIFY_STALE_TTL", "3600"))
+STALE_MAX_BYTES = int(os.getenv("SPOTIFY_STALE_MAX_BYTES", str(CACHE_MAX_BYTES)))
+
+_client: httpx.AsyncClient | None = None
+_cache = TTLCache("spotify", ttl=CACHE_TTL_SECONDS, backend=make_backend(CACHE_MAX_BYTES))
+_stale = TTLCache("spotify_stale", ttl=STALE_TTL_SECONDS, backend=make_backend(STALE_MAX_BYTES))
+_flight = SingleFlight()
+_scheduler = UpstreamScheduler()
+
+# Simple counters for pool utilisation; exposed through pool_stats().
+_in_flight = 0
+_peak_in_flight = 0
+_requests_total = 0
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=CONNECT_TIMEOUT,
+        read=READ_TIMEOUT,
+        write=READ_TIMEOUT,
+        pool=POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(http2=HTTP2_ENABLED, limits=limits, timeout=timeout)
+
+
+async def start_client() -> None:
+    """Open the shared upstream client. Called once from the app lifespan."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    """Close the shared upstream client and release pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def open_connections(n: int) -> int:
+    """
+    Open up to `n` keep-alive connections to the API host ahead of traffic
+    (startup warm-up). The unauthenticated requests are answered 401, which
+    is fine: the handshakes are what is being paid for. They bypass the
+    scheduler and are not counted in the metrics. Returns how many got a
+    response.
+    """
+    client = get_client()
+
+    async def touch() -> int:
+        try:
+            await client.get(f"{SPOTIFY_API_BASE}/me")
+        except httpx.HTTPError:
+            return 0
+        return 1
+
+    return sum(await asyncio.gather(*(touch() for _ in range(n))))
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily if the lifespan has not run
+    (e.g. when the module is used from a script or a test).
+    """
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _endpoint(url: str) -> str:
+    """Metrics label for an upstream URL: its path below the API/auth base."""
+    for base in (SPOTIFY_API_BASE, SPOTIFY_AUTH_BASE):
+        if url.startswith(base):
+            return url[len(base):] or "/"
+    return url
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    client = get_client()
+    endpoint = _endpoint(url)
+
+    async def send() -> httpx.Response:
+        global _in_flight, _peak_in_flight, _requests_total
+        _in_flight += 1
+        _requests_total += 1
+        _peak_in_flight = max(_peak_in_flight, _in_flight)
+        status = "error"
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            _in_flight -= 1
+            metrics.inc("spotify_responses_total", endpoint=endpoint, status=status)
+
+    # Budget per access token; token-endpoint calls share the app's budget.
+    auth = kwargs.get("headers", {}).get("Authorization", "")
+    budget_key = _token_key(auth) if auth else "app"
+    with metrics.span("spotify", endpoint):
+        response = await deadline.bounded(_scheduler.run(send, budget_key), "spotify")
+    response.raise_for_status()
+    return response
+
+
+def pool_stats() -> dict:
+    """Snapshot of upstream connection pool utilisation."""
+    connections = []
+    if _client is not None:
+        # httpx does not expose the pool publicly; read it defensively.
+        pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "http2": HTTP2_ENABLED,
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+        "connections_open": len(connections),
+        "connections_idle": idle,
+        "connections_active": len(connections) - idle,
+        "requests_in_flight": _in_flight,
+        "requests_in_flight_peak": _peak_in_flight,
+        "requests_total": _requests_total,
+    }
+
+
+def cache_stats() -> dict:
+    """Snapshot of the upstream response cache."""
+    return {**_cache.stats(), "coalesced": _flight.coalesced, "stale_entries": _stale.stats()["entries"]}
+
+
+def scheduler_stats() -> dict:
+    """Snapshot of the upstream scheduler's budgets and queues."""
+    return _scheduler.stats()
+
+
+def _token_key(access_token: str) -> str:
+    # Never keep raw bearer tokens around as cache keys.
+    return hashlib.sha256(access_token.encode()).hexdigest()[:32]
+
+
+def _transient(e: Exception) -> bool:
+    """Failures worth answering from a stale copy rather than with an error."""
+    if isinstance(e, (deadline.DeadlineExceeded, RateLimited, httpx.TransportError)):
+        return True
+    return isinstance(e, httpx.HTTPStatusError) and (
+        e.response.status_code == 429 or e.response.status_code >= 500
+    )
+
+
+async def _cached(key: tuple, fetch, refresh: bool = False) -> dict:
+    """
+    Serve `key` from the cache, or run `fetch` once for all concurrent callers.
+    refresh=True skips the lookup and replaces the entry (used by prefetch).
+    When the fetch cannot finish within the caller's deadline or fails
+    transiently, an expired copy is served if one is still kept.
+    """
+    if not refresh:
+        value = _cache.get(key)
+        if value is not _MISSING:
+            return value
+
+    async def fetch_and_store() -> dict:
+        # Shared by every caller waiting on `key`, so it must not be cut
+        # short by the deadline of the one that happened to start it; each
+        # caller bounds its own wait instead, and a late result still lands
+        # in the cache for the next request.
+        with deadline.detached():
+            result = await fetch()
+        _cache.set(key, result)
+        _stale.set(key, result)
+        return result
+
+    try:
+        return await deadline.bounded(_flight.do(key, fetch_and_store), "spotify")
+    except Exception as e:
+        if not _transient(e):
+            raise
+        stale = _stale.get(key)
+        if stale is _MISSING:
+            raise
+        metrics.inc("stale_served_total", cache="spotify")
+        return stale
+
+
+async def _user_id(access_token: str) -> str:
+    """Resolve the Spotify user behind a token (cached with the profile)."""
+    profile = await get_user_profile(access_token)
+    return profile["id"]
 
 
 async def exchange_code(code: str, redirect_uri: str, client_id: str, client_secret: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SPOTIFY_AUTH_BASE}/api/token",
-            data={
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": redirect_uri,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            auth=(client_id, client_secret),
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{SPOTIFY_AUTH_BASE}/api/token",
+        data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": redirect_uri,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        auth=(client_id, client_secret),
+    )
+    return response.json()
 
 
 async def refresh_access_token(refresh_token: str, client_id: str, client_secret: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SPOTIFY_AUTH_BASE}/api/token",
-            data={
-                "grant_type": "refresh_token",
-                "refresh_token": refresh_token,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            auth=(client_id, client_secret),
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{SPOTIFY_AUTH_BASE}/api/token",
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        auth=(client_id, client_secret),
+    )
+    return response.json()
 
 
 async def get_user_profile(access_token: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
+    async def fetch() -> dict:
+        response = await _request(
+            "GET",
             f"{SPOTIFY_API_BASE}/me",
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        response.raise_for_status()
         return response.json()
 
+    # Keyed by token: this is also how a token is mapped to its user.
+    return await _cached(("me", _token_key(access_token)), fetch)
+
 
-async def get_top_tracks(access_token: str, limit: int = 50, time_range: str = "medium_term") -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
+async def get_top_tracks(
+    access_token: str,
+    limit: int = 50,
+    time_range: str = "medium_term",
+    refresh: bool = False,
+    offset: int = 0,
+) -> dict:
+    async def fetch() -> dict:
+        response = await _request(
+            "GET",
             f"{SPOTIFY_API_BASE}/me/top/tracks",
-            params={"limit": limit, "time_range": time_range},
+            params={"limit": limit, "time_range": time_range, "offset": offset},
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        response.raise_for_status()
         return response.json()
 
+    user_id = await _user_id(access_token)
+    return await _cached(("top/tracks", user_id, limit, time_range, offset), fetch, refresh=refresh)
 
-async def get_top_artists(access_token: str, limit: int = 50, time_range: str = "medium_term") -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
+
+async def get_top_artists(
+    access_token: str,
+    limit: int = 50,
+    time_range: str = "medium_term",
+    refresh: bool = False,
+    offset: int = 0,
+) -> dict:
+    async def fetch() -> dict:
+        response = await _request(
+            "GET",
             f"{SPOTIFY_API_BASE}/me/top/artists",
-            params={"limit": limit, "time_range": time_range},
+            params={"limit": limit, "time_range": time_range, "offset": offset},
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        response.raise_for_status()
         return response.json()
 
+    user_id = await _user_id(access_token)
+    return await _cached(("top/artists", user_id, limit, time_range, offset), fetch, refresh=refresh)
+
+
+async def get_saved_tracks(access_token: str, offset: int = 0, limit: int = 50) -> dict:
+    """
+    One page of the user's saved tracks ({"items": [{"added_at", "track"}],
+    "total", ...}). Not cached: libraries run to thousands of tracks and are
+    only read page by page by deep_history.
+    """
+    response = await _request(
+        "GET",
+        f"{SPOTIFY_API_BASE}/me/tracks",
+        params={"limit": limit, "offset": offset},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    return response.json()
+
+
+async def get_recently_played(access_token: str, limit: int = 50) -> dict:
+    """The user's last plays ({"items": [{"track", "played_at"}]}), at most 50."""
+    response = await _request(
+        "GET",
+        f"{SPOTIFY_API_BASE}/me/player/recently-played",
+        params={"limit": limit},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    return response.json()
+
 
 async def get_artists(access_token: str, artist_ids: list[str]) -> dict:
-    """Fetch full artist objects (with genres) for a batch of IDs."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SPOTIFY_API_BASE}/artists",
-            params={"ids": ",".join(artist_ids[:50])},  # max 50 per request
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
-        response.raise_for_status()
-        return response.json()
+    """
+    Fetch full artist objects (with genres) for up to 50 IDs. Use
+    artist_store.enrich(), which batches ids across requests, rather than
+    calling this per request.
+    """
+    response = await _request(
+        "GET",
+        f"{SPOTIFY_API_BASE}/artists",
+        params={"ids": ",".join(artist_ids[:50])},  # max 50 per request
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    return response.json()
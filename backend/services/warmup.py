@@ -0,0 +1,231 @@
+"""
+Startup warm-up, so a freshly started (e.g. autoscaled) worker serves its
+first real request at steady-state latency instead of paying imports,
+connection handshakes and first-call costs on it.
+
+preload() runs at the top of main.py, before the routers are imported: it
+imports WARMUP_MODULES in order and records how long each one took. Modules
+pulled in by an earlier entry cost nothing later, so the breakdown adds up
+to the app's import time. This module only imports the standard library at
+the top so the measurement is not skewed.
+
+start() runs from the lifespan and does the rest as a background task, each
+step timed:
+
+- upstream: open WARMUP_CONNECTIONS keep-alive connections to Spotify
+- stores: open the SQLite stores and load the similarity index
+- ml: run a small profile and group comparison in this process (numpy and
+  scipy first-call costs, archetype index, genre embedding)
+- ml_pool: wait until the pool's workers have run their own warm-up
+- routes: route one request through the app so FastAPI builds its route
+  tables
+
+/health answers 503 {"status": "warming"} until warm-up is done, so load
+balancers keep traffic away until then. A failing step is logged and
+skipped, and warm-up gives up after WARMUP_TIMEOUT: either way the worker
+goes ready. The breakdown is reported by /health, logged, and exposed on
+/metrics as warmup_* gauges. WARMUP_ENABLED=0 skips all of it.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False")
+WARMUP_MODULES = [m.strip() for m in os.getenv("WARMUP_MODULES", ",".join((
+    "numpy",
+    "scipy.sparse",
+    "httpx",
+    "orjson",
+    "pydantic",
+    "fastapi",
+    "services.ml_engine",
+    "services.ml_batch",
+    "services.genre_embedding",
+    "services.spotify_client",
+    "routers.spotify",
+    "routers.ml",
+    "routers.dashboard",
+    "routers.share",
+))).split(",") if m.strip()]
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))
+
+# "pending" → "warming" → "ready"
+_state = "ready" if not WARMUP_ENABLED else "pending"
+_task: asyncio.Task | None = None
+_import_ms: dict[str, float] = {}
+_step_ms: dict[str, float] = {}
+_failed: list[str] = []
+_total_ms = 0.0
+
+
+def preload(modules: list[str] | None = None) -> None:
+    """Import `modules` (default WARMUP_MODULES) in order, timing each."""
+    if not WARMUP_ENABLED:
+        return
+    for name in WARMUP_MODULES if modules is None else modules:
+        if name in sys.modules:
+            _import_ms.setdefault(name, 0.0)
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("warm-up: could not import %s: %s", name, e)
+            _failed.append(f"import:{name}")
+            continue
+        _import_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+# -- steps --------------------------------------------------------------------
+# Imported inside the steps, not at the top: see the module docstring.
+
+async def _upstream(app) -> None:
+    from services import spotify_client
+
+    await spotify_client.open_connections(WARMUP_CONNECTIONS)
+
+
+async def _stores(app) -> None:
+    from services import artist_store, history_store, share_store, similarity_index
+
+    def open_all() -> None:
+        artist_store.get_store()
+        history_store.get_store()
+        share_store.get_store()
+        similarity_index.get_index()
+
+    await asyncio.to_thread(open_all)
+
+
+async def _ml(app) -> None:
+    from services import ml_jobs
+
+    # On the loop, like the requests it warms up for: it takes milliseconds,
+    # and a thread would keep interning genres past WARMUP_TIMEOUT.
+    ml_jobs.warm()
+
+
+async def _ml_pool(app) -> None:
+    from services import ml_pool
+
+    await ml_pool.ready()
+
+
+async def _routes(app) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/health",
+        "raw_path": b"/health",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": None,
+        "server": None,
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    await app(scope, receive, send)
+
+
+STEPS = (
+    ("upstream", _upstream),
+    ("stores", _stores),
+    ("ml", _ml),
+    ("ml_pool", _ml_pool),
+    ("routes", _routes),
+)
+
+
+async def _step(name: str, step, app) -> None:
+    start = time.perf_counter()
+    try:
+        await step(app)
+    except Exception:
+        logger.exception("warm-up step %s failed", name)
+        _failed.append(name)
+    _step_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _run(app) -> None:
+    global _state, _total_ms
+    start = time.perf_counter()
+    try:
+        # Independent steps, so they overlap; routes goes last so its request
+        # sees the rest warm.
+        await asyncio.wait_for(
+            asyncio.gather(*(_step(name, step, app) for name, step in STEPS[:-1])),
+            WARMUP_TIMEOUT,
+        )
+        await _step(*STEPS[-1], app)
+    except asyncio.TimeoutError:
+        logger.warning("warm-up did not finish within %.0fs, serving anyway", WARMUP_TIMEOUT)
+        _failed.append("timeout")
+    finally:
+        _total_ms = round((time.perf_counter() - start) * 1000, 1)
+        _state = "ready"
+    logger.info("warm-up finished in %.0f ms: %s", _total_ms, report())
+
+
+def start(app) -> None:
+    """Begin warming up in the background (app lifespan)."""
+    global _state, _task
+    if not WARMUP_ENABLED or _task is not None:
+        return
+    _state = "warming"
+    _task = asyncio.create_task(_run(app))
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+async def wait() -> None:
+    """Wait for a warm-up started by start() to finish."""
+    if _task is not None:
+        await asyncio.shield(_task)
+
+
+def ready() -> bool:
+    return _state == "ready"
+
+
+def report() -> dict:
+    return {
+        "state": _state,
+        "total_ms": _total_ms,
+        "imports_ms": dict(_import_ms),
+        "steps_ms": dict(_step_ms),
+        "failed": list(_failed),
+    }
+
+
+def stats() -> dict:
+    return {
+        "ready": ready(),
+        "seconds": round(_total_ms / 1000, 4),
+        "failed": len(_failed),
+        "import_seconds": round(sum(_import_ms.values()) / 1000, 4),
+        **{f"import_{name.replace('.', '_')}_seconds": round(ms / 1000, 4) for name, ms in _import_ms.items()},
+        **{f"step_{name}_seconds": round(ms / 1000, 4) for name, ms in _step_ms.items()},
+    }
@@ -0,0 +1,31 @@
+from routers import admission, dashboard, ml, spotify
+
+# Prefixes as main.py includes them.
+ROUTERS = {"/spotify": spotify.router, "/ml": ml.router, "/dashboard": dashboard.router}
+
+
+def _admitted() -> dict[str, bool]:
+    return {
+        f"{method} {prefix}{route.path}": any(d.call is admission.admit for d in route.dependant.dependencies)
+        for prefix, router in ROUTERS.items()
+        for route in router.routes
+        for method in route.methods
+    }
+
+
+def test_auth_and_stats_routes_are_never_shed():
+    admitted = _admitted()
+    for route in (
+        "POST /spotify/auth/token",
+        "POST /spotify/auth/refresh",
+        "GET /spotify/pool-stats",
+        "GET /spotify/scheduler-stats",
+        "GET /ml/status",
+    ):
+        assert not admitted[route], route
+
+
+def test_data_routes_are_admitted():
+    admitted = _admitted()
+    for route in ("GET /spotify/top-tracks", "GET /ml/profile", "POST /ml/soulmates", "GET /dashboard"):
+        assert admitted[route], route
@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+
+import httpx
+
+from services import artist_store, concurrency
+
+
+def _artist(artist_id: str, genres: list[str], popularity: int = 50) -> dict:
+    return {"id": artist_id, "genres": genres, "popularity": popularity}
+
+
+def test_known_count_is_kept_without_counting_rows(tmp_path):
+    path = str(tmp_path / "artists.sqlite3")
+    store = artist_store.ArtistStore(path)
+    store.put_many([_artist("a", ["pop"]), _artist("b", ["rock"])], now=1.0)
+    store.put_many([_artist("a", ["dance pop"]), _artist("c", [])], now=2.0)
+
+    (rows,) = sqlite3.connect(path).execute("SELECT COUNT(*) FROM artists").fetchone()
+    assert store.stats()["known"] == rows == 3
+    assert artist_store.ArtistStore(path).get_many(["a"])["a"][0] == ["dance pop"]
+    assert artist_store.ArtistStore(path).known == 3
+
+
+def test_enrich_writes_top_artists_in_background(tmp_path, monkeypatch):
+    path = str(tmp_path / "artists.sqlite3")
+    store = artist_store.ArtistStore(path)
+    store.put_many([_artist("guest", ["jazz"])])
+    monkeypatch.setattr(artist_store, "_store", store)
+    tracks = [{"artists": [{"id": "top"}, {"id": "guest"}]}]
+
+    async def scenario() -> dict:
+        genres = await artist_store.enrich("token", tracks, [_artist("top", ["pop"])])
+        assert store.get_many(["top"])["top"][0] == ["pop"]  # from memory straight away
+        await concurrency.drain()
+        return genres
+
+    assert asyncio.run(scenario()) == {"guest": ["jazz"]}
+    assert artist_store.ArtistStore(path).load(["top"])["top"][0] == ["pop"]
+
+
+def _rejected(token: str) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://api.spotify.com/v1/artists")
+    return httpx.HTTPStatusError(token, request=request, response=httpx.Response(401, request=request))
+
+
+def test_batch_is_retried_with_another_callers_token():
+    calls = []
+
+    async def fetch(access_token: str, artist_ids: list[str]) -> list[dict | None]:
+        calls.append(access_token)
+        if access_token == "expired":
+            raise _rejected(access_token)
+        return [_artist(i, ["pop"]) for i in artist_ids]
+
+    batcher = artist_store.ArtistBatcher(fetch, window=0.01)
+
+    async def scenario() -> list[dict]:
+        return await asyncio.gather(batcher.get("valid", ["a"]), batcher.get("expired", ["b"]))
+
+    first, second = asyncio.run(scenario())
+    assert calls == ["expired", "valid"]
+    assert batcher.batches == 1
+    assert first["a"]["id"] == "a" and second["b"]["id"] == "b"
+
+
+def test_batch_fails_when_every_token_is_rejected():
+    async def fetch(access_token: str, artist_ids: list[str]) -> list[dict | None]:
+        raise _rejected(access_token)
+
+    batcher = artist_store.ArtistBatcher(fetch, window=0.01)
+
+    async def scenario() -> list[dict]:
+        return await asyncio.gather(batcher.get("one", ["a"]), batcher.get("two", ["a"]))
+
+    assert asyncio.run(scenario()) == [{}, {}]
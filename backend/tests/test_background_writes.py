@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from services import concurrency, history_store, share_store
+
+PROFILE = {
+    "archetype": {"name": "Night Owl", "emoji": "🦉", "description": "..."},
+    "mainstream": {"score": 50.0, "label": "Mixed"},
+    "era": {"dominant_decade": "2010s"},
+    "diversity": {"label": "Balanced", "score": 0.5},
+    "top_genres": [{"genre": "indie", "pct": 100.0, "count": 3}],
+}
+
+_drain = concurrency.drain
+
+
+def test_share_is_served_before_and_after_the_background_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(share_store, "_store", share_store.ShareStore(str(tmp_path / "shares.sqlite3")))
+
+    async def scenario() -> str:
+        share_id = share_store.share(PROFILE, "someone")
+        assert share_store.get_store().get(share_id) is not None
+        await _drain()
+        return share_id
+
+    share_id = asyncio.run(scenario())
+    fresh = share_store.ShareStore(str(tmp_path / "shares.sqlite3"))
+    assert fresh.get(share_id) is not None
+
+
+def test_history_is_recorded_in_background(tmp_path, monkeypatch):
+    store = history_store.HistoryStore(str(tmp_path / "history.sqlite3"), min_interval=0)
+    monkeypatch.setattr(history_store, "_store", store)
+    tracks = [{"id": "t1", "popularity": 40, "album": {"release_date": "2014-01-01"}, "genres": ["indie"]}]
+
+    async def scenario() -> None:
+        history_store.record_in_background("user", "medium_term", tracks, [])
+        await _drain()
+
+    asyncio.run(scenario())
+    assert len(store.history("user", "medium_term")) == 1
+
+
+def test_background_failures_are_logged_not_raised(caplog):
+    def broken() -> None:
+        raise RuntimeError("database is locked")
+
+    async def scenario() -> None:
+        concurrency.in_background(broken)
+        await _drain()
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(scenario())
+    assert "database is locked" in caplog.text
+
+
+def test_failed_share_write_is_retried(tmp_path, monkeypatch, caplog):
+    store = share_store.ShareStore(str(tmp_path / "shares.sqlite3"))
+    monkeypatch.setattr(share_store, "_store", store)
+    write = store.write
+    calls = []
+
+    def flaky(share_id: str, body: bytes) -> None:
+        calls.append(share_id)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        write(share_id, body)
+
+    monkeypatch.setattr(store, "write", flaky)
+
+    async def scenario() -> str:
+        share_id = share_store.share(PROFILE, "someone")
+        await _drain()
+        assert share_store.share(PROFILE, "someone") == share_id
+        await _drain()
+        share_store.share(PROFILE, "someone")
+        await _drain()
+        return share_id
+
+    with caplog.at_level(logging.ERROR):
+        share_id = asyncio.run(scenario())
+    assert calls == [share_id, share_id]
+    assert share_store.ShareStore(str(tmp_path / "shares.sqlite3")).get(share_id) is not None
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from services import deadline, deep_history
+from services.cache import SingleFlight, TTLCache, make_backend
+
+
+def test_collection_outlasting_the_deadline_serves_the_retry(monkeypatch):
+    monkeypatch.setattr(deep_history, "_cache", TTLCache("deep_profile_test", ttl=60, backend=make_backend(1024 * 1024)))
+    monkeypatch.setattr(deep_history, "_flight", SingleFlight())
+    calls = []
+
+    async def slow_collect(access_token: str, time_range: str) -> dict:
+        calls.append(deadline.remaining())
+        await asyncio.sleep(0.3)
+        return {"sources": {"tracks": 4000}}
+
+    monkeypatch.setattr(deep_history, "_collect", slow_collect)
+
+    async def scenario() -> dict:
+        with deadline.within(0.1):
+            with pytest.raises(deadline.DeadlineExceeded):
+                await deep_history.profile("token", "user", "medium_term")
+        await asyncio.sleep(0.3)
+        with deadline.within(0.1):
+            return await deep_history.profile("token", "user", "medium_term")
+
+    assert asyncio.run(scenario()) == {"sources": {"tracks": 4000}}
+    # One collection, and it ran without the first caller's deadline.
+    assert calls == [None]
@@ -0,0 +1,31 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from routers import ml
+from services import ml_pool
+
+
+def _request(members: int, **kwargs) -> ml.GroupCompatibilityRequest:
+    return ml.GroupCompatibilityRequest(
+        members=[{"name": f"m{i}", "genres": {"pop": 1 + i % 3, "rock": 1}} for i in range(members)],
+        **kwargs,
+    )
+
+
+def test_matrix_is_opt_in(monkeypatch):
+    monkeypatch.setattr(ml_pool, "_workers", 0)
+    summary = orjson.loads(asyncio.run(ml.ml_group_compatibility(_request(3))).body)
+    full = orjson.loads(asyncio.run(ml.ml_group_compatibility(_request(3, include_matrix=True))).body)
+
+    assert summary["matrix"] is None
+    assert len(full["matrix"]) == 3
+
+
+def test_matrix_is_refused_for_large_groups(monkeypatch):
+    monkeypatch.setattr(ml, "ML_GROUP_MATRIX_MAX_MEMBERS", 4)
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(ml.ml_group_compatibility(_request(5, include_matrix=True)))
+    assert refused.value.status_code == 422
@@ -0,0 +1,10 @@
+from services import metrics
+
+
+def test_nothing_is_recorded_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    metrics.observe("test_disabled_seconds", 0.1, stage="x")
+    metrics.inc("test_disabled_total", stage="x")
+
+    assert "test_disabled_seconds" not in metrics._histograms
+    assert "test_disabled_total" not in metrics._counters
@@ -0,0 +1,37 @@
+import asyncio
+import gzip
+
+from middleware import CompressionMiddleware
+
+
+def _app(body: bytes):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def _call(middleware) -> tuple[dict, bytes]:
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, None, send))
+    return dict(sent[0]["headers"]), sent[1]["body"]
+
+
+def test_compresses_inline_and_in_a_thread():
+    body = b"x" * 4096
+    for thread_size in (1 << 20, 1024):
+        headers, sent = _call(CompressionMiddleware(_app(body), minimum_size=1024, thread_size=thread_size))
+        assert headers[b"content-encoding"] == b"gzip"
+        assert gzip.decompress(sent) == body
+
+
+def test_bodies_above_the_maximum_are_sent_uncompressed():
+    body = b"x" * 4096
+    headers, sent = _call(CompressionMiddleware(_app(body), minimum_size=1024, maximum_size=2048))
+    assert b"content-encoding" not in headers
+    assert sent == body
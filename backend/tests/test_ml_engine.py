@@ -0,0 +1,56 @@
+import pytest
+
+from services import genre_vector as gv
+from services import ml_engine
+
+
+def _my_vector():
+    return ml_engine.build_genre_vector(
+        top_artists=[{"genres": ["indie rock", "dream pop"]}, {"genres": ["indie rock", "shoegaze"]}],
+        tracks=[],
+    )
+
+
+def test_compatibility_does_not_intern_request_genres():
+    mine = _my_vector()
+    before = gv.vocab_size()
+
+    other = {f"made-up genre {i}": 1 for i in range(1000)}
+    other["indie rock"] = 30
+    result = ml_engine.compatibility_score(mine, other)
+
+    assert gv.vocab_size() == before
+    assert result["score"] > 0
+
+
+def test_compatibility_dict_path_matches_interned_path():
+    mine = _my_vector()
+    other = {"indie rock": 3, "shoegaze": 1, "jazz": 5}
+
+    expected = ml_engine.compatibility_score(mine, gv.GenreVector.coerce(other))
+    assert ml_engine.compatibility_score(mine, other) == expected
+    assert ml_engine.compatibility_score(other, mine) == expected
+
+
+def test_compatibility_rejects_out_of_range_counts():
+    with pytest.raises(ValueError):
+        ml_engine.compatibility_score(_my_vector(), {"jazz": 2**40})
+
+
+def test_interning_and_archetype_scores_from_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = ml_engine.build_archetype_index(ml_engine.ARCHETYPES)
+
+    def work(worker: int) -> list[float]:
+        genres = {f"threaded genre {worker}-{i}": 1 for i in range(200)}
+        genres["indie rock"] = 5
+        return index.scores(gv.GenreVector.coerce(genres))
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(work, range(16)))
+
+    assert len(set(gv._GENRES)) == len(gv._GENRES) == len(gv._VOCAB)
+    assert all(gv.genre_name(gid) == genre for genre, gid in gv._VOCAB.items())
+    expected = index.scores(gv.GenreVector.coerce({**{f"fresh {i}": 1 for i in range(200)}, "indie rock": 5}))
+    assert all(result == pytest.approx(expected) for result in results)
@@ -0,0 +1,28 @@
+import time
+
+from services import prefetch
+
+
+def test_unclaimed_tokens_are_dropped_when_they_expire(monkeypatch):
+    monkeypatch.setattr(prefetch, "_tokens", type(prefetch._tokens)())
+    prefetch.remember_tokens("short-lived", "refresh-a", expires_in=60)
+    prefetch.remember_tokens("long-lived", "refresh-b", expires_in=3600)
+
+    prefetch.due(now=time.time() + 120)
+
+    assert len(prefetch._tokens) == 1
+    assert prefetch.stats()["pending_tokens"] == 1
+
+
+def test_remembered_tokens_are_capped(monkeypatch):
+    monkeypatch.setattr(prefetch, "_tokens", type(prefetch._tokens)())
+    monkeypatch.setattr(prefetch, "PREFETCH_MAX_TOKENS", 3)
+    for i in range(5):
+        prefetch.remember_tokens(f"access-{i}", f"refresh-{i}", expires_in=3600)
+
+    assert len(prefetch._tokens) == 3
+    # The oldest went first; the newest can still be claimed by touch().
+    monkeypatch.setattr(prefetch, "_users", {})
+    prefetch.touch("access-4", "user-4", "medium_term")
+    assert prefetch._users["user-4"].refresh_token == "refresh-4"
+    assert len(prefetch._tokens) == 2
@@ -0,0 +1,72 @@
+import asyncio
+import marshal
+
+from services import similarity_index
+from services.similarity_index import SimilarityIndex
+
+
+def _vector(i: int) -> dict[str, int]:
+    return {f"genre {i % 7}": 3, f"genre {i % 11}": 2, f"genre {i % 13}": 1}
+
+
+def test_rebuild_runs_in_background_and_matches_exact(monkeypatch):
+    monkeypatch.setattr(similarity_index, "REBUILD_THRESHOLD", 50)
+    index = SimilarityIndex(path=None)
+
+    async def fill() -> None:
+        for i in range(120):
+            await index.join(f"user-{i}", None, _vector(i))
+            # A replaced row must supersede its folded copy.
+            await index.join("user-0", None, {"only user-0": 5})
+            await asyncio.sleep(0)
+        while index._rebuilding is not None:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(fill())
+
+    assert len(index) == 120
+    assert index._matrix.shape[0] > 0
+    for i in (0, 3, 42):
+        query = _vector(i)
+        found = [round(score, 5) for _, _, score in index.search(query, k=5)]
+        exact = [round(score, 5) for _, _, score in index.search_exact(query, k=5)]
+        assert found == exact
+    assert index.search({"only user-0": 1}, k=1)[0][0] == index.match_id("user-0")
+
+
+def test_only_joined_users_are_returned_by_match_id(tmp_path):
+    index = SimilarityIndex(path=str(tmp_path / "similarity.sqlite3"))
+
+    async def scenario():
+        a = await index.join("spotify-a", "A", {"jazz": 2, "soul": 1})
+        b = await index.join("spotify-b", "B", {"jazz": 1})
+        assert index.match_id("spotify-c") is None
+        assert {m for m, _, _ in index.search({"jazz": 1}, k=5)} == {a, b}
+
+        await index.leave("spotify-b")
+        await index.leave("spotify-c")  # never joined: nothing written
+        assert index.match_id("spotify-b") is None
+        assert [m for m, _, _ in index.search({"jazz": 1}, k=5)] == [a]
+        return a
+
+    a = asyncio.run(scenario())
+
+    # A fresh worker sees the same members and match ids.
+    other = SimilarityIndex(path=str(tmp_path / "similarity.sqlite3"))
+    assert other.match_id("spotify-a") == a
+    assert other.match_id("spotify-b") is None
+    assert [(m, n) for m, n, _ in other.search({"jazz": 1}, k=5)] == [(a, "A")]
+
+
+def test_sync_does_not_see_uncommitted_writes(tmp_path):
+    index = SimilarityIndex(path=str(tmp_path / "similarity.sqlite3"))
+    index._conn.execute("BEGIN IMMEDIATE")
+    index._conn.execute(
+        "INSERT INTO soulmates (user_id, match_id, display_name, weights, seq) VALUES (?, ?, ?, ?, ?)",
+        ("spotify-x", "match-x", None, marshal.dumps({"jazz": 1.0}), 1),
+    )
+    index._sync()
+    index._conn.execute("ROLLBACK")
+
+    assert index._last_seq == 0
+    assert index.match_id("spotify-x") is None
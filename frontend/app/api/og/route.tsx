@@ -105,6 +105,11 @@ export async function GET(request: NextRequest) {
         )}
       </div>
     ),
-    { width: 1200, height: 630 }
+    {
+      width: 1200,
+      height: 630,
+      // The card is a pure function of its query string, so CDNs can keep it forever.
+      headers: { 'Cache-Control': 'public, max-age=31536000, immutable' },
+    }
   )
 }
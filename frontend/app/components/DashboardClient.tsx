@@ -1,7 +1,7 @@
 'use client'
 
 import { useEffect, useRef, useState } from 'react'
-import type { PipelineData, MLProfile } from '../dashboard/page'
+import type { DashboardData, PipelineData, MLProfile } from '../dashboard/page'
 import GenreRadarChart from './charts/RadarChart'
 import TasteMap from './charts/TasteMap'
 import MusicPassport from './cards/MusicPassport'
@@ -73,12 +73,12 @@ export default function DashboardClient({
     setLoading(true)
     setTimeRange(range)
     try {
-      const [pipelineRes, mlRes] = await Promise.all([
-        fetch(`/api/pipeline?range=${range}`),
-        fetch(`/api/ml-profile?range=${range}`),
-      ])
-      if (pipelineRes.ok) setPipelineData(await pipelineRes.json())
-      if (mlRes.ok) setMlData(await mlRes.json())
+      const res = await fetch(`/api/dashboard?range=${range}`)
+      if (res.ok) {
+        const dashboard: DashboardData = await res.json()
+        setPipelineData(dashboard.pipeline)
+        setMlData(dashboard.ml_profile)
+      }
     } finally {
       setLoading(false)
     }
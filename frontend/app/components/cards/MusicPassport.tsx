@@ -128,6 +128,10 @@ export default function MusicPassport({ mlProfile, username }: Props) {
   const [copied, setCopied] = useState(false)
 
   const handleShare = () => {
+    if (mlProfile.share_id) {
+      copyShareUrl(`${window.location.origin}/share?id=${mlProfile.share_id}`)
+      return
+    }
     const shareData: SharedProfile = {
       archetype: {
         name: mlProfile.archetype.name,
@@ -142,7 +146,10 @@ export default function MusicPassport({ mlProfile, username }: Props) {
     }
     const encoded = btoa(unescape(encodeURIComponent(JSON.stringify(shareData))))
       .replace(/\+/g, '-').replace(/\//g, '_').replace(/=/g, '')
-    const url = `${window.location.origin}/share?d=${encoded}`
+    copyShareUrl(`${window.location.origin}/share?d=${encoded}`)
+  }
+
+  const copyShareUrl = (url: string) => {
     navigator.clipboard.writeText(url).then(() => {
       setCopied(true)
       setTimeout(() => setCopied(false), 2500)
@@ -61,24 +61,17 @@ export type MLProfile = {
   }
   top_genres: { genre: string; count: number; pct: number }[]
   taste_map: { name: string; x: number; y: number; image: string | null; genres: string[] }[]
+  share_id?: string
 }
 
-async function getPipelineData(token: string): Promise<PipelineData | null> {
-  try {
-    const res = await fetch(`${BACKEND_URL}/spotify/data-pipeline`, {
-      headers: { Authorization: `Bearer ${token}` },
-      cache: "no-store",
-    })
-    if (!res.ok) return null
-    return res.json()
-  } catch {
-    return null
-  }
+export type DashboardData = {
+  pipeline: PipelineData
+  ml_profile: MLProfile | null
 }
 
-async function getMLProfile(token: string): Promise<MLProfile | null> {
+async function getDashboardData(token: string): Promise<DashboardData | null> {
   try {
-    const res = await fetch(`${BACKEND_URL}/ml/profile`, {
+    const res = await fetch(`${BACKEND_URL}/dashboard`, {
       headers: { Authorization: `Bearer ${token}` },
       cache: "no-store",
     })
@@ -95,13 +88,10 @@ export default async function DashboardPage() {
 
   if (!accessToken) redirect("/")
 
-  // Fetch both in parallel
-  const [data, mlProfile] = await Promise.all([
-    getPipelineData(accessToken),
-    getMLProfile(accessToken),
-  ])
+  // Pipeline and ML profile come from one backend call (one Spotify fetch)
+  const dashboard = await getDashboardData(accessToken)
 
-  if (!data) redirect("/?error=data_fetch_failed")
+  if (!dashboard) redirect("/?error=data_fetch_failed")
 
-  return <DashboardClient data={data} mlProfile={mlProfile} token={accessToken} />
+  return <DashboardClient data={dashboard.pipeline} mlProfile={dashboard.ml_profile} token={accessToken} />
 }
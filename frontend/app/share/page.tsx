@@ -1,7 +1,27 @@
 import type { Metadata } from 'next'
 import ShareView, { type SharedProfile } from '../components/ShareView'
 
-type Props = { searchParams: Promise<{ d?: string }> }
+type Props = { searchParams: Promise<{ d?: string; id?: string }> }
+
+const BACKEND_URL = process.env.BACKEND_URL!
+
+// Snapshots are content-addressed and immutable, so Next can cache them forever.
+async function fetchSharedProfile(id: string): Promise<SharedProfile | null> {
+  if (!/^[0-9a-f]{20}$/.test(id)) return null
+  try {
+    const res = await fetch(`${BACKEND_URL}/share/${id}`, { cache: 'force-cache' })
+    if (!res.ok) return null
+    return await res.json()
+  } catch {
+    return null
+  }
+}
+
+async function loadProfile({ d, id }: { d?: string; id?: string }): Promise<SharedProfile | null> {
+  if (id) return fetchSharedProfile(id)
+  if (d) return decodeProfile(d)
+  return null
+}
 
 function decodeProfile(encoded: string): SharedProfile | null {
   try {
@@ -14,10 +34,10 @@ function decodeProfile(encoded: string): SharedProfile | null {
 }
 
 export async function generateMetadata({ searchParams }: Props): Promise<Metadata> {
-  const { d } = await searchParams
-  if (!d) return { title: 'Music Taste DNA' }
+  const params = await searchParams
+  if (!params.d && !params.id) return { title: 'Music Taste DNA' }
 
-  const profile = decodeProfile(d)
+  const profile = await loadProfile(params)
   if (!profile) return { title: 'Music Taste DNA' }
 
   const genres = profile.top_genres.slice(0, 4).map((g) => g.genre).join(',')
@@ -42,9 +62,9 @@ export async function generateMetadata({ searchParams }: Props): Promise<Metadat
 }
 
 export default async function SharePage({ searchParams }: Props) {
-  const { d } = await searchParams
+  const params = await searchParams
 
-  if (!d) {
+  if (!params.d && !params.id) {
     return (
       <main className="min-h-screen bg-black text-white flex items-center justify-center">
         <p className="text-gray-500">No profile data found in this link.</p>
@@ -52,7 +72,7 @@ export default async function SharePage({ searchParams }: Props) {
     )
   }
 
-  const profile = decodeProfile(d)
+  const profile = await loadProfile(params)
   if (!profile) {
     return (
       <main className="min-h-screen bg-black text-white flex items-center justify-center">